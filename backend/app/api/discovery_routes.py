@@ -1,116 +1,57 @@
-import json
+import asyncio
 import logging
 
-import websockets
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter
 
-from app.config import config_manager
 from app.config.models import (
     DashboardConfig, ViewConfig, Section, CardItem, HeaderConfig
 )
-from app.settings import settings
+from app.services.views import build_entity_area_map
+from app.ws.gateway import ha_gateway, require_ha
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/discovery")
 
 
-class _HaSession:
-    """WebSocket session with per-connection message ID tracking."""
-
-    def __init__(self, ws):
-        self.ws = ws
-        self._counter = 0
-
-    async def command(self, msg_type: str, **kwargs) -> dict:
-        self._counter += 1
-        msg_id = self._counter
-        payload = {"id": msg_id, "type": msg_type, **kwargs}
-        await self.ws.send(json.dumps(payload))
-
-        while True:
-            raw = await self.ws.recv()
-            resp = json.loads(raw)
-            if resp.get("id") == msg_id:
-                return resp
-
-    async def close(self):
-        await self.ws.close()
-
-
-async def _connect_ha() -> _HaSession:
-    """Connect to HA WebSocket, authenticate, and return a session."""
-    if settings.is_addon:
-        # Addon mode: use Supervisor internal WebSocket endpoint
-        ws_url = "ws://supervisor/core/websocket"
-        token = settings.supervisor_token
-    else:
-        config = config_manager.load_app_config()
-        url = config.connection.hass_url.rstrip("/")
-        token = settings.hass_token
-        ws_url = url.replace("http://", "ws://").replace("https://", "wss://") + "/api/websocket"
-
-    if not token:
-        raise HTTPException(status_code=400, detail="No HA token configured")
-
-    logger.info("Connecting to HA WebSocket at %s (addon=%s, token_len=%d)", ws_url, settings.is_addon, len(token))
-    ws = await websockets.connect(ws_url)
-    auth_msg = json.loads(await ws.recv())
-    if auth_msg.get("type") == "auth_required":
-        await ws.send(json.dumps({"type": "auth", "access_token": token}))
-        result = json.loads(await ws.recv())
-        if result.get("type") != "auth_ok":
-            logger.error("HA auth failed: %s", result)
-            await ws.close()
-            raise HTTPException(status_code=401, detail=f"HA authentication failed: {result.get('message', 'unknown')}")
-    logger.info("HA WebSocket connected and authenticated")
-    return _HaSession(ws)
+async def _ha_result(msg_type: str, optional: bool = False) -> list:
+    """Run one command over the shared HA gateway and return its result."""
+    try:
+        return (await ha_gateway.command(msg_type)).get("result", [])
+    except Exception:
+        if optional:
+            return []
+        raise
 
 
 @router.get("")
 async def discover():
     """Discover all HA entities, areas, devices, floors."""
-    ha = await _connect_ha()
-    try:
-        states = (await ha.command("get_states")).get("result", [])
-        areas = (await ha.command("config/area_registry/list")).get("result", [])
-        devices = (await ha.command("config/device_registry/list")).get("result", [])
-        entity_registry = (await ha.command("config/entity_registry/list")).get("result", [])
-
-        try:
-            floors = (await ha.command("config/floor_registry/list")).get("result", [])
-        except Exception:
-            floors = []
-
-        # Build entity -> area mapping via device registry + entity registry
-        device_area_map = {}
-        for dev in devices:
-            if dev.get("area_id"):
-                device_area_map[dev.get("id")] = dev["area_id"]
-
-        entity_area_map = {}
-        for ent in entity_registry:
-            area = ent.get("area_id")
-            if not area and ent.get("device_id"):
-                area = device_area_map.get(ent["device_id"])
-            if area:
-                entity_area_map[ent.get("entity_id", "")] = area
-
-        return {
-            "states": states,
-            "areas": areas,
-            "devices": devices,
-            "entity_registry": entity_registry,
-            "floors": floors,
-            "entity_area_map": entity_area_map,
-            "summary": {
-                "entity_count": len(states),
-                "area_count": len(areas),
-                "device_count": len(devices),
-                "floor_count": len(floors),
-            },
-        }
-    finally:
-        await ha.close()
+    await require_ha()
+    states, areas, devices, entity_registry, floors = await asyncio.gather(
+        _ha_result("get_states"),
+        _ha_result("config/area_registry/list"),
+        _ha_result("config/device_registry/list"),
+        _ha_result("config/entity_registry/list"),
+        _ha_result("config/floor_registry/list", optional=True),
+    )
+
+    # Build entity -> area mapping via device registry + entity registry
+    entity_area_map = build_entity_area_map(devices, entity_registry)
+
+    return {
+        "states": states,
+        "areas": areas,
+        "devices": devices,
+        "entity_registry": entity_registry,
+        "floors": floors,
+        "entity_area_map": entity_area_map,
+        "summary": {
+            "entity_count": len(states),
+            "area_count": len(areas),
+            "device_count": len(devices),
+            "floor_count": len(floors),
+        },
+    }
 
 
 # Card type mapping by domain
@@ -173,28 +114,16 @@ DOMAIN_ICON_MAP = {
 @router.post("/suggest")
 async def suggest_dashboard():
     """Generate a dashboard config based on discovered entities."""
-    ha = await _connect_ha()
-    try:
-        states = (await ha.command("get_states")).get("result", [])
-        areas = (await ha.command("config/area_registry/list")).get("result", [])
-        devices = (await ha.command("config/device_registry/list")).get("result", [])
-        entity_registry = (await ha.command("config/entity_registry/list")).get("result", [])
-    finally:
-        await ha.close()
+    await require_ha()
+    states, areas, devices, entity_registry = await asyncio.gather(
+        _ha_result("get_states"),
+        _ha_result("config/area_registry/list"),
+        _ha_result("config/device_registry/list"),
+        _ha_result("config/entity_registry/list"),
+    )
 
     # Build entity -> area mapping via device registry
-    device_area_map = {}
-    for dev in devices:
-        if dev.get("area_id"):
-            device_area_map[dev.get("id")] = dev["area_id"]
-
-    entity_area_map = {}
-    for ent in entity_registry:
-        area = ent.get("area_id")
-        if not area and ent.get("device_id"):
-            area = device_area_map.get(ent["device_id"])
-        if area:
-            entity_area_map[ent.get("entity_id", "")] = area
+    entity_area_map = build_entity_area_map(devices, entity_registry)
 
     # Build area name map
     area_name_map = {a["area_id"]: a["name"] for a in areas}
@@ -7,11 +7,14 @@ Data flow
                                                     │
                                                     ▼
                                       ┌─── check TTL cache ───┐
-                                      │   (5 min, keyed on    │
-                                      │    query-param tuple) │
+                                      │   (5 min, LRU keyed   │
+                                      │    on normalized      │
+                                      │    query params;      │
+                                      │    > 4 min: served,   │
+                                      │    refreshed in bg)   │
                                       └───────────┬───────────┘
-                                                  │ miss
-                                                  ▼
+                                                  │ miss (concurrent misses
+                                                  ▼  await one computation)
                                       ┌─ _ensure_ha_connection ─┐
                                       │  via ws/proxy (shared   │
                                       │  HA WebSocket)          │
@@ -19,8 +22,10 @@ Data flow
                                                   │
                       ┌───────────────────────────┼───────────────────────┐
                       ▼                           ▼                       ▼
-               get_states             recorder/statistics_during_period  (per-entity,
-              (HA WS cmd)             for today / 7d trend / YoY 7d)    retry on fail)
+               get_states             recorder/statistics_during_period  (concurrent,
+            (state mirror)            for days after each entity's       chunked)
+                                      high-water mark in the SQLite
+                                      daily store (7d / YoY 7d / 35d)
                       │                           │
                       └────────── discover_kpi_entities + overrides ─────┘
                                                   │
@@ -37,7 +42,8 @@ Error handling
 --------------
 - HA disconnected, no cache         -> 503
 - HA disconnected, cache hit (stale)-> 200 + cache_age_seconds populated
-- Per-entity failure                -> KPI marked available=False, reason=error
+- Background refresh fails          -> previous payload stays cached
+- Failed statistics chunk           -> its KPIs marked available=False, reason=error
 - No auto-discoverable entity       -> KPI marked available=False, reason=no_entity_found
 - Entity found but empty stats      -> KPI marked available=False, reason=no_data
 
@@ -46,19 +52,25 @@ see the Pydantic models below.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 import time
-from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import partial
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, ConfigDict, Field
 
+from app.services.daily_stats import DailyStatsStore
 from app.services.insights import (
     compute_kpi_aggregates,
     detect_anomalies,
     discover_kpi_entities,
     filter_monitored_entities,
 )
+from app.settings import settings
 from app.ws import proxy as ws_proxy
 
 logger = logging.getLogger(__name__)
@@ -111,8 +123,20 @@ class InsightsResponse(BaseModel):
 
 # ---------- TTL cache ----------
 
+# Older entries are still served, but refreshed in the background; past the
+# TTL callers wait for the refresh (while HA is up).
+_CACHE_SOFT_TTL_SECONDS = 240
 _CACHE_TTL_SECONDS = 300  # 5 minutes
-_cache: dict[tuple, tuple[float, InsightsResponse]] = {}
+# Least recently used first. Expired entries stay as the HA-down fallback
+# until the entry/byte budget in settings pushes them out.
+_cache: OrderedDict[tuple, tuple[float, InsightsResponse]] = OrderedDict()
+# Serialized size of each entry, for the byte budget
+_cache_sizes: dict[tuple, int] = {}
+# One computation per key at a time; concurrent misses await the same task
+_inflight: dict[tuple, asyncio.Task] = {}
+_cache_stats = {
+    "hits": 0, "misses": 0, "stale": 0, "dedupe": 0, "refreshes": 0, "errors": 0, "evictions": 0,
+}
 
 
 def _cache_key(
@@ -123,6 +147,11 @@ def _cache_key(
     return (energy_entity or "", occupancy_entity or "", uptime_entities)
 
 
+def _uptime_list(uptime_entities: str | None) -> tuple[str, ...]:
+    """Sorted, de-duplicated ids, so any spelling of a list shares an entry."""
+    return tuple(sorted({e.strip() for e in (uptime_entities or "").split(",") if e.strip()}))
+
+
 def _cache_get(key: tuple) -> tuple[float, InsightsResponse] | None:
     """Return ``(age_seconds, payload)`` if the entry is still fresh."""
     entry = _cache.get(key)
@@ -132,6 +161,7 @@ def _cache_get(key: tuple) -> tuple[float, InsightsResponse] | None:
     age = time.monotonic() - stored_at
     if age > _CACHE_TTL_SECONDS:
         return None
+    _cache.move_to_end(key)
     return age, payload
 
 
@@ -144,16 +174,78 @@ def _cache_get_any_age(key: tuple) -> tuple[float, InsightsResponse] | None:
     if entry is None:
         return None
     stored_at, payload = entry
+    _cache.move_to_end(key)
     return time.monotonic() - stored_at, payload
 
 
 def _cache_put(key: tuple, payload: InsightsResponse) -> None:
     _cache[key] = (time.monotonic(), payload)
+    _cache.move_to_end(key)
+    _cache_sizes[key] = len(payload.model_dump_json())
+    _cache_evict()
+
+
+def _cache_evict() -> None:
+    """Drop least recently used entries until the budget holds.
+
+    The newest entry always stays, even if it alone exceeds the byte budget.
+    """
+    max_entries = settings.insights_cache_max_entries
+    max_bytes = settings.insights_cache_max_bytes
+    total = sum(_cache_sizes.values())
+    while len(_cache) > 1 and (
+        (max_entries and len(_cache) > max_entries) or (max_bytes and total > max_bytes)
+    ):
+        key, _entry = _cache.popitem(last=False)
+        total -= _cache_sizes.pop(key, 0)
+        _cache_stats["evictions"] += 1
 
 
 def clear_cache() -> None:
     """Used by tests to reset state between runs."""
     _cache.clear()
+    _cache_sizes.clear()
+    _inflight.clear()
+    for name in _cache_stats:
+        _cache_stats[name] = 0
+
+
+class _HAUnavailable(Exception):
+    """Raised by a computation that found HA down; callers serve stale data."""
+
+
+def _serve_stale(key: tuple) -> InsightsResponse:
+    """The cached payload regardless of age, for a caller while HA is down.
+
+    Counted as ``stale`` here, once per response actually served.
+    """
+    stale = _cache_get_any_age(key)
+    if stale is None:
+        raise HTTPException(
+            status_code=503,
+            detail="HA unavailable and no cached data",
+        )
+    _cache_stats["stale"] += 1
+    age, payload = stale
+    return payload.model_copy(update={"cache_age_seconds": int(age)})
+
+
+def _start_compute(key: tuple, *args) -> asyncio.Task:
+    task = asyncio.create_task(_compute_insights(key, *args))
+    _inflight[key] = task
+    task.add_done_callback(lambda t: _compute_done(key, t))
+    return task
+
+
+def _compute_done(key: tuple, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None and not isinstance(exc, (HTTPException, _HAUnavailable)):
+        _cache_stats["errors"] += 1
+        logger.warning("insights computation failed: %s", exc)
 
 
 # ---------- Statistics fetch helpers ----------
@@ -162,23 +254,29 @@ def clear_cache() -> None:
 # "day" granularity since KPIs roll up daily.
 _PERIOD = "day"
 
+# Long statistic_ids lists (the anomaly window covers every monitored entity)
+# are split into chunks that run side by side over the shared gateway. The
+# cap applies to the whole request, across all windows.
+_STATS_CHUNK_SIZE = 50
+_STATS_MAX_PARALLEL = 4
 
-async def _fetch_statistics(
+# Daily aggregates survive restarts; refreshes only fetch days HA may still
+# be filling in (see app.services.daily_stats)
+_daily_store = DailyStatsStore(lambda: settings.data_dir / "insights_daily.sqlite3")
+# HA's time zone; days, "today" and the fetch windows are in it
+_ha_tz: tzinfo | None = None
+
+
+async def _fetch_statistics_chunk(
     entity_ids: list[str],
     start: datetime,
     end: datetime,
 ) -> tuple[dict[str, list[dict]], bool]:
-    """Call ``recorder/statistics_during_period`` and return per-entity rows.
+    """One ``recorder/statistics_during_period`` call.
 
-    Returns
-    -------
-    ``(rows_by_entity, errored)`` — ``errored=True`` iff the HA call itself
-    raised or returned ``success=false``. Individual entities with empty
-    rows are *not* errors (they're just ``no_data``); they come back as
-    ``[]`` in the dict.
+    Returns ``(rows_by_entity, errored)`` — ``errored=True`` iff the HA call
+    itself raised or returned ``success=false``.
     """
-    if not entity_ids:
-        return {}, False
     try:
         resp = await ws_proxy._ha_send(
             "recorder/statistics_during_period",
@@ -188,11 +286,17 @@ async def _fetch_statistics(
             period=_PERIOD,
         )
     except Exception as exc:
-        logger.warning("statistics fetch failed: %s", exc)
+        logger.warning(
+            "statistics fetch failed for %d ids (%s, ...): %s",
+            len(entity_ids), entity_ids[0], exc,
+        )
         return {eid: [] for eid in entity_ids}, True
 
     if not resp.get("success", True):
-        logger.warning("HA statistics error: %s", resp.get("error"))
+        logger.warning(
+            "HA statistics error for %d ids (%s, ...): %s",
+            len(entity_ids), entity_ids[0], resp.get("error"),
+        )
         return {eid: [] for eid in entity_ids}, True
 
     result = resp.get("result") or {}
@@ -200,14 +304,81 @@ async def _fetch_statistics(
     return {eid: result.get(eid, []) for eid in entity_ids}, False
 
 
+async def _fetch_statistics(
+    entity_ids: list[str],
+    start: datetime,
+    end: datetime,
+    slots: asyncio.Semaphore | None = None,
+) -> tuple[dict[str, list[dict]], set[str]]:
+    """Fetch per-entity rows for ``[start, end)`` in parallel chunks.
+
+    Parameters
+    ----------
+    slots
+        Semaphore bounding concurrent HA calls; pass the same one to every
+        window of a request so the cap holds across them.
+
+    Returns
+    -------
+    ``(rows_by_entity, failed)`` — ``failed`` holds the ids of every chunk
+    whose HA call raised or returned ``success=false``; the other chunks'
+    rows are still returned. Individual entities with empty rows are *not*
+    errors (they're just ``no_data``); they come back as ``[]`` in the dict.
+    """
+    if not entity_ids:
+        return {}, set()
+    if slots is None:
+        slots = asyncio.Semaphore(_STATS_MAX_PARALLEL)
+    ids = list(dict.fromkeys(entity_ids))
+    chunks = [ids[i:i + _STATS_CHUNK_SIZE] for i in range(0, len(ids), _STATS_CHUNK_SIZE)]
+
+    async def run(chunk: list[str]) -> tuple[dict[str, list[dict]], bool]:
+        async with slots:
+            return await _fetch_statistics_chunk(chunk, start, end)
+
+    rows: dict[str, list[dict]] = {}
+    failed: set[str] = set()
+    for chunk, (chunk_rows, errored) in zip(
+        chunks, await asyncio.gather(*(run(c) for c in chunks))
+    ):
+        rows.update(chunk_rows)
+        if errored:
+            failed.update(chunk)
+    return rows, failed
+
+
+async def _ha_time_zone() -> tzinfo:
+    """HA's configured time zone, whose local midnights day buckets start at.
+
+    Cached once known; UTC while HA does not report a usable one.
+    """
+    global _ha_tz
+    if _ha_tz is not None:
+        return _ha_tz
+    try:
+        resp = await ws_proxy._ha_send("get_config")
+        name = (resp.get("result") or {}).get("time_zone")
+    except Exception as exc:
+        logger.warning("get_config failed: %s", exc)
+        return timezone.utc
+    if not name:
+        return timezone.utc
+    try:
+        _ha_tz = ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning("Unknown HA time zone %r, using UTC", name)
+        _ha_tz = timezone.utc
+    return _ha_tz
+
+
 async def _fetch_states() -> list[dict]:
-    """Return all HA states, or empty list on failure."""
+    """Return all HA states (served from the proxy's state mirror when
+    live), or empty list on failure."""
     try:
-        resp = await ws_proxy._ha_send("get_states")
+        return await ws_proxy._get_states()
     except Exception as exc:
         logger.warning("get_states failed: %s", exc)
         return []
-    return resp.get("result") or []
 
 
 # ---------- Endpoint ----------
@@ -226,31 +397,66 @@ async def get_insights(
 
     See the module-level docstring for the full data flow.
     """
-    uptime_list: tuple[str, ...] = tuple(
-        e.strip() for e in (uptime_entities or "").split(",") if e.strip()
-    )
+    energy_entity = (energy_entity or "").strip() or None
+    occupancy_entity = (occupancy_entity or "").strip() or None
+    uptime_list = _uptime_list(uptime_entities)
     key = _cache_key(energy_entity, occupancy_entity, uptime_list)
+    args = (energy_entity, occupancy_entity, uptime_list)
 
-    # Fresh cache hit — short-circuit.
+    # Cache hit within the TTL — short-circuit, refreshing past the soft TTL.
     fresh = _cache_get(key)
     if fresh is not None:
         age, payload = fresh
+        if age <= _CACHE_SOFT_TTL_SECONDS:
+            _cache_stats["hits"] += 1
+        else:
+            _cache_stats["stale"] += 1
+            if key not in _inflight:
+                _cache_stats["refreshes"] += 1
+                _start_compute(key, *args)
         # Return a copy with the age stamped in at serve time.
         return payload.model_copy(update={"cache_age_seconds": int(age)})
 
-    # Try to ensure an HA connection. If that fails, fall back to stale cache.
+    task = _inflight.get(key)
+    if task is None:
+        _cache_stats["misses"] += 1
+        task = _start_compute(key, *args)
+    else:
+        _cache_stats["dedupe"] += 1
+    # Shielded: one client going away must not cancel the others' result
+    try:
+        return await asyncio.shield(task)
+    except _HAUnavailable:
+        return _serve_stale(key)
+
+
+@router.get("/insights/stats")
+async def get_insights_cache_stats() -> dict:
+    """Counters of the insights response cache."""
+    return {
+        **_cache_stats,
+        "entries": len(_cache),
+        "bytes": sum(_cache_sizes.values()),
+        "max_entries": settings.insights_cache_max_entries,
+        "max_bytes": settings.insights_cache_max_bytes,
+        "inflight": len(_inflight),
+    }
+
+
+async def _compute_insights(
+    key: tuple,
+    energy_entity: str | None,
+    occupancy_entity: str | None,
+    uptime_list: tuple[str, ...],
+) -> InsightsResponse:
+    """Run the fetch pipeline for ``key`` and cache the result."""
+    # Try to ensure an HA connection. If that fails, callers fall back to
+    # the stale cache; a background refresh just leaves the entry as it is.
     try:
         await ws_proxy._ensure_ha_connection()
     except Exception as exc:
         logger.warning("HA connection unavailable: %s", exc)
-        stale = _cache_get_any_age(key)
-        if stale is None:
-            raise HTTPException(
-                status_code=503,
-                detail="HA unavailable and no cached data",
-            )
-        age, payload = stale
-        return payload.model_copy(update={"cache_age_seconds": int(age)})
+        raise _HAUnavailable from exc
 
     overrides = {
         "energy": energy_entity,
@@ -259,19 +465,12 @@ async def get_insights(
     }
 
     states = await _fetch_states()
-    if not states and ws_proxy._ha_connection is None:
-        stale = _cache_get_any_age(key)
-        if stale is None:
-            raise HTTPException(
-                status_code=503,
-                detail="HA unavailable and no cached data",
-            )
-        age, payload = stale
-        return payload.model_copy(update={"cache_age_seconds": int(age)})
+    if not states and not ws_proxy.ha_gateway.connected:
+        raise _HAUnavailable
 
     entity_map = discover_kpi_entities(states, overrides)
 
-    now = datetime.now(timezone.utc)
+    now = datetime.now(await _ha_time_zone())
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     trend_start = today_start - timedelta(days=6)
     try:
@@ -294,16 +493,29 @@ async def get_insights(
         if e
     ]
 
-    if stat_ids:
-        stats_trend, trend_errored = await _fetch_statistics(stat_ids, trend_start, now)
-        stats_today, today_errored = await _fetch_statistics(stat_ids, today_start, now)
-    else:
-        stats_trend, trend_errored = {}, False
-        stats_today, today_errored = {}, False
-    if stat_ids and yoy_window_valid:
-        stats_yoy, _yoy_errored = await _fetch_statistics(stat_ids, yoy_start, yoy_end)
-    else:
-        stats_yoy = {}
+    monitored = filter_monitored_entities(states)
+    monitored_ids = [s["entity_id"] for s in monitored]
+    # Anomaly detection needs ~5 weeks of history so we have several
+    # same-weekday samples.
+    anomaly_start = today_start - timedelta(days=35)
+
+    # Bring the daily store up to date: only days after each entity's
+    # high-water mark are fetched, the windows concurrently under one cap.
+    fetch = partial(_fetch_statistics, slots=asyncio.Semaphore(_STATS_MAX_PARALLEL))
+    recent_starts = {
+        **dict.fromkeys(stat_ids, trend_start),
+        **dict.fromkeys(monitored_ids, anomaly_start),
+    }
+    yoy_starts = dict.fromkeys(stat_ids, yoy_start) if yoy_window_valid else {}
+    recent_failed, _yoy_failed = await asyncio.gather(
+        _daily_store.sync("recent", recent_starts, now, fetch),
+        _daily_store.sync("yoy", yoy_starts, yoy_end, fetch),
+    )
+
+    stats_today = await _daily_store.rows(stat_ids, today_start, now)
+    stats_trend = await _daily_store.rows(stat_ids, trend_start, now)
+    stats_yoy = await _daily_store.rows(stat_ids, yoy_start, yoy_end) if yoy_window_valid else {}
+    anomaly_stats = await _daily_store.rows(monitored_ids, anomaly_start, now)
 
     kpi_payload = compute_kpi_aggregates(
         entity_map,
@@ -313,26 +525,13 @@ async def get_insights(
         now=now,
     )
 
-    # If the HA call itself errored out, differentiate "error" from "no_data":
-    # KPIs with an entity_id should be marked reason="error" instead of no_data.
-    if today_errored or trend_errored:
-        for kpi in kpi_payload.values():
-            if kpi.get("entity_id") and not kpi.get("available"):
-                kpi["reason"] = "error"
+    # If the HA call for an entity's chunk errored out, differentiate "error"
+    # from "no_data": such KPIs are marked reason="error" instead of no_data.
+    for kpi in kpi_payload.values():
+        if kpi.get("entity_id") in recent_failed and not kpi.get("available"):
+            kpi["reason"] = "error"
 
     # ----- Anomalies -----
-    monitored = filter_monitored_entities(states)
-    # Anomaly detection needs ~5 weeks of history so we have several
-    # same-weekday samples.
-    anomaly_start = today_start - timedelta(days=35)
-    if monitored:
-        anomaly_stats, _anomaly_errored = await _fetch_statistics(
-            [s["entity_id"] for s in monitored],
-            anomaly_start,
-            now,
-        )
-    else:
-        anomaly_stats = {}
     anomalies = detect_anomalies(monitored, anomaly_stats, now=now)
 
     # Update anomaly_count KPI and anomaly_flag on any KPI whose entity appears
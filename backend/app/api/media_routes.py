@@ -6,6 +6,7 @@ from fastapi.responses import Response
 
 from app.config import config_manager
 from app.settings import settings
+from app.ws.gateway import ha_gateway, require_ha
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/media")
@@ -80,52 +81,28 @@ async def browse_media(
     media_content_type: str = Query("", description="Media content type"),
 ):
     """Browse media for a media_player entity via HA WebSocket API."""
-    base_url, token = _get_ha_auth()
-    if not token:
-        raise HTTPException(status_code=400, detail="No HA token configured")
-
-    import asyncio
-    import websockets
-    import json
+    await require_ha()
 
-    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://") + "/api/websocket"
+    browse_args = {"entity_id": entity_id}
+    if media_content_type:
+        browse_args["media_content_id"] = media_content_id
+        browse_args["media_content_type"] = media_content_type
+    elif media_content_id:
+        browse_args["media_content_id"] = media_content_id
 
     try:
-        async with websockets.connect(ws_url) as ws:
-            # Wait for auth_required
-            msg = json.loads(await asyncio.wait_for(ws.recv(), timeout=5))
-
-            # Authenticate
-            await ws.send(json.dumps({"type": "auth", "access_token": token}))
-            msg = json.loads(await asyncio.wait_for(ws.recv(), timeout=5))
-            if msg.get("type") != "auth_ok":
-                raise HTTPException(status_code=401, detail="HA auth failed")
-
-            # Browse media
-            browse_msg = {
-                "id": 1,
-                "type": "media_player/browse_media",
-                "entity_id": entity_id,
-            }
-            if media_content_type:
-                browse_msg["media_content_id"] = media_content_id
-                browse_msg["media_content_type"] = media_content_type
-            elif media_content_id:
-                browse_msg["media_content_id"] = media_content_id
-
-            await ws.send(json.dumps(browse_msg))
-            result = json.loads(await asyncio.wait_for(ws.recv(), timeout=10))
-
-            if not result.get("success"):
-                error = result.get("error", {})
-                raise HTTPException(status_code=400, detail=error.get("message", "Browse failed"))
-
-            return result.get("result", {})
-    except HTTPException:
-        raise
+        result = await ha_gateway.command(
+            "media_player/browse_media", timeout=10.0, **browse_args
+        )
     except Exception as e:
-        logger.error(f"Media browse error: {e}")
-        raise HTTPException(status_code=502, detail=str(e))
+        logger.error(f"Media browse error: {e!r}")
+        raise HTTPException(status_code=502, detail=str(e) or "Browse timed out")
+
+    if not result.get("success"):
+        error = result.get("error", {})
+        raise HTTPException(status_code=400, detail=error.get("message", "Browse failed"))
+
+    return result.get("result", {})
 
 
 @geo_router.get("/reverse")
@@ -1,13 +1,11 @@
 """Register DAS Home as default panel in Home Assistant."""
-import json
 import logging
 import os
 
-import websockets
 from fastapi import APIRouter, HTTPException
 
-from app.config import config_manager
 from app.settings import settings
+from app.ws.gateway import ha_gateway, require_ha
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/panel")
@@ -15,38 +13,8 @@ router = APIRouter(prefix="/api/panel")
 
 async def _ha_ws_command(msg_type: str, **kwargs) -> dict:
     """Send a single WebSocket command to HA and return the response."""
-    if settings.is_addon:
-        ws_url = "ws://supervisor/core/websocket"
-        token = settings.supervisor_token
-    else:
-        config = config_manager.load_app_config()
-        url = config.connection.hass_url.rstrip("/")
-        token = settings.hass_token
-        ws_url = url.replace("http://", "ws://").replace("https://", "wss://") + "/api/websocket"
-
-    if not token:
-        raise HTTPException(status_code=400, detail="No HA token configured")
-
-    ws = await websockets.connect(ws_url)
-    try:
-        auth_msg = json.loads(await ws.recv())
-        if auth_msg.get("type") == "auth_required":
-            await ws.send(json.dumps({"type": "auth", "access_token": token}))
-            result = json.loads(await ws.recv())
-            if result.get("type") != "auth_ok":
-                raise HTTPException(status_code=401, detail="HA auth failed")
-
-        msg_id = 1
-        payload = {"id": msg_id, "type": msg_type, **kwargs}
-        await ws.send(json.dumps(payload))
-
-        while True:
-            raw = await ws.recv()
-            resp = json.loads(raw)
-            if resp.get("id") == msg_id:
-                return resp
-    finally:
-        await ws.close()
+    await require_ha()
+    return await ha_gateway.command(msg_type, **kwargs)
 
 
 @router.get("/info")
@@ -0,0 +1,89 @@
+"""/api/views/{view_id}/bootstrap — everything one view needs for first paint.
+
+Instead of loading the dashboard and then a full ``get_states`` over ``/ws``,
+a kiosk can fetch the view config and only the states its cards reference
+(area cards expanded through the entity area map) in one response. The
+``epoch`` and ``seq`` let the client follow up on ``/ws`` with ``resume``
+and receive just the changes since, rather than another snapshot. They are
+``null`` unless the states are live: stale or missing states predate the
+event stream, so the client must fetch a full ``get_states`` instead.
+
+The route waits at most ``_CONNECT_WAIT_SECONDS`` for HA: it serves the
+state mirror when it is live and otherwise starts connecting, which on a
+cold start usually seeds the mirror within that bound. If HA is down the
+attempt carries on in the background and the view config is still returned, with ``ha_connected: false`` and the last-known
+states from the on-disk snapshot and area map flagged ``stale``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from fastapi import APIRouter, HTTPException
+
+from app.config import config_manager
+from app.services.views import collect_view_entities
+from app.ws import proxy as ws_proxy
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/views")
+
+# How long first paint may wait for the HA connection and mirror seed
+_CONNECT_WAIT_SECONDS = 2.0
+
+
+@router.get("/{view_id}/bootstrap")
+async def bootstrap_view(view_id: str):
+    dashboard = config_manager.load_dashboard()
+    view = next((v for v in dashboard.views if v.id == view_id), None)
+    if view is None:
+        raise HTTPException(status_code=404, detail=f"Unknown view: {view_id}")
+
+    if not ws_proxy._state_mirror.ready:
+        # Bounded: the connect keeps going (and the supervisor retries) without us
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(ws_proxy._start_connecting()), _CONNECT_WAIT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.info("HA not connected yet; serving the view without live states")
+
+    connected = ws_proxy.ha_gateway.connected
+    area_map: dict[str, str] = {}
+    if connected:
+        try:
+            area_map = await ws_proxy._get_entity_area_map()
+        except Exception as exc:
+            # Area cards stay empty; entity cards still work
+            logger.warning("Entity area map unavailable: %s", exc)
+    wanted = collect_view_entities(view, area_map)
+
+    # Read seq before the states so a resume never skips an event
+    seq = ws_proxy._replay.seq
+    states: list[dict] = []
+    snapshot_age = None
+    live = False
+    if connected:
+        try:
+            states = [s for s in await ws_proxy._get_states() if s.get("entity_id") in wanted]
+            live = True
+        except Exception as exc:
+            logger.warning("get_states failed: %s", exc)
+    else:
+        snapshot = await ws_proxy._snapshots.stale_states()
+        if snapshot is not None:
+            snapshot_age, all_states = snapshot
+            area_map = ws_proxy._snapshots.entity_area_map
+            wanted = collect_view_entities(view, area_map)
+            states = [s for s in all_states if s.get("entity_id") in wanted]
+
+    return {
+        "view": view.model_dump(),
+        "states": ws_proxy.ws_manager.projector().states(states),
+        "entity_area_map": {eid: area for eid, area in area_map.items() if eid in wanted},
+        "ha_connected": connected,
+        "stale": snapshot_age is not None,
+        "snapshot_age": round(snapshot_age) if snapshot_age is not None else None,
+        "epoch": ws_proxy._replay.epoch if live else None,
+        "seq": seq if live else None,
+    }
@@ -0,0 +1,111 @@
+"""JSON encoding for the WebSocket proxy, the IPC link and API responses.
+
+Every HA frame is decoded and every client broadcast encoded on the event
+loop, so under event storms (an HA restart marks everything unavailable)
+JSON dominates CPU. This module picks the fastest available backend once at
+import: orjson when installed, the stdlib otherwise. ``DAS_HOME_JSON_CODEC``
+(``auto``, ``orjson`` or ``json``) forces one, e.g. to compare them.
+
+Both backends produce the same compact output: no whitespace, non-ASCII
+characters as UTF-8, non-string dict keys converted to strings, and
+``NaN``/``Infinity`` (not valid JSON) as ``null``.
+``scripts/bench_json_codec.py`` measures them on real event shapes.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+from typing import Any
+
+from starlette.responses import JSONResponse as _StarletteJSONResponse
+
+from app.settings import settings
+
+try:
+    import orjson
+except ImportError:  # optional: roughly 5-10x faster than the stdlib
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def _finite(obj: Any) -> Any:
+    """``obj`` with non-finite floats replaced by None, as orjson writes them."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
+
+
+class StdlibCodec:
+    name = "json"
+
+    @staticmethod
+    def dumps(obj: Any, *, sort_keys: bool = False) -> str:
+        try:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":"),
+                              sort_keys=sort_keys, allow_nan=False)
+        except ValueError:
+            # Rare (a sensor reporting NaN): pay for the copy only then
+            return json.dumps(_finite(obj), ensure_ascii=False, separators=(",", ":"),
+                              sort_keys=sort_keys, allow_nan=False)
+
+    @staticmethod
+    def dumps_bytes(obj: Any, *, sort_keys: bool = False) -> bytes:
+        return StdlibCodec.dumps(obj, sort_keys=sort_keys).encode()
+
+    loads = staticmethod(json.loads)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    @staticmethod
+    def dumps(obj: Any, *, sort_keys: bool = False) -> str:
+        return OrjsonCodec.dumps_bytes(obj, sort_keys=sort_keys).decode()
+
+    @staticmethod
+    def dumps_bytes(obj: Any, *, sort_keys: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option)
+
+    @staticmethod
+    def loads(data: str | bytes) -> Any:
+        return orjson.loads(data)
+
+
+def available() -> dict[str, type]:
+    """Codecs usable in this environment, by name."""
+    codecs: dict[str, type] = {"json": StdlibCodec}
+    if orjson is not None:
+        codecs["orjson"] = OrjsonCodec
+    return codecs
+
+
+def _select(name: str) -> type:
+    codecs = available()
+    if name == "auto":
+        return codecs.get("orjson", StdlibCodec)
+    if name not in codecs:
+        logger.warning(f"JSON codec {name!r} is not available, using the stdlib")
+        return StdlibCodec
+    return codecs[name]
+
+
+codec = _select(settings.json_codec)
+dumps = codec.dumps
+dumps_bytes = codec.dumps_bytes
+loads = codec.loads
+
+
+class JSONResponse(_StarletteJSONResponse):
+    """FastAPI response class rendering through the active codec."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel, Field, field_validator
 
 
@@ -20,6 +22,77 @@ class HacsCardEntry(BaseModel):
     version: str = ""
 
 
+class CoalesceRule(BaseModel):
+    """Coalescing window for entities matching ``entity_id``, ``device_class``
+    or ``domain``. The most specific match wins; ``domain`` can narrow a
+    ``device_class`` rule."""
+    domain: str = ""
+    device_class: str = ""
+    entity_id: str = ""
+    window_ms: int = Field(default=250, ge=0, le=10_000)
+
+
+class AttributeProjection(BaseModel):
+    """Attributes sent to clients for entities matching ``entity_id`` or
+    ``domain``. ``include`` keeps only the listed attributes; ``exclude``
+    drops the listed ones. With neither, attributes pass unchanged."""
+    domain: str = ""
+    entity_id: str = ""
+    include: list[str] | None = None
+    exclude: list[str] = Field(default_factory=list)
+
+
+class ProxyConfig(BaseModel):
+    """Tuning for the browser-facing WebSocket proxy."""
+    # Outbound events buffered per client before the slow-consumer policy kicks in
+    send_queue_size: int = Field(default=256, ge=1)
+    # What to do when a client's queue is full:
+    #   drop_oldest — discard the oldest queued event
+    #   coalesce    — keep only the latest queued event per entity
+    #   disconnect  — close the client, it will reconnect and resync
+    slow_consumer_policy: Literal["drop_oldest", "coalesce", "disconnect"] = "drop_oldest"
+    # Time windows within which only the latest state per entity is sent,
+    # e.g. [{"device_class": "power", "window_ms": 250}]
+    coalesce_rules: list[CoalesceRule] = Field(default_factory=list)
+    # Commands (call_service, get_states, ...) one client may have running at once
+    max_inflight_commands: int = Field(default=8, ge=1)
+    # Recent state events kept for clients resuming after a short disconnect
+    replay_buffer_size: int = Field(default=1024, ge=1)
+    # Commands outstanding on the shared HA connection, across all callers
+    upstream_max_inflight: int = Field(default=32, ge=1)
+    # Default timeout for one HA command, in seconds
+    upstream_command_timeout: float = Field(default=30.0, gt=0)
+    # Attributes trimmed from states sent to clients, e.g.
+    # [{"domain": "media_player", "exclude": ["source_list", "sound_mode_list"]}]
+    attribute_projection: list[AttributeProjection] = Field(default_factory=list)
+    # Seconds between server heartbeats to each client (0 disables them)
+    heartbeat_interval: float = Field(default=15.0, ge=0)
+    # Clients that answered a heartbeat before but not within this many
+    # seconds are considered dead and disconnected
+    heartbeat_timeout: float = Field(default=45.0, gt=0)
+    # Seconds between writes of the last-known-state snapshot (0 disables)
+    snapshot_interval: float = Field(default=60.0, ge=0)
+    # HA calls one bulk action (call_services) runs at once
+    bulk_max_parallel: int = Field(default=8, ge=1)
+    # Services whose calls carry an absolute value (slider positions). While
+    # one is queued, a newer call with the same service and target replaces
+    # it, so only the latest value is sent. A message can override this with
+    # "coalesce": true/false.
+    coalesce_services: list[str] = Field(default_factory=lambda: [
+        "light.turn_on",
+        "cover.set_cover_position",
+        "cover.set_cover_tilt_position",
+        "climate.set_temperature",
+        "fan.set_percentage",
+        "media_player.volume_set",
+        "number.set_value",
+        "input_number.set_value",
+        "valve.set_valve_position",
+        "humidifier.set_humidity",
+        "water_heater.set_temperature",
+    ])
+
+
 class AppConfiguration(BaseModel):
     version: int = 1
     connection: ConnectionConfig = Field(default_factory=ConnectionConfig)
@@ -27,6 +100,7 @@ class AppConfiguration(BaseModel):
     custom_js_enabled: bool = False
     hacs_cards: list[HacsCardEntry] = Field(default_factory=list)
     sidebar: SidebarConfig = Field(default_factory=SidebarConfig)
+    proxy: ProxyConfig = Field(default_factory=ProxyConfig)
 
 
 class CardItem(BaseModel):
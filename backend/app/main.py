@@ -7,6 +7,7 @@ from pathlib import Path
 
 import yaml
 
+from app.codec import JSONResponse
 from app.settings import settings
 
 def _read_version_from_config() -> str:
@@ -28,7 +29,7 @@ def _read_version_from_config() -> str:
 __version__ = _read_version_from_config()
 RELEASES_URL = "https://github.com/conuti-das/das-home/releases"
 
-app = FastAPI(title="das-home", version=__version__)
+app = FastAPI(title="das-home", version=__version__, default_response_class=JSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +45,7 @@ from app.api.media_routes import router as media_router, geo_router
 from app.api.calendar_routes import router as calendar_router
 from app.api.panel_routes import router as panel_router
 from app.api.insights_routes import router as insights_router
+from app.api.view_routes import router as view_router
 from app.ws.proxy import router as ws_router
 
 # API routes
@@ -64,6 +66,7 @@ app.include_router(geo_router)
 app.include_router(calendar_router)
 app.include_router(panel_router)
 app.include_router(insights_router)
+app.include_router(view_router)
 app.include_router(ws_router)
 
 # Serve frontend static files (added after frontend build)
@@ -0,0 +1,38 @@
+"""Start das-home under uvicorn with the tuned WebSocket transport.
+
+``uvicorn --ws`` only accepts the names of its built-in implementations, so
+:class:`app.ws.transport.DeflateWebSocketProtocol` can't be selected on the
+uvicorn command line. The Docker image and the add-on run::
+
+    python -m app.serve --host 0.0.0.0 --port 5050 [--workers N]
+
+which hands the protocol class to ``uvicorn.run`` instead.
+"""
+from __future__ import annotations
+
+import argparse
+
+import uvicorn
+
+from app.settings import settings
+from app.ws.transport import DeflateWebSocketProtocol
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="uvicorn worker processes (see DAS_HOME_IPC_SOCKET)")
+    args = parser.parse_args(argv)
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        ws=DeflateWebSocketProtocol,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Incremental on-disk store of per-entity daily statistics for insights.
+
+``/api/insights`` needs the last 7 days of its KPI entities, the same 7 days
+a year ago and 35 days of every monitored entity. Almost all of that is
+settled history. This store keeps the per-day aggregates of
+:func:`app.services.insights._daily_totals` in a SQLite file in
+``settings.data_dir`` and remembers, per entity and series, the last day
+whose bucket was complete when it was fetched (the high-water mark). A
+refresh only asks HA for the days after that mark.
+
+HA's day buckets start at local midnight, so days are keyed by the date in
+the time zone of the window passed to :meth:`DailyStatsStore.sync` (HA's).
+A day counts as complete once HA has compiled the hour after its midnight,
+so a steady-state refresh fetches today's bucket instead of five weeks.
+
+Each day also stores its last cumulative ``sum``, so ``sum`` statistics
+fetched incrementally diff against the previous fetch instead of restarting
+from the running total.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import threading
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from app.services.insights import _daily_totals
+
+logger = logging.getLogger(__name__)
+
+# (entity_ids, start, end) -> (rows_by_entity, failed_ids)
+FetchStatistics = Callable[
+    [list[str], datetime, datetime],
+    Awaitable[tuple[dict[str, list[dict]], set[str]]],
+]
+
+# HA compiles long-term statistics shortly after each hour; until then the
+# bucket of the day that just ended may still grow
+_COMPILE_LAG = timedelta(hours=1)
+# A little over a year, so year-over-year windows can be served locally
+_RETENTION_DAYS = 400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily (
+    entity_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    value REAL NOT NULL,
+    last_sum REAL,
+    PRIMARY KEY (entity_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS marks (
+    series TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    first_day TEXT NOT NULL,
+    complete_day TEXT NOT NULL,
+    PRIMARY KEY (series, entity_id)
+) WITHOUT ROWID;
+"""
+
+
+class DailyStatsStore:
+    """Per-entity daily aggregates in the SQLite file at ``path()``."""
+
+    def __init__(self, path: Callable[[], Path]):
+        self._path = path
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self.fetched_days = 0
+        self.skipped = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            path = self._path()
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(path, check_same_thread=False)
+                db.executescript(_SCHEMA)
+            except (OSError, sqlite3.Error) as e:
+                # Still incremental for the life of the process
+                logger.warning("Daily statistics store unavailable, using memory: %s", e)
+                db = sqlite3.connect(":memory:", check_same_thread=False)
+                db.executescript(_SCHEMA)
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    async def sync(
+        self,
+        series: str,
+        starts: dict[str, datetime],
+        end: datetime,
+        fetch: FetchStatistics,
+    ) -> set[str]:
+        """Bring ``[starts[entity], end)`` of every entity up to date.
+
+        Parameters
+        ----------
+        series
+            Name the high-water marks are kept under; windows that do not
+            overlap (recent days vs. a year ago) use different series.
+        starts
+            First day needed, per entity.
+        end
+            Exclusive end of the window: ``now`` or a past midnight, aware in
+            HA's time zone; days are keyed by dates in it.
+        fetch
+            ``(entity_ids, start, end) -> (rows_by_entity, failed_ids)``,
+            typically the route's chunked statistics fetch.
+
+        Returns
+        -------
+        The ids whose fetch failed; their stored days and marks are left as
+        they were.
+        """
+        tz = end.tzinfo or timezone.utc
+        end_day = (end - timedelta(microseconds=1)).date()
+        plan, firsts = await asyncio.to_thread(self._plan, series, starts, end_day)
+        self.skipped += len(starts) - sum(len(ids) for ids in plan.values())
+        if not plan:
+            return set()
+
+        fetch_from = sorted(plan)
+        results = await asyncio.gather(*(
+            fetch(plan[day], datetime.combine(day, time(), tz), end)
+            for day in fetch_from
+        ))
+        settled = (datetime.now(tz) - _COMPILE_LAG).date() - timedelta(days=1)
+        failed: set[str] = set()
+        for day, (rows, group_failed) in zip(fetch_from, results):
+            failed |= group_failed
+            ok = {eid: rows.get(eid) or [] for eid in plan[day] if eid not in group_failed}
+            self.fetched_days += len(ok) * ((end_day - day).days + 1)
+            complete_day = max(day - timedelta(days=1), min(end_day, settled))
+            await asyncio.to_thread(
+                self._record, series, ok, firsts, day, end_day, complete_day, tz
+            )
+        return failed
+
+    def _plan(
+        self,
+        series: str,
+        starts: dict[str, datetime],
+        end_day: date,
+    ) -> tuple[dict[date, list[str]], dict[str, date]]:
+        """Group entities by the first day to fetch; also their new first day.
+
+        An entity continues from its mark if that covers the start of the
+        window without a gap; otherwise the whole window is fetched again.
+        """
+        with self._lock:
+            marks = {
+                eid: (date.fromisoformat(first), date.fromisoformat(complete))
+                for eid, first, complete in self._conn().execute(
+                    "SELECT entity_id, first_day, complete_day FROM marks WHERE series = ?",
+                    (series,),
+                )
+            }
+        plan: dict[date, list[str]] = {}
+        firsts: dict[str, date] = {}
+        for eid, start in starts.items():
+            start_day = start.date()
+            mark = marks.get(eid)
+            if mark is not None and mark[0] <= start_day <= mark[1] + timedelta(days=1):
+                firsts[eid], day = mark[0], mark[1] + timedelta(days=1)
+            else:
+                firsts[eid], day = start_day, start_day
+            if day <= end_day:
+                plan.setdefault(day, []).append(eid)
+        return plan, firsts
+
+    def _record(
+        self,
+        series: str,
+        rows_by_entity: dict[str, list[dict]],
+        firsts: dict[str, date],
+        fetch_from: date,
+        end_day: date,
+        complete_day: date,
+        tz: tzinfo,
+    ) -> None:
+        fetch_key, end_key = fetch_from.isoformat(), end_day.isoformat()
+        with self._lock, self._conn() as db:
+            for eid, rows in rows_by_entity.items():
+                prev_sum = None
+                if firsts[eid] < fetch_from:
+                    # Days without a bucket leave gaps; diff against the last one
+                    prev = db.execute(
+                        "SELECT last_sum FROM daily WHERE entity_id = ? AND day < ?"
+                        " AND last_sum IS NOT NULL ORDER BY day DESC LIMIT 1",
+                        (eid, fetch_key),
+                    ).fetchone()
+                    prev_sum = prev[0] if prev else None
+                # Replace the fetched range, so buckets HA dropped go too
+                db.execute(
+                    "DELETE FROM daily WHERE entity_id = ? AND day >= ? AND day <= ?",
+                    (eid, fetch_key, end_key),
+                )
+                db.executemany(
+                    "INSERT OR REPLACE INTO daily VALUES (?, ?, ?, ?)",
+                    [
+                        (eid, day, value, last_sum)
+                        for day, value, last_sum in _daily_totals(rows, prev_sum, tz)
+                        if fetch_key <= day <= end_key
+                    ],
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO marks VALUES (?, ?, ?, ?)",
+                    (series, eid, firsts[eid].isoformat(), complete_day.isoformat()),
+                )
+            cutoff = datetime.now(timezone.utc).date() - timedelta(days=_RETENTION_DAYS)
+            db.execute("DELETE FROM daily WHERE day < ?", (cutoff.isoformat(),))
+
+    async def rows(
+        self,
+        entity_ids: list[str],
+        start: datetime,
+        end: datetime,
+    ) -> dict[str, list[dict]]:
+        """Stored days in ``[start, end)`` as one daily row per day.
+
+        The rows have the shape of HA ``statistics_during_period`` rows, so
+        :func:`compute_kpi_aggregates` and :func:`detect_anomalies` consume
+        them unchanged. Every requested id is present, possibly with ``[]``.
+        """
+        return await asyncio.to_thread(
+            self._rows, entity_ids, start.date(), (end - timedelta(microseconds=1)).date()
+        )
+
+    def _rows(self, entity_ids: list[str], first: date, last: date) -> dict[str, list[dict]]:
+        result: dict[str, list[dict]] = {eid: [] for eid in entity_ids}
+        if not entity_ids:
+            return result
+        with self._lock:
+            db = self._conn()
+            for i in range(0, len(entity_ids), 500):
+                chunk = entity_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for eid, day, value in db.execute(
+                    f"SELECT entity_id, day, value FROM daily WHERE entity_id IN ({placeholders})"
+                    " AND day >= ? AND day <= ? ORDER BY entity_id, day",
+                    (*chunk, first.isoformat(), last.isoformat()),
+                ):
+                    result[eid].append({"start": day, "state": value})
+        return result
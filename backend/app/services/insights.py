@@ -15,6 +15,7 @@ Three concerns live here:
    year-over-year numbers per KPI.
 3. ``detect_anomalies`` — compare current accumulated value against last 4
    same-weekday samples; flag deviations > 50 % when there's enough history.
+   Large installs are screened in one pass with NumPy when it is installed.
 
 All three are deterministic, side-effect-free, and mock-friendly.
 """
@@ -22,8 +23,14 @@ from __future__ import annotations
 
 import logging
 import statistics
-from datetime import datetime, timedelta, timezone
-from typing import Iterable
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from itertools import chain, repeat
+from typing import Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:  # optional: batched anomaly screening for large installs
+    np = None
 
 logger = logging.getLogger(__name__)
 
@@ -130,41 +137,75 @@ def discover_kpi_entities(
 # ---------- KPI aggregation ----------
 
 
-def _daily_values(stats_rows: list[dict]) -> list[tuple[str, float]]:
+def _daily_values(
+    stats_rows: list[dict],
+    tz: tzinfo | None = None,
+) -> list[tuple[str, float]]:
     """Collapse HA ``statistics_during_period`` rows to (date, sum) pairs.
 
     HA can return multiple rows per day when period != "day"; we sum them up
-    per UTC date. For rows that already carry a ``sum`` (cumulative totals),
-    we take the diff between consecutive rows — otherwise the ``state`` /
-    ``mean`` value, whichever is populated.
+    per date in ``tz`` (HA's time zone, whose local midnights its day buckets
+    start at; UTC if ``None``). For rows that already carry a ``sum``
+    (cumulative totals), we take the diff between consecutive rows —
+    otherwise the ``state`` / ``mean`` value, whichever is populated.
+    """
+    return [(date_key, value) for date_key, value, _sum in _daily_totals(stats_rows, tz=tz)]
+
+
+def _daily_totals(
+    stats_rows: list[dict],
+    prev_sum: float | None = None,
+    tz: tzinfo | None = None,
+) -> list[tuple[str, float, float | None]]:
+    """Like :func:`_daily_values`, plus each day's last cumulative ``sum``.
+
+    ``prev_sum`` is the cumulative total before the first row, so rows fetched
+    incrementally diff against the previous fetch instead of counting the
+    whole running total as the first day's value.
     """
     per_day: dict[str, float] = {}
-    prev_sum: float | None = None
+    last_sums: dict[str, float] = {}
     for row in stats_rows:
-        start = row.get("start")
-        if not start:
+        date_key = _date_key(row.get("start"), tz)
+        if date_key is None:
             continue
-        # start is ISO 8601 or epoch ms — handle both.
-        if isinstance(start, (int, float)):
-            dt = datetime.fromtimestamp(start / 1000, tz=timezone.utc)
-        else:
-            try:
-                dt = datetime.fromisoformat(str(start).replace("Z", "+00:00"))
-            except ValueError:
-                continue
-        date_key = dt.date().isoformat()
 
         if "sum" in row and row["sum"] is not None:
             current = float(row["sum"])
             delta = (current - prev_sum) if prev_sum is not None else current
             per_day[date_key] = per_day.get(date_key, 0.0) + max(delta, 0.0)
             prev_sum = current
+            last_sums[date_key] = current
         elif "state" in row and row["state"] is not None:
             per_day[date_key] = per_day.get(date_key, 0.0) + float(row["state"])
         elif "mean" in row and row["mean"] is not None:
             per_day[date_key] = per_day.get(date_key, 0.0) + float(row["mean"])
 
-    return sorted(per_day.items())
+    return [
+        (date_key, value, last_sums.get(date_key))
+        for date_key, value in sorted(per_day.items())
+    ]
+
+
+def _date_key(start, tz: tzinfo | None = None) -> str | None:
+    """Date (ISO) of a row's ``start`` in ``tz``, or ``None`` if unusable.
+
+    Without ``tz``, epoch ms are read as UTC and ISO strings keep their own
+    offset.
+    """
+    if not start:
+        return None
+    # start is ISO 8601 or epoch ms — handle both.
+    if isinstance(start, (int, float)):
+        dt = datetime.fromtimestamp(start / 1000, tz=tz or timezone.utc)
+    else:
+        try:
+            dt = datetime.fromisoformat(str(start).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if tz is not None and dt.tzinfo is not None:
+            dt = dt.astimezone(tz)
+    return dt.date().isoformat()
 
 
 def _fill_seven_days(
@@ -208,7 +249,8 @@ def compute_kpi_aggregates(
         Mapping of ``entity_id -> rows`` for the same 7 days one year ago.
         May be ``None`` (new install / no history).
     now:
-        Injected "now" for deterministic tests; defaults to UTC now.
+        Injected "now" for deterministic tests; defaults to UTC now. Rows
+        are bucketed into days in its time zone (HA's, from the route).
 
     Returns
     -------
@@ -310,10 +352,10 @@ def _build_kpi(
     if not entity_id:
         return _empty_kpi(unit=unit, reason="no_entity_found")
 
-    trend_pairs = _daily_values(trend_rows)
+    trend_pairs = _daily_values(trend_rows, now.tzinfo)
     _dates, trend_values = _fill_seven_days(trend_pairs, now)
 
-    today_pairs = _daily_values(today_rows)
+    today_pairs = _daily_values(today_rows, now.tzinfo)
     today_value = today_pairs[-1][1] if today_pairs else None
 
     if today_value is None and not trend_pairs:
@@ -330,7 +372,7 @@ def _build_kpi(
 
     yoy_values: list[float] | None = None
     if yoy_rows:
-        yoy_pairs = _daily_values(yoy_rows)
+        yoy_pairs = _daily_values(yoy_rows, now.tzinfo)
         ref_yoy = now.replace(year=now.year - 1) if now.year > 1 else now
         _dy, yoy_values = _fill_seven_days(yoy_pairs, ref_yoy)
 
@@ -348,6 +390,17 @@ def _build_kpi(
 
 # ---------- Anomaly detection ----------
 
+# Baselines :func:`detect_anomalies` can compare today against
+BASELINES = ("mean", "median")
+# Scales a median absolute deviation to a standard deviation (normal data)
+_MAD_TO_SIGMA = 1.4826
+# From this many entities on, the NumPy engine pays for its setup
+_BATCH_MIN_ENTITIES = 32
+# The batched screen keeps everything this close to the threshold, and any
+# column whose float sum may have cancelled, for the exact check
+_SCREEN_MARGIN = 1e-6
+_CANCELLATION_RATIO = 1e3
+
 
 def detect_anomalies(
     monitored_entities: Iterable[dict],
@@ -356,6 +409,8 @@ def detect_anomalies(
     now: datetime | None = None,
     deviation_threshold: float = 0.5,
     min_samples: int = 4,
+    baseline: str = "mean",
+    mad_scale: float = 3.0,
 ) -> list[dict]:
     """Flag entities whose current accumulated value deviates > 50 % from
     the recent same-weekday baseline.
@@ -367,9 +422,17 @@ def detect_anomalies(
     1. Compute today's accumulated value (sum of today's stat rows).
     2. Look at the last 4 same-weekday samples (e.g. if today is Tuesday,
        the previous 4 Tuesdays). Skip if < ``min_samples`` samples.
-    3. Compute the historical mean. If the mean is zero, skip (division
-       guard).
+    3. Compute the historical mean (or median). If it is zero, skip
+       (division guard).
     4. If ``|today - mean| / mean > deviation_threshold``, emit an anomaly.
+       With the median baseline the distance must also exceed ``mad_scale``
+       scaled median absolute deviations, so entities with noisy history
+       are not flagged for their usual swings.
+
+    With NumPy installed and at least ``_BATCH_MIN_ENTITIES`` entities, all
+    entities are screened at once on a days × entities matrix; the few that
+    pass the screen are confirmed with the scalar arithmetic, so both paths
+    return identical results.
 
     Parameters
     ----------
@@ -379,22 +442,27 @@ def detect_anomalies(
     historical_stats:
         Mapping ``entity_id -> rows`` covering the last ~5 weeks.
     now:
-        Injected "now" for deterministic tests.
+        Injected "now" for deterministic tests. Its time zone decides which
+        day a row belongs to, and which day is today.
     deviation_threshold:
         Fractional deviation that triggers an anomaly. 0.5 = 50 %.
     min_samples:
         Minimum number of same-weekday samples required before we'll flag.
+    baseline:
+        ``"mean"`` (default) or ``"median"``, see :data:`BASELINES`.
+    mad_scale:
+        Median baseline only: required distance in scaled MADs.
 
     Returns
     -------
     List of ``{entity_id, friendly_name, description, severity, detected_at}``.
     Empty if nothing qualifies.
     """
+    if baseline not in BASELINES:
+        raise ValueError(f"Unknown baseline: {baseline}")
     now = now or datetime.now(timezone.utc)
-    anomalies: list[dict] = []
-    today_date = now.date()
-    today_weekday = today_date.weekday()
 
+    series: list[tuple[dict, list[dict]]] = []
     for ent in monitored_entities:
         entity_id = ent.get("entity_id")
         if not entity_id:
@@ -402,8 +470,57 @@ def detect_anomalies(
         rows = historical_stats.get(entity_id) or []
         if not rows:
             continue
-
-        per_day = dict(_daily_values(rows))
+        series.append((ent, rows))
+
+    judge = _judge_batched if np is not None and len(series) >= _BATCH_MIN_ENTITIES else _judge_each
+    return [
+        _anomaly(ent, today_value, center, deviation, now)
+        for ent, today_value, center, deviation in judge(
+            series, now.date(), deviation_threshold, min_samples, baseline, mad_scale,
+            now.tzinfo,
+        )
+    ]
+
+
+def _baseline_deviation(
+    today_value: float,
+    samples: list[float],
+    deviation_threshold: float,
+    baseline: str,
+    mad_scale: float,
+) -> tuple[float, float] | None:
+    """``(center, deviation)`` if ``today_value`` is anomalous, else ``None``."""
+    if baseline == "median":
+        center = statistics.median(samples)
+    else:
+        center = statistics.fmean(samples)
+    if center == 0:
+        # Guard against divide-by-zero when the entity is always zero.
+        return None
+
+    deviation = abs(today_value - center) / center
+    if deviation <= deviation_threshold:
+        return None
+    if baseline == "median":
+        mad = statistics.median(abs(v - center) for v in samples)
+        if abs(today_value - center) <= mad_scale * _MAD_TO_SIGMA * mad:
+            return None
+    return center, deviation
+
+
+def _judge_each(
+    series: list[tuple[dict, list[dict]]],
+    today_date: date,
+    deviation_threshold: float,
+    min_samples: int,
+    baseline: str,
+    mad_scale: float,
+    tz: tzinfo | None,
+) -> Iterator[tuple[dict, float, float, float]]:
+    """Scalar engine: one entity at a time."""
+    today_weekday = today_date.weekday()
+    for ent, rows in series:
+        per_day = dict(_daily_values(rows, tz))
 
         # Separate today's accumulated value from historical same-weekday samples.
         today_value = per_day.get(today_date.isoformat(), 0.0)
@@ -426,45 +543,169 @@ def detect_anomalies(
         if len(same_weekday_values) < min_samples:
             logger.debug(
                 "Skipping anomaly check for %s: %d samples < %d required",
-                entity_id,
+                ent.get("entity_id"),
                 len(same_weekday_values),
                 min_samples,
             )
             continue
 
-        mean = statistics.fmean(same_weekday_values)
-        if mean == 0:
-            # Guard against divide-by-zero when the entity is always zero.
-            continue
-
-        deviation = abs(today_value - mean) / mean
-        if deviation <= deviation_threshold:
-            continue
+        verdict = _baseline_deviation(
+            today_value, same_weekday_values, deviation_threshold, baseline, mad_scale
+        )
+        if verdict is not None:
+            yield ent, today_value, *verdict
+
+
+def _judge_batched(
+    series: list[tuple[dict, list[dict]]],
+    today_date: date,
+    deviation_threshold: float,
+    min_samples: int,
+    baseline: str,
+    mad_scale: float,
+    tz: tzinfo | None,
+) -> Iterator[tuple[dict, float, float, float]]:
+    """NumPy engine: screen all entities on a days × entities matrix.
+
+    Float sums in a different order can differ from ``statistics.fmean`` in
+    the last bits, so the matrix only rules entities out; those it cannot
+    rule out go through :func:`_baseline_deviation` on the same samples.
+    """
+    today_key = today_date.isoformat()
+    today_weekday = today_date.weekday()
+    day_keys: dict = {}
+    columns = [_daily_column(rows, day_keys, tz) for _ent, rows in series]
+    dates = sorted({key for key in day_keys.values() if key is not None})
+    index = {date_key: i for i, date_key in enumerate(dates)}
+    # Weekday of each distinct date once, not once per entity
+    same_weekday = np.array(
+        [
+            date_key != today_key and date.fromisoformat(date_key).weekday() == today_weekday
+            for date_key in dates
+        ],
+        dtype=bool,
+    )
 
-        severity = _severity_for_deviation(deviation)
-        weekday_name = today_date.strftime("%A")
-        friendly_name = _attr(ent, "friendly_name") or entity_id
-        if today_value > mean:
-            description = (
-                f"{friendly_name} ran {today_value:.1f} vs typical "
-                f"{mean:.1f} on {weekday_name} ({deviation * 100:.0f}% higher)"
-            )
+    # Flatten all rows into (day, entity, value) triples; -1 marks unusable rows
+    slot = {token: index[key] for token, key in day_keys.items() if key is not None}
+    day_idx = np.fromiter(
+        chain.from_iterable(map(slot.get, tokens, repeat(-1)) for tokens, _c in columns), int
+    )
+    col_idx = np.repeat(np.arange(len(series)), [len(tokens) for tokens, _c in columns])
+    flat = np.fromiter(chain.from_iterable(column for _t, column in columns), float)
+    usable = day_idx >= 0
+    day_idx, col_idx, flat = day_idx[usable], col_idx[usable], flat[usable]
+
+    values = np.zeros((len(dates), len(series)))
+    present = np.zeros((len(dates), len(series)), dtype=bool)
+    # Unbuffered and in row order: repeated days add up like _daily_values
+    np.add.at(values, (day_idx, col_idx), flat)
+    present[day_idx, col_idx] = True
+
+    if today_key in index:
+        today = np.where(present[index[today_key]], values[index[today_key]], 0.0)
+    else:
+        today = np.zeros(len(series))
+
+    # Most recent ``min_samples * 2`` same-weekday samples per entity
+    samples = values[same_weekday]
+    sampled = present[same_weekday]
+    from_end = np.cumsum(sampled[::-1], axis=0)[::-1]
+    keep = sampled & (from_end <= min_samples * 2)
+    count = keep.sum(axis=0)
+    unstable = (keep & np.isnan(samples)).any(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if baseline == "median":
+            center = np.full(len(series), np.nan)
+            enough = count >= min_samples
+            if enough.any():
+                center[enough] = np.nanmedian(
+                    np.where(keep, samples, np.nan)[:, enough], axis=0
+                )
         else:
-            description = (
-                f"{friendly_name} at {today_value:.1f} vs typical "
-                f"{mean:.1f} on {weekday_name} ({deviation * 100:.0f}% lower)"
-            )
-        anomalies.append(
-            {
-                "entity_id": entity_id,
-                "friendly_name": friendly_name,
-                "description": description,
-                "severity": severity,
-                "detected_at": now.isoformat(),
-            }
+            kept = np.where(keep, samples, 0.0)
+            total = kept.sum(axis=0)
+            unstable |= np.abs(kept).sum(axis=0) > _CANCELLATION_RATIO * np.abs(total)
+            center = total / count
+        deviation = np.abs(today - center) / center
+    # NaN and inf deviations (zero or odd centers) fail the <= and stay in
+    candidates = (count >= min_samples) & (
+        unstable | ~(deviation <= deviation_threshold - _SCREEN_MARGIN)
+    )
+    logger.debug(
+        "Anomaly screen: %d entities, %d days, %d candidates",
+        len(series), len(dates), int(candidates.sum()),
+    )
+
+    for col in np.flatnonzero(candidates):
+        today_value = float(today[col])
+        verdict = _baseline_deviation(
+            today_value,
+            samples[keep[:, col], col].tolist(),
+            deviation_threshold,
+            baseline,
+            mad_scale,
         )
+        if verdict is not None:
+            yield series[col][0], today_value, *verdict
 
-    return anomalies
+
+def _daily_column(
+    rows: list[dict],
+    day_keys: dict,
+    tz: tzinfo | None,
+) -> tuple[list, list[float]]:
+    """Per-row date tokens and values of one entity for the batched engine.
+
+    Plain rows (``state`` without a cumulative ``sum``, as the daily store
+    returns them) skip :func:`_daily_values`: their ``start`` is the token,
+    parsed to a date key once per distinct value through ``day_keys``. Other
+    rows go through :func:`_daily_values` and use the date key as token.
+    """
+    try:
+        if [row.get("sum") for row in rows].count(None) != len(rows):
+            raise TypeError
+        tokens = [row.get("start") for row in rows]
+        column = [float(row["state"]) for row in rows]
+    except (KeyError, TypeError, ValueError):
+        pairs = _daily_values(rows, tz)
+        tokens = [date_key for date_key, _value in pairs]
+        column = [value for _key, value in pairs]
+    for token in tokens:
+        if token not in day_keys:
+            day_keys[token] = _date_key(token, tz)
+    return tokens, column
+
+
+def _anomaly(
+    ent: dict,
+    today_value: float,
+    mean: float,
+    deviation: float,
+    now: datetime,
+) -> dict:
+    entity_id = ent["entity_id"]
+    severity = _severity_for_deviation(deviation)
+    weekday_name = now.date().strftime("%A")
+    friendly_name = _attr(ent, "friendly_name") or entity_id
+    if today_value > mean:
+        description = (
+            f"{friendly_name} ran {today_value:.1f} vs typical "
+            f"{mean:.1f} on {weekday_name} ({deviation * 100:.0f}% higher)"
+        )
+    else:
+        description = (
+            f"{friendly_name} at {today_value:.1f} vs typical "
+            f"{mean:.1f} on {weekday_name} ({deviation * 100:.0f}% lower)"
+        )
+    return {
+        "entity_id": entity_id,
+        "friendly_name": friendly_name,
+        "description": description,
+        "severity": severity,
+        "detected_at": now.isoformat(),
+    }
 
 
 def _severity_for_deviation(deviation: float) -> str:
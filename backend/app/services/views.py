@@ -0,0 +1,87 @@
+"""Dashboard view helpers: which entities does a view reference?
+
+Pure functions over ``DashboardConfig`` models and HA registry dumps. They
+are used by the WebSocket proxy to turn a ``view_id`` into an entity
+subscription and do not perform any I/O themselves.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+from app.config.models import CardItem, ViewConfig
+
+
+def build_entity_area_map(
+    devices: list[dict],
+    entity_registry: list[dict],
+) -> dict[str, str]:
+    """Map ``entity_id -> area_id`` from HA's device and entity registries.
+
+    An entity's own ``area_id`` wins; otherwise it inherits the area of its
+    device. Entities without either are left out.
+    """
+    device_area_map = {}
+    for dev in devices:
+        if dev.get("area_id"):
+            device_area_map[dev.get("id")] = dev["area_id"]
+
+    entity_area_map = {}
+    for ent in entity_registry:
+        area = ent.get("area_id")
+        if not area and ent.get("device_id"):
+            area = device_area_map.get(ent["device_id"])
+        if area:
+            entity_area_map[ent.get("entity_id", "")] = area
+    return entity_area_map
+
+
+def _card_items(view: ViewConfig) -> Iterable[CardItem]:
+    for section in view.sections:
+        yield from section.items
+        for subsection in section.subsections:
+            yield from subsection.items
+
+
+def _config_entities(config: dict) -> set[str]:
+    """Entity ids referenced by a card's free-form config.
+
+    Cards store extra entities under keys like ``light_entity`` or
+    ``media_player_entity``; lists live under ``entities``-style keys.
+    """
+    found: set[str] = set()
+    for key, value in config.items():
+        if key == "entity" or key.endswith("_entity"):
+            if isinstance(value, str) and "." in value:
+                found.add(value)
+        elif key == "entities" or key.endswith("_entities"):
+            if isinstance(value, list):
+                found.update(v for v in value if isinstance(v, str) and "." in v)
+    return found
+
+
+def collect_view_entities(
+    view: ViewConfig,
+    entity_area_map: dict[str, str] | None = None,
+) -> set[str]:
+    """Return every entity_id a view's cards need state for.
+
+    Area cards (``config.area_id``) and object-page views bound to an area
+    expand to all entities in that area via ``entity_area_map``.
+    """
+    entity_area_map = entity_area_map or {}
+    entities: set[str] = set()
+    areas: set[str] = set()
+    if view.area:
+        areas.add(view.area)
+
+    for item in _card_items(view):
+        if item.entity:
+            entities.add(item.entity)
+        entities |= _config_entities(item.config)
+        area_id = item.config.get("area_id")
+        if isinstance(area_id, str) and area_id:
+            areas.add(area_id)
+
+    if areas:
+        entities.update(eid for eid, area in entity_area_map.items() if area in areas)
+    return entities
@@ -23,6 +23,18 @@ class Settings(BaseSettings):
     data_dir: Path = Path("/app/data")
     port: int = 5050
     debug: bool = False
+    # Unix socket shared by uvicorn workers; enables multi-worker mode
+    ipc_socket: str = ""
+    # permessage-deflate for browser WebSockets (app.ws.transport)
+    ws_deflate: bool = True
+    ws_deflate_window_bits: int = 12
+    ws_deflate_mem_level: int = 5
+    ws_deflate_level: int = 6
+    # JSON backend (app.codec): auto, orjson or json
+    json_codec: str = "auto"
+    # /api/insights response cache (LRU) budget; 0 lifts a limit
+    insights_cache_max_entries: int = 32
+    insights_cache_max_bytes: int = 4 * 1024 * 1024
 
     @property
     def is_addon(self) -> bool:
@@ -0,0 +1,134 @@
+"""Bulk service calls: many ``call_service`` requests as one action.
+
+"All lights off on this floor" used to be one ``call_service`` per light.
+:func:`run_bulk` takes the whole list, merges calls that share domain,
+service and data but not targets into one call whose target is the union
+of theirs (HA applies a service to every entity in its target), and runs the
+remaining calls concurrently with bounded parallelism. The result reports every
+original call with the outcome and latency of the HA call that carried it.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from app import codec
+
+# Target keys HA accepts as lists, so targets can be unioned
+_TARGET_KEYS = ("entity_id", "device_id", "area_id", "floor_id", "label_id")
+
+CallService = Callable[[str, str, dict, dict], Awaitable[dict]]
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _validate(call) -> str | None:
+    if not isinstance(call, dict):
+        return "call must be an object"
+    if not isinstance(call.get("domain"), str) or not isinstance(call.get("service"), str):
+        return "domain and service are required"
+    for key in ("data", "target"):
+        if call.get(key) is not None and not isinstance(call[key], dict):
+            return f"{key} must be an object"
+    return None
+
+
+def _disjoint(batch: dict, target: dict) -> bool:
+    """Whether ``target`` names nothing ``batch`` already targets."""
+    if not target or not batch["target"]:
+        return False
+    return not any(
+        value in batch["target"].get(name, ()) for name in _TARGET_KEYS
+        for value in _as_list(target.get(name))
+    )
+
+
+def plan_batches(calls: list[dict], merge: bool = True) -> list[tuple[dict, list[int]]]:
+    """Group valid ``calls`` into HA calls: ``(call, original indexes)``.
+
+    Calls merge when domain, service and data match and their targets only
+    use keys HA accepts as lists. A call that repeats a target of the batch
+    (or has no target) starts a new batch instead, so toggling the same
+    light twice still makes two HA calls. Order of first appearance is kept.
+    """
+    batches: list[tuple[dict, list[int]]] = []
+    by_key: dict[str, int] = {}
+    for index, call in enumerate(calls):
+        target = call.get("target") or {}
+        mergeable = merge and all(key in _TARGET_KEYS for key in target)
+        key = codec.dumps(
+            [call["domain"], call["service"], call.get("data") or {}], sort_keys=True
+        ) if mergeable else None
+        if key is not None and key in by_key and _disjoint(batches[by_key[key]][0], target):
+            merged, indexes = batches[by_key[key]]
+            for name in _TARGET_KEYS:
+                values = _as_list(target.get(name))
+                if values:
+                    existing = merged["target"].setdefault(name, [])
+                    existing.extend(v for v in values if v not in existing)
+            indexes.append(index)
+            continue
+        batch = {
+            "domain": call["domain"],
+            "service": call["service"],
+            "data": call.get("data") or {},
+            "target": (
+                {name: _as_list(value) for name, value in target.items()}
+                if mergeable else dict(target)
+            ),
+        }
+        if key is not None:
+            by_key[key] = len(batches)
+        batches.append((batch, [index]))
+    return batches
+
+
+async def run_bulk(
+    calls: list,
+    call_service: CallService,
+    max_parallel: int,
+    merge: bool = True,
+) -> dict:
+    """Run ``calls`` and return the aggregated ``bulk_result`` payload."""
+    started = time.monotonic()
+    results: list[dict] = [{"index": i} for i in range(len(calls))]
+    valid: list[int] = []
+    for index, call in enumerate(calls):
+        error = _validate(call)
+        if error is None:
+            valid.append(index)
+        else:
+            results[index].update(success=False, error=error, latency_ms=None, batch=None)
+
+    batches = plan_batches([calls[i] for i in valid], merge)
+    slots = asyncio.Semaphore(max_parallel)
+
+    async def run(number: int, batch: dict, indexes: list[int]):
+        async with slots:
+            call_started = time.monotonic()
+            try:
+                resp = await call_service(
+                    batch["domain"], batch["service"], batch["data"], batch["target"]
+                )
+                success = resp.get("success", True)
+                error = None if success else (resp.get("error") or {}).get("message", "failed")
+            except Exception as e:
+                success, error = False, str(e) or type(e).__name__
+            latency_ms = round((time.monotonic() - call_started) * 1000, 1)
+        for i in indexes:
+            results[valid[i]].update(success=success, error=error, latency_ms=latency_ms,
+                                     batch=number)
+
+    await asyncio.gather(*(run(n, batch, indexes) for n, (batch, indexes) in enumerate(batches)))
+    return {
+        "type": "bulk_result",
+        "success": all(r["success"] for r in results),
+        "calls": results,
+        "batches": len(batches),
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    }
@@ -0,0 +1,375 @@
+"""Multi-worker mode: one upstream HA connection shared by all workers.
+
+Enabled by setting ``DAS_HOME_IPC_SOCKET`` to a Unix socket path and running
+uvicorn with ``--workers N``. Each worker elects a role the first time it
+needs HA:
+
+- the **owner** (whoever takes the lock file ``<socket>.lock``) holds the
+  HA connection, serves the socket and publishes every broadcast to the
+  other workers;
+- **followers** connect to the socket. Their ``ha_gateway`` forwards
+  commands and subscriptions to the owner, and they keep their own state
+  mirror and replay buffer from what the owner publishes, so ``get_states``
+  and client fan-out stay local to each worker.
+
+If the owner exits, its lock is released and the followers' links drop; the
+reconnect supervisor then runs the election again and one of them takes over.
+
+Frames are length-prefixed JSON (4-byte big-endian length). Followers send
+requests ``{"op", "id", ...}`` and get ``{"op": "reply", "id", "result"}``
+or ``{"op": "reply", "id", "error"}``. The owner also sends
+``{"op": "event", "sub", "event"}`` for forwarded subscriptions and
+whatever the proxy publishes (``snapshot``, ``events``, ``notify``).
+"""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+from typing import Awaitable, Callable
+
+from app import codec
+from app.ws.gateway import HAGateway
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+_MAX_FRAME = 64 * 1024 * 1024
+# Frames queued for one follower before it counts as stalled and is dropped
+_LINK_QUEUE = 1024
+# Seconds a peer may take to accept a written frame
+_DRAIN_TIMEOUT = 10.0
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> dict | None:
+    try:
+        (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+        if size > _MAX_FRAME:
+            raise ValueError(f"IPC frame too large: {size} bytes")
+        return codec.loads(await reader.readexactly(size))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def _frame(message: dict) -> bytes:
+    data = codec.dumps_bytes(message)
+    return _HEADER.pack(len(data)) + data
+
+
+async def _write_frame(writer: asyncio.StreamWriter, message: dict):
+    writer.write(_frame(message))
+    await asyncio.wait_for(writer.drain(), _DRAIN_TIMEOUT)
+
+
+class _FollowerLink:
+    """Owner-side state for one connected follower.
+
+    ``send`` is called synchronously from HA event handlers, so frames go
+    through a bounded queue that one task writes out with backpressure. A
+    follower that stops reading fills the queue and is disconnected; it
+    re-joins with a fresh snapshot instead of growing the owner's buffers.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.following = False
+        # follower subscription id -> upstream subscription id
+        self.subscriptions: dict[int, int] = {}
+        self._queue: asyncio.Queue[bytes] = asyncio.Queue(_LINK_QUEUE)
+        self.sender = asyncio.create_task(self._send_frames())
+
+    def send(self, message: dict):
+        if self.writer.is_closing():
+            return
+        try:
+            self._queue.put_nowait(_frame(message))
+        except asyncio.QueueFull:
+            logger.warning("Follower worker stopped reading; dropping its link")
+            self.writer.close()
+
+    async def _send_frames(self):
+        try:
+            while True:
+                self.writer.write(await self._queue.get())
+                await asyncio.wait_for(self.writer.drain(), _DRAIN_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.warning(f"Follower link stalled: {e!r}")
+            self.writer.close()
+
+
+class WorkerCluster:
+    """Role election and IPC between uvicorn workers.
+
+    The proxy plugs in its behaviour:
+
+    ``ensure_upstream``
+        owner side, makes sure HA is connected before serving a follower;
+    ``snapshot``
+        owner side, returns the ``snapshot`` message sent to new followers;
+    ``on_message``
+        follower side, handles messages published by the owner.
+    """
+
+    def __init__(self, gateway: HAGateway):
+        self._gateway = gateway
+        self.path: str | None = None
+        self.role: str | None = None  # None (single process), "owner" or "follower"
+        self.ensure_upstream: Callable[[], Awaitable[None]] | None = None
+        self.snapshot: Callable[[], dict] | None = None
+        self.on_message: Callable[[dict], None] | None = None
+        self._lock_fd: int | None = None
+        self._election: asyncio.Lock | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._links: set[_FollowerLink] = set()
+        # follower side
+        self._writer: asyncio.StreamWriter | None = None
+        self.reader_task: asyncio.Task | None = None
+        self._requests: dict[int, asyncio.Future] = {}
+        self._handlers: dict[int, Callable[[dict], None]] = {}
+        self._counter = 0
+        self.published = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def connected(self) -> bool:
+        """Follower side: the link to the owner is up."""
+        return self._writer is not None and not self._writer.is_closing()
+
+    def configure(self, path: str | None):
+        self.path = path or None
+
+    async def ensure_started(self):
+        """Elect a role if cluster mode is on and this worker has none yet."""
+        if not self.enabled or self.role == "owner" or self.connected:
+            return
+        if self._election is None:
+            self._election = asyncio.Lock()
+        # Concurrent callers in this worker share one election; a second
+        # lock attempt would fail against our own lock and follow ourselves.
+        async with self._election:
+            if self.role == "owner" or self.connected:
+                return
+            for _ in range(50):
+                if self._try_lock():
+                    await self._serve()
+                    return
+                try:
+                    await self._follow()
+                    return
+                except OSError:
+                    # The new owner may not be listening yet
+                    await asyncio.sleep(0.1)
+            raise ConnectionError(f"No owner worker on {self.path}")
+
+    # ---------- election ----------
+
+    def _try_lock(self) -> bool:
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # Held for the lifetime of the process; released by the OS on exit.
+        self._lock_fd = fd
+        return True
+
+    # ---------- owner ----------
+
+    async def _serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_follower, path=self.path)
+        self.role = "owner"
+        self._gateway.forward_to(None)
+        logger.info(f"Worker {os.getpid()} owns the HA connection ({self.path})")
+
+    def publish(self, message: dict):
+        """Owner side: send ``message`` to every following worker."""
+        if self.role != "owner":
+            return
+        for link in list(self._links):
+            if link.following:
+                link.send(message)
+                self.published += 1
+
+    async def _handle_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        link = _FollowerLink(writer)
+        self._links.add(link)
+        tasks: set[asyncio.Task] = set()
+        try:
+            while (request := await _read_frame(reader)) is not None:
+                # Requests run concurrently; a slow command must not hold up the rest
+                task = asyncio.create_task(self._answer(link, request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except Exception as e:
+            logger.warning(f"Follower link error: {e}")
+        finally:
+            self._links.discard(link)
+            link.sender.cancel()
+            for task in tasks:
+                task.cancel()
+            for upstream_id in link.subscriptions.values():
+                try:
+                    await self._gateway.unsubscribe(upstream_id)
+                except Exception:
+                    pass
+            writer.close()
+
+    async def _answer(self, link: _FollowerLink, request: dict):
+        try:
+            result = await self._execute(link, request)
+            link.send({"op": "reply", "id": request.get("id"), "result": result})
+        except Exception as e:
+            link.send({"op": "reply", "id": request.get("id"), "error": repr(e)})
+
+    async def _execute(self, link: _FollowerLink, request: dict):
+        if self.ensure_upstream is not None:
+            await self.ensure_upstream()
+        op = request.get("op")
+        if op == "command":
+            return await self._gateway.command(
+                request["msg_type"], timeout=request.get("timeout"), **request.get("kwargs", {})
+            )
+        if op == "subscribe":
+            sub = request["sub"]
+            link.subscriptions[sub] = await self._gateway.subscribe(
+                request["msg_type"],
+                lambda event: link.send({"op": "event", "sub": sub, "event": event}),
+                timeout=request.get("timeout"),
+                **request.get("kwargs", {}),
+            )
+            return sub
+        if op == "unsubscribe":
+            upstream_id = link.subscriptions.pop(request["sub"], None)
+            if upstream_id is not None:
+                await self._gateway.unsubscribe(upstream_id)
+            return None
+        if op == "follow":
+            # Snapshot and subscription happen without yielding, so the
+            # follower sees every later event exactly once.
+            link.send(self.snapshot())
+            link.following = True
+            return None
+        raise ValueError(f"Unknown IPC op: {op}")
+
+    # ---------- follower ----------
+
+    async def _follow(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        self._writer = writer
+        self.role = "follower"
+        self.reader_task = asyncio.create_task(self._read_owner(reader, writer))
+        self._gateway.forward_to(self)
+        logger.info(f"Worker {os.getpid()} follows the owner on {self.path}")
+
+    async def _read_owner(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (msg := await _read_frame(reader)) is not None:
+                op = msg.get("op")
+                if op == "reply":
+                    fut = self._requests.get(msg.get("id"))
+                    if fut is not None and not fut.done():
+                        if "error" in msg:
+                            fut.set_exception(ConnectionError(msg["error"]))
+                        else:
+                            fut.set_result(msg.get("result"))
+                elif op == "event":
+                    handler = self._handlers.get(msg.get("sub"))
+                    if handler is not None:
+                        handler(msg.get("event") or {})
+                elif self.on_message is not None:
+                    self.on_message(msg)
+        except Exception as e:
+            logger.error(f"Owner link error: {e}")
+        finally:
+            logger.warning("Lost the owner worker; electing again on reconnect")
+            self._writer = None
+            self.role = None
+            for fut in self._requests.values():
+                if not fut.done():
+                    fut.cancel()
+            self._requests.clear()
+            self._handlers.clear()
+            writer.close()
+            self._gateway.forward_to(None)
+
+    async def request(self, op: str, fields: dict | None = None, timeout: float | None = None):
+        """Follower side: send a request to the owner and wait for the reply."""
+        if not self.connected:
+            raise ConnectionError("Not connected to the owner worker")
+        self._counter += 1
+        request_id = self._counter
+        fut = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = fut
+        try:
+            await _write_frame(self._writer, {"op": op, "id": request_id, **(fields or {})})
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            self._requests.pop(request_id, None)
+
+    # Forwarder interface used by HAGateway on followers
+
+    async def command(self, msg_type: str, kwargs: dict, timeout: float) -> dict:
+        # The owner enforces the timeout; allow a little slack for the hop
+        return await self.request(
+            "command",
+            {"msg_type": msg_type, "kwargs": kwargs, "timeout": timeout},
+            timeout=timeout + 1.0,
+        )
+
+    async def subscribe(
+        self,
+        msg_type: str,
+        handler: Callable[[dict], None],
+        kwargs: dict,
+        timeout: float,
+    ) -> int:
+        self._counter += 1
+        sub = self._counter
+        self._handlers[sub] = handler
+        try:
+            await self.request(
+                "subscribe",
+                {"sub": sub, "msg_type": msg_type, "kwargs": kwargs, "timeout": timeout},
+                timeout=timeout + 1.0,
+            )
+        except BaseException:
+            self._handlers.pop(sub, None)
+            raise
+        return sub
+
+    async def unsubscribe(self, sub: int):
+        self._handlers.pop(sub, None)
+        if self.connected:
+            await self.request("unsubscribe", {"sub": sub}, timeout=10.0)
+
+    async def close(self):
+        """Give up the role: stop serving (owner) or drop the link (follower)."""
+        if self._server is not None:
+            self._server.close()
+            for link in list(self._links):
+                link.sender.cancel()
+                link.writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        if self._writer is not None:
+            self._writer.close()
+        self.role = None
+
+    def stats(self) -> dict:
+        return {
+            "role": self.role,
+            "socket": self.path,
+            "followers": sum(1 for link in self._links if link.following),
+            "published": self.published,
+        }
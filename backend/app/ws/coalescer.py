@@ -0,0 +1,125 @@
+"""Time-window coalescing of high-frequency ``state_changed`` events.
+
+Power and energy sensors can report several times a second. For entities
+matched by a ``CoalesceRule`` the first event opens a window; further
+events for the same entity inside it only replace the pending new_state
+(the first old_state is kept). When the earliest window closes, every
+pending entity is flushed together, so clients get one ``states_batch``
+frame instead of a stream of single updates.
+
+Entities without a matching rule pass straight through.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable
+
+from app.config.models import CoalesceRule
+
+logger = logging.getLogger(__name__)
+
+
+def coalesce_window(rules: list[CoalesceRule], entity_id: str, state: dict | None) -> float:
+    """Return the window in seconds for ``entity_id`` (0 = no coalescing).
+
+    The most specific matching rule wins: entity_id, then device_class,
+    then domain.
+    """
+    if not rules:
+        return 0.0
+    domain = entity_id.split(".", 1)[0]
+    device_class = ((state or {}).get("attributes") or {}).get("device_class")
+    best: tuple[int, int] | None = None
+    for rule in rules:
+        if rule.entity_id:
+            if rule.entity_id != entity_id:
+                continue
+            rank = 3
+        elif rule.device_class:
+            if rule.device_class != device_class:
+                continue
+            if rule.domain and rule.domain != domain:
+                continue
+            rank = 2
+        elif rule.domain:
+            if rule.domain != domain:
+                continue
+            rank = 1
+        else:
+            continue
+        if best is None or rank > best[0]:
+            best = (rank, rule.window_ms)
+    return best[1] / 1000 if best else 0.0
+
+
+class StateCoalescer:
+    """Buffers ``state_changed`` messages per entity and flushes them in batches.
+
+    ``emit`` receives a list of ``state_changed`` messages: a single one for
+    pass-through events, all pending ones on flush.
+    """
+
+    def __init__(
+        self,
+        emit: Callable[[list[dict]], None],
+        rules: Callable[[], list[CoalesceRule]],
+    ):
+        self._emit = emit
+        self._rules = rules
+        self._pending: dict[str, dict] = {}
+        self._deadline: float | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self.coalesced = 0
+        self.batches = 0
+
+    def submit(self, message: dict):
+        entity_id = message.get("entity_id") or ""
+        pending = self._pending.get(entity_id)
+        if pending is not None:
+            self._pending[entity_id] = {**message, "old_state": pending.get("old_state")}
+            self.coalesced += 1
+            return
+
+        window = coalesce_window(
+            self._rules(), entity_id, message.get("new_state") or message.get("old_state")
+        )
+        if window <= 0:
+            self._emit([message])
+            return
+
+        self._pending[entity_id] = message
+        self._schedule(window)
+
+    def _schedule(self, window: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + window
+        if self._deadline is not None and self._deadline <= deadline:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._deadline = deadline
+        self._timer = loop.call_at(deadline, self.flush)
+
+    def flush(self):
+        """Emit everything pending now, e.g. on window close or disconnect."""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._deadline = None
+        if not self._pending:
+            return
+        events = list(self._pending.values())
+        self._pending.clear()
+        self.batches += 1
+        try:
+            self._emit(events)
+        except Exception as e:
+            logger.error(f"Coalesced flush failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "window_coalesced": self.coalesced,
+            "batches_flushed": self.batches,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,137 @@
+"""Shared, long-lived weather forecast subscriptions.
+
+HA 2024.3+ only delivers forecasts through ``weather/subscribe_forecast``.
+Instead of subscribing and unsubscribing for every client request, the proxy
+holds one subscription per (weather entity, forecast type) for the lifetime
+of the upstream connection. The latest forecast is cached, so requests are
+answered immediately, and every update HA emits is pushed to the clients
+that asked for that entity.
+
+After an upstream reconnect the proxy calls ``resubscribe`` to replay every
+known subscription; cached forecasts keep being served in the meantime.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+ForecastKey = tuple[str, str]  # (entity_id, forecast_type)
+
+
+class ForecastCache:
+    """Caches forecasts per (entity, type) and fans updates out to watchers.
+
+    ``subscribe(entity_id, forecast_type, handler)`` starts the upstream
+    subscription; ``handler`` receives each event payload. ``push(ws, msg)``
+    sends an update to one client.
+    """
+
+    def __init__(
+        self,
+        subscribe: Callable[[str, str, Callable[[dict], None]], Awaitable[int]],
+        push: Callable[[object, dict], None],
+    ):
+        self._subscribe = subscribe
+        self._push = push
+        self._forecasts: dict[ForecastKey, list[dict]] = {}
+        self._received: dict[ForecastKey, asyncio.Event] = {}
+        self._active: dict[ForecastKey, asyncio.Task] = {}
+        self._watchers: dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+
+    async def get(self, entity_id: str, forecast_type: str, timeout: float = 10.0) -> list[dict]:
+        """Return the latest forecast, waiting for the first event if needed.
+
+        Returns an empty list if HA can't be subscribed or sends nothing
+        within ``timeout``.
+        """
+        key = (entity_id, forecast_type)
+        task = self._ensure(key)
+        if key in self._forecasts:
+            self.hits += 1
+            return self._forecasts[key]
+
+        self.misses += 1
+        received = self._received.setdefault(key, asyncio.Event())
+        try:
+            # Shielded: one client giving up must not cancel the shared subscription.
+            if not await asyncio.wait_for(asyncio.shield(task), timeout):
+                return []
+            await asyncio.wait_for(received.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"No {forecast_type} forecast for {entity_id} within {timeout}s")
+        return self._forecasts.get(key, [])
+
+    def _ensure(self, key: ForecastKey) -> asyncio.Task:
+        task = self._active.get(key)
+        if task is None or (task.done() and not task.result()):
+            task = asyncio.create_task(self._start(key))
+            self._active[key] = task
+        return task
+
+    async def _start(self, key: ForecastKey) -> bool:
+        entity_id, forecast_type = key
+        try:
+            await self._subscribe(
+                entity_id, forecast_type, lambda event: self._on_event(key, event)
+            )
+            return True
+        except (Exception, asyncio.CancelledError) as e:
+            # The pending command is cancelled when the upstream drops
+            logger.warning(f"Forecast subscription {entity_id}/{forecast_type} failed: {e!r}")
+            return False
+
+    def _on_event(self, key: ForecastKey, event: dict):
+        forecast = event.get("forecast") or []
+        self._forecasts[key] = forecast
+        self._received.setdefault(key, asyncio.Event()).set()
+        self.updates += 1
+        entity_id, forecast_type = key
+        message = {
+            "type": "weather_forecast_update",
+            "entity_id": entity_id,
+            "forecast_type": forecast_type,
+            "forecast": forecast,
+        }
+        for ws in list(self._watchers.get(entity_id, ())):
+            self._push(ws, message)
+
+    def watch(self, ws, entity_id: str):
+        """Push future forecast updates for ``entity_id`` to ``ws``."""
+        self._watchers.setdefault(entity_id, set()).add(ws)
+
+    def unwatch(self, ws):
+        for entity_id in list(self._watchers):
+            watchers = self._watchers[entity_id]
+            watchers.discard(ws)
+            if not watchers:
+                del self._watchers[entity_id]
+
+    def reset(self):
+        """Forget upstream subscriptions after the HA connection dropped.
+
+        Cached forecasts are kept and served until fresh events arrive.
+        """
+        self._active.clear()
+
+    def resubscribe(self):
+        """Replay every known subscription on a new upstream connection."""
+        for key in set(self._forecasts) | set(self._received):
+            self._ensure(key)
+
+    def stats(self) -> dict:
+        return {
+            "subscriptions": sum(
+                1 for t in self._active.values() if t.done() and t.result()
+            ),
+            "cached": len(self._forecasts),
+            "watchers": sum(len(w) for w in self._watchers.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "updates": self.updates,
+        }
@@ -0,0 +1,324 @@
+"""Single multiplexed WebSocket connection to Home Assistant.
+
+Every module that talks to HA over its WebSocket API goes through
+``ha_gateway``: the browser proxy, the REST routes (discovery, panel, media)
+and insights. The gateway owns the authenticated upstream connection and one
+reader task that demultiplexes HA's messages by id:
+
+- ``command()`` sends a request and waits for its ``result``, with a
+  per-command timeout;
+- ``subscribe()`` registers a handler that receives every ``event`` for the
+  subscription id.
+
+At most ``ProxyConfig.upstream_max_inflight`` commands are outstanding at
+once; further callers wait for a slot, which keeps bursts from flooding HA.
+
+Reconnecting is left to the caller (see ``ws/proxy.py``); listeners added
+with ``add_disconnect_listener`` are told when the connection is gone.
+
+In multi-worker mode (``ws/cluster.py``) a follower worker has no upstream
+connection of its own: ``forward_to`` routes its commands and subscriptions
+through the worker that owns the connection.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import websockets
+from fastapi import HTTPException
+
+from app import codec
+from app.config.models import ProxyConfig
+
+logger = logging.getLogger(__name__)
+
+
+async def _get_ha_url() -> str:
+    from app.settings import settings
+    if settings.is_addon:
+        return "ws://supervisor/core/websocket"
+    from app.config import config_manager
+    config = config_manager.load_app_config()
+    url = config.connection.hass_url.rstrip("/")
+    return url.replace("http://", "ws://").replace("https://", "wss://") + "/api/websocket"
+
+
+async def _get_ha_token() -> str:
+    from app.settings import settings
+    if settings.is_addon:
+        return settings.supervisor_token
+    return settings.hass_token
+
+
+class HAAuthError(ConnectionError):
+    """HA rejected the token."""
+
+
+class HATokenMissing(HAAuthError):
+    """No HA token is configured."""
+
+
+class HAGateway:
+    def __init__(self, config: ProxyConfig | None = None):
+        self._config = config
+        self.connection = None
+        self.listen_task: asyncio.Task | None = None
+        self._lock: asyncio.Lock | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._handlers: dict[int, Callable[[dict], None]] = {}
+        self._disconnect_listeners: list[Callable[[], None]] = []
+        self._forwarder = None
+        # Multi-worker role election, run before every connect (see ws/cluster.py)
+        self.elect: Callable[[], Awaitable[None]] | None = None
+        self._counter = 0
+        self.forwarded = 0
+        self.commands = 0
+        self.timeouts = 0
+        self.peak_inflight = 0
+
+    def _proxy_config(self) -> ProxyConfig:
+        if self._config is not None:
+            return self._config
+        from app.config import config_manager
+        return config_manager.load_app_config().proxy
+
+    @property
+    def connected(self) -> bool:
+        if self._forwarder is not None:
+            return self._forwarder.connected
+        return self.connection is not None
+
+    def add_disconnect_listener(self, callback: Callable[[], None]):
+        self._disconnect_listeners.append(callback)
+
+    def forward_to(self, forwarder):
+        """Route commands and subscriptions through ``forwarder`` (the link to
+        the owner worker) instead of an own connection; ``None`` stops.
+
+        Dropping a forwarder counts as a disconnect. ``listen_task`` follows
+        the forwarder's reader, so the reconnect supervisor notices when the
+        link to the owner goes away.
+        """
+        previous = self._forwarder
+        self._forwarder = forwarder
+        if forwarder is not None:
+            self.listen_task = forwarder.reader_task
+        elif previous is not None:
+            self.listen_task = None
+            self._notify_disconnected()
+
+    def next_id(self) -> int:
+        self._counter += 1
+        return self._counter
+
+    async def connect(self) -> bool:
+        """Make sure an authenticated connection is open.
+
+        Returns True if a new connection was established. Raises
+        ``HAAuthError`` (``HATokenMissing``) for a rejected (missing) token
+        and other ``ConnectionError``/``OSError`` if HA can't be reached.
+        In multi-worker mode the role is elected first, so a follower never
+        opens a connection of its own.
+        """
+        if self.elect is not None:
+            await self.elect()
+        if self._forwarder is not None:
+            if not self._forwarder.connected:
+                raise ConnectionError("Not connected to the owner worker")
+            return False
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.connection is not None:
+                try:
+                    await self.connection.ping()
+                    return False
+                except Exception:
+                    self._teardown(self.connection)
+
+            ha_url = await _get_ha_url()
+            token = await _get_ha_token()
+            if not token:
+                raise HATokenMissing("No HA token configured")
+
+            ws = await websockets.connect(ha_url)
+            auth_msg = codec.loads(await ws.recv())
+            if auth_msg.get("type") == "auth_required":
+                await ws.send(codec.dumps({"type": "auth", "access_token": token}))
+                result = codec.loads(await ws.recv())
+                if result.get("type") != "auth_ok":
+                    await ws.close()
+                    raise HAAuthError(f"HA auth failed: {result.get('message', 'unknown')}")
+
+            self.connection = ws
+            logger.info("Connected to Home Assistant WebSocket")
+            # Start the reader before any command so responses are captured
+            self.listen_task = asyncio.create_task(self._listen(ws))
+            return True
+
+    async def command(self, msg_type: str, *, timeout: float | None = None, **kwargs) -> dict:
+        """Send one command and return HA's ``result`` message."""
+        if self._forwarder is not None:
+            self.forwarded += 1
+            if timeout is None:
+                timeout = self._proxy_config().upstream_command_timeout
+            return await self._forwarder.command(msg_type, kwargs, timeout)
+        return await self._command(self.next_id(), msg_type, kwargs, timeout)
+
+    async def subscribe(
+        self,
+        msg_type: str,
+        handler: Callable[[dict], None],
+        *,
+        timeout: float | None = None,
+        **kwargs,
+    ) -> int:
+        """Start a long-lived subscription and return its id.
+
+        ``handler`` is called with the ``event`` payload of every event
+        message. It is registered before the command is sent, because HA may
+        deliver the first event right behind the result ack.
+        """
+        if self._forwarder is not None:
+            if timeout is None:
+                timeout = self._proxy_config().upstream_command_timeout
+            return await self._forwarder.subscribe(msg_type, handler, kwargs, timeout)
+        msg_id = self.next_id()
+        self._handlers[msg_id] = handler
+        try:
+            resp = await self._command(msg_id, msg_type, kwargs, timeout)
+        except BaseException:
+            self._handlers.pop(msg_id, None)
+            raise
+        if not resp.get("success", True):
+            self._handlers.pop(msg_id, None)
+            raise ConnectionError(f"HA subscribe failed: {resp}")
+        return msg_id
+
+    async def unsubscribe(self, subscription: int):
+        if self._forwarder is not None:
+            await self._forwarder.unsubscribe(subscription)
+            return
+        self._handlers.pop(subscription, None)
+        if self.connection is not None:
+            await self.command("unsubscribe_events", subscription=subscription)
+
+    async def _command(
+        self,
+        msg_id: int,
+        msg_type: str,
+        kwargs: dict,
+        timeout: float | None,
+    ) -> dict:
+        if self.connection is None:
+            raise ConnectionError("Not connected to HA")
+        config = self._proxy_config()
+        if timeout is None:
+            timeout = config.upstream_command_timeout
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(config.upstream_max_inflight)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if self._slots.locked():
+            try:
+                # Waiting for a slot counts against the command's timeout
+                await asyncio.wait_for(self._slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+        else:
+            await self._slots.acquire()
+        try:
+            connection = self.connection
+            if connection is None:
+                raise ConnectionError("Not connected to HA")
+            fut = loop.create_future()
+            self._pending[msg_id] = fut
+            self.commands += 1
+            self.peak_inflight = max(self.peak_inflight, len(self._pending))
+            await connection.send(codec.dumps({"id": msg_id, "type": msg_type, **kwargs}))
+            return await asyncio.wait_for(fut, max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"HA command {msg_type} timed out after {timeout}s")
+            raise
+        finally:
+            self._pending.pop(msg_id, None)
+            self._slots.release()
+
+    async def _listen(self, ws):
+        """Single reader: routes results to pending futures and events to
+        subscription handlers."""
+        try:
+            async for raw in ws:
+                msg = codec.loads(raw)
+                msg_id = msg.get("id")
+
+                if msg.get("type") == "event":
+                    handler = self._handlers.get(msg_id)
+                    if handler is not None:
+                        try:
+                            handler(msg.get("event") or {})
+                        except Exception as e:
+                            logger.error(f"HA event handler error: {e}")
+                    continue
+
+                fut = self._pending.get(msg_id)
+                if fut is not None and not fut.done():
+                    fut.set_result(msg)
+        except Exception as e:
+            logger.error(f"HA WebSocket listener error: {e}")
+        finally:
+            self._teardown(ws)
+
+    def _teardown(self, ws):
+        # A replacement connection may already be live; only tear down our own.
+        if self.connection is not ws and self.connection is not None:
+            return
+        was_connected = self.connection is not None
+        self.connection = None
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.cancel()
+        self._pending.clear()
+        self._handlers.clear()
+        if was_connected:
+            self._notify_disconnected()
+
+    def _notify_disconnected(self):
+        for callback in self._disconnect_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"HA disconnect listener error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "inflight": len(self._pending),
+            "peak_inflight": self.peak_inflight,
+            "commands": self.commands,
+            "timeouts": self.timeouts,
+            "subscriptions": len(self._handlers),
+            "forwarded": self.forwarded,
+        }
+
+
+ha_gateway = HAGateway()
+
+
+async def require_ha():
+    """Connect ``ha_gateway`` for a REST route, mapping failures to HTTP errors."""
+    try:
+        await ha_gateway.connect()
+    except HATokenMissing:
+        raise HTTPException(status_code=400, detail="No HA token configured")
+    except HAAuthError as e:
+        logger.error(f"HA auth failed: {e}")
+        raise HTTPException(status_code=401, detail=str(e))
+    except (ConnectionError, OSError) as e:
+        raise HTTPException(status_code=502, detail=f"HA unreachable: {e}")
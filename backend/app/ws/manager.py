@@ -1,38 +1,595 @@
 import asyncio
-import json
+import itertools
 import logging
-from fastapi import WebSocket
+import time
+from collections import OrderedDict, deque
+from typing import Iterable
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app import codec
+from app.config.models import AttributeProjection, ProxyConfig
+from app.ws.projection import AttributeProjector
+from app.ws.state_mirror import diff_states
+from app.ws.transport import WIRE_EXTENSION
+
+try:
+    import msgpack
+except ImportError:  # optional: binary framing for clients that ask for it
+    msgpack = None
 
 logger = logging.getLogger(__name__)
 
+# Sec-WebSocket-Protocol a client offers to receive MessagePack binary frames
+MSGPACK_SUBPROTOCOL = "das-home.msgpack"
+
+
+class ClientChannel:
+    """Bounded outbound queue plus writer task for one browser client.
+
+    Events are queued without awaiting the socket, so a stalled client
+    never blocks the HA reader or other clients. Only events count against
+    ``max_size``; direct replies (``states_result`` etc.) are always queued.
+    The ``policy`` decides what happens under backlog:
+
+    - ``drop_oldest``: when full, discard the oldest queued event
+    - ``coalesce``: a queued event for the same entity is replaced in place;
+      when full with a new entity, discard the oldest event
+    - ``disconnect``: when full, refuse the event and drop the client
+
+    Clients that opt into ``delta_states`` get ``state_delta`` messages
+    instead of full ``state_changed`` ones. Deltas are computed at send time
+    against the last state actually written to this client, so dropped or
+    coalesced events never desynchronise it. ``states_result`` replies reset
+    that baseline.
+
+    Heartbeats: the manager periodically queues ``{"type": "heartbeat",
+    "n"}``; the client answers ``{"type": "heartbeat_ack", "n"}``. The
+    round trip includes time spent in this queue, so a backed-up client
+    shows up as slow, which is what it is.
+
+    ``encoding`` is ``"json"`` (text frames) or ``"msgpack"`` (binary
+    frames, for clients that negotiated :data:`MSGPACK_SUBPROTOCOL`).
+    ``bytes_sent`` counts payload bytes before permessage-deflate and
+    ``encode_seconds`` the CPU time spent encoding for this client; the
+    compressed size is in the ``das_home.wire`` scope extension when uvicorn
+    runs with :class:`app.ws.transport.DeflateWebSocketProtocol`.
+    """
+
+    def __init__(self, ws: WebSocket, max_size: int, policy: str, encoding: str = "json"):
+        self.ws = ws
+        self.max_size = max_size
+        self.policy = policy
+        self.encoding = encoding
+        # key -> (is_event, message, text); insertion order is send order
+        self._items: OrderedDict[object, tuple[bool, dict, str]] = OrderedDict()
+        self._event_count = 0
+        self._keys = itertools.count()
+        self._wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.delta_states = False
+        self._sent_states: dict[str, dict] = {}
+        self.bytes_sent = 0
+        self.encode_seconds = 0.0
+        self.wire = getattr(ws, "scope", {}).get("extensions", {}).get(WIRE_EXTENSION)
+        # Per-client attribute projection; None uses the configured rules
+        self.projection: list[AttributeProjection] | bool | None = None
+        self.projector: AttributeProjector | None = None
+        # heartbeat n -> monotonic send time, for the ones not yet answered
+        self.pings: dict[int, float] = {}
+        self.last_pong: float | None = None
+        self.rtts: deque[float] = deque(maxlen=64)
+
+    def set_delta_states(self, enabled: bool):
+        self.delta_states = enabled
+        self._sent_states = {}
+
+    @property
+    def queued(self) -> int:
+        return len(self._items)
+
+    def put_control(self, message: dict, text: str):
+        self._items[("ctl", next(self._keys))] = (False, message, text)
+        self._wakeup.set()
+
+    def put_event(self, entity_id: str | None, message: dict, text: str) -> bool:
+        """Queue an event. Returns False if the client must be disconnected."""
+        if self.policy == "coalesce" and entity_id is not None:
+            key: object = ("entity", entity_id)
+            if key in self._items:
+                self._items[key] = (True, message, text)
+                self.coalesced += 1
+                return True
+        else:
+            key = ("evt", next(self._keys))
+
+        if self._event_count >= self.max_size:
+            if self.policy == "disconnect":
+                return False
+            self._drop_oldest_event()
+
+        self._items[key] = (True, message, text)
+        self._event_count += 1
+        self._wakeup.set()
+        return True
+
+    def _drop_oldest_event(self):
+        for key, (is_event, _message, _text) in self._items.items():
+            if is_event:
+                del self._items[key]
+                self._event_count -= 1
+                self.dropped += 1
+                return
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._items:
+                _key, (is_event, message, text) = self._items.popitem(last=False)
+                if is_event:
+                    self._event_count -= 1
+                started = time.perf_counter()
+                if self.delta_states:
+                    message, text = self._apply_delta(message, text)
+                if self.encoding == "msgpack":
+                    payload = msgpack.packb(message)
+                    self.encode_seconds += time.perf_counter() - started
+                    await self.ws.send_bytes(payload)
+                    self.bytes_sent += len(payload)
+                else:
+                    if text is None:
+                        text = codec.dumps(message)
+                    self.encode_seconds += time.perf_counter() - started
+                    await self.ws.send_text(text)
+                    # isascii() is O(1) on str; encode only when it isn't
+                    self.bytes_sent += len(text) if text.isascii() else len(text.encode())
+                self.sent += 1
+
+    def _apply_delta(self, message: dict, text: str) -> tuple[dict, str | None]:
+        """The message to send instead; ``None`` text means it needs encoding."""
+        msg_type = message.get("type")
+        if msg_type == "states_result":
+            self._sent_states = {
+                s["entity_id"]: s for s in message.get("result") or [] if s.get("entity_id")
+            }
+            return message, text
+        if msg_type == "states_batch":
+            return {
+                "type": "states_batch",
+                "events": [self._delta_for(event) for event in message["events"]],
+            }, None
+        if msg_type != "state_changed":
+            return message, text
+        return self._delta_for(message), None
+
+    def _delta_for(self, message: dict) -> dict:
+        entity_id = message.get("entity_id")
+        new_state = message.get("new_state")
+        base = self._sent_states.get(entity_id)
+        if new_state is None:
+            self._sent_states.pop(entity_id, None)
+            delta = {"type": "state_changed", "entity_id": entity_id, "new_state": None}
+        else:
+            self._sent_states[entity_id] = new_state
+            if base is None:
+                delta = {"type": "state_changed", "entity_id": entity_id, "new_state": new_state}
+            else:
+                delta = diff_states(base, new_state)
+        if "seq" in message:
+            delta["seq"] = message["seq"]
+        return delta
+
+    def stats(self) -> dict:
+        stats = {
+            "queued": self.queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "encoding": self.encoding,
+            "delta_states": self.delta_states,
+            "projection": "custom" if self.projector is not None else "default",
+            "rtt_ms": percentiles_ms(self.rtts),
+            "last_pong_age": (
+                round(time.monotonic() - self.last_pong, 1) if self.last_pong is not None else None
+            ),
+            "bytes_sent": self.bytes_sent,
+            "encode_ms": round(self.encode_seconds * 1000, 3),
+        }
+        if self.wire is not None:
+            stats["wire_bytes"] = self.wire.bytes_sent
+            stats["wire_frames"] = self.wire.frames
+            stats["deflate"] = self.wire.deflate
+        return stats
+
+
+def percentiles_ms(seconds: Iterable[float]) -> dict | None:
+    """p50/p95/p99 (nearest rank) of round-trip times, in milliseconds."""
+    ordered = sorted(seconds)
+    if not ordered:
+        return None
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "samples": len(ordered)}
+
 
 class ConnectionManager:
-    def __init__(self):
+    """Tracks browser clients and fans out HA events to them.
+
+    Clients start unfiltered and receive every event. Once a client
+    subscribes to a set of entity_ids it is moved into the entity index and
+    only receives events for those entities, so per-event work scales with
+    the number of interested clients rather than all clients.
+
+    Every client gets its own :class:`ClientChannel`; ``broadcast`` and
+    ``send`` only enqueue and never await a socket.
+
+    A heartbeat task pings every client each ``heartbeat_interval``. A
+    client that has answered before but then stays silent for
+    ``heartbeat_timeout`` (a sleeping tablet's half-open TCP connection)
+    is evicted. Clients that never answer, such as older frontends, are
+    left to the server's protocol-level pings.
+    """
+
+    def __init__(self, config: ProxyConfig | None = None):
         self.clients: list[WebSocket] = []
+        self._config = config
+        self._channels: dict[WebSocket, ClientChannel] = {}
+        self._unfiltered: set[WebSocket] = set()
+        self._subscriptions: dict[WebSocket, frozenset[str]] = {}
+        self._entity_index: dict[str, set[WebSocket]] = {}
         self._ha_ws = None
         self._ha_task: asyncio.Task | None = None
         self._msg_id = 0
+        # Totals survive client disconnects
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_disconnects = 0
+        self.bytes_sent = 0
+        # JSON shared by all recipients of a message is encoded here once
+        self.encode_seconds = 0.0
+        self.projected = 0
+        self._projection_rules: list[AttributeProjection] | None = None
+        self._projector = AttributeProjector([])
+        self._heartbeat_task: asyncio.Task | None = None
+        # Pending closes of evicted clients, referenced until they finish
+        self._close_tasks: set[asyncio.Task] = set()
+        self._heartbeat_n = 0
+        self.evicted = 0
+
+    def _proxy_config(self) -> ProxyConfig:
+        if self._config is not None:
+            return self._config
+        from app.config import config_manager
+        return config_manager.load_app_config().proxy
 
     async def connect_client(self, ws: WebSocket):
-        await ws.accept()
+        offered = getattr(ws, "scope", {}).get("subprotocols") or ()
+        if msgpack is not None and MSGPACK_SUBPROTOCOL in offered:
+            encoding = "msgpack"
+            await ws.accept(subprotocol=MSGPACK_SUBPROTOCOL)
+        else:
+            # Not accepting the subprotocol tells the client to expect JSON
+            encoding = "json"
+            await ws.accept()
+        config = self._proxy_config()
+        channel = ClientChannel(ws, config.send_queue_size, config.slow_consumer_policy, encoding)
+        channel.task = asyncio.create_task(self._write_loop(channel))
+        self._channels[ws] = channel
         self.clients.append(ws)
+        self._unfiltered.add(ws)
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
         logger.info(f"Client connected. Total: {len(self.clients)}")
 
     def disconnect_client(self, ws: WebSocket):
         if ws in self.clients:
             self.clients.remove(ws)
+        self._unfiltered.discard(ws)
+        self._drop_subscription(ws)
+        channel = self._channels.pop(ws, None)
+        if channel is not None:
+            self.dropped += channel.dropped
+            self.coalesced += channel.coalesced
+            self.bytes_sent += channel.bytes_sent
+            self.encode_seconds += channel.encode_seconds
+            if channel.projector is not None:
+                self.projected += channel.projector.projected
+            if channel.task is not None and channel.task is not asyncio.current_task():
+                channel.task.cancel()
+        if not self.clients and self._heartbeat_task is not None:
+            if self._heartbeat_task is not asyncio.current_task():
+                self._heartbeat_task.cancel()
+            self._heartbeat_task = None
         logger.info(f"Client disconnected. Total: {len(self.clients)}")
 
-    async def broadcast(self, message: dict):
-        data = json.dumps(message)
-        disconnected = []
-        for client in self.clients:
-            try:
-                await client.send_text(data)
-            except Exception:
-                disconnected.append(client)
-        for client in disconnected:
-            self.disconnect_client(client)
+    async def _write_loop(self, channel: ClientChannel):
+        try:
+            await channel.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Client send failed: {e}")
+            self.disconnect_client(channel.ws)
+
+    def subscribe(self, ws: WebSocket, entity_ids: Iterable[str]) -> int:
+        """Limit ``ws`` to events for ``entity_ids``. Returns the count."""
+        self._drop_subscription(ws)
+        wanted = frozenset(e for e in entity_ids if e)
+        self._subscriptions[ws] = wanted
+        self._unfiltered.discard(ws)
+        for entity_id in wanted:
+            self._entity_index.setdefault(entity_id, set()).add(ws)
+        return len(wanted)
+
+    def unsubscribe(self, ws: WebSocket):
+        """Return ``ws`` to receiving every event."""
+        self._drop_subscription(ws)
+        if ws in self.clients:
+            self._unfiltered.add(ws)
+
+    def subscription(self, ws: WebSocket) -> frozenset[str] | None:
+        """The entity_ids ``ws`` subscribed to, or ``None`` if unfiltered."""
+        return self._subscriptions.get(ws)
+
+    def _drop_subscription(self, ws: WebSocket):
+        previous = self._subscriptions.pop(ws, None)
+        if not previous:
+            return
+        for entity_id in previous:
+            interested = self._entity_index.get(entity_id)
+            if interested is None:
+                continue
+            interested.discard(ws)
+            if not interested:
+                del self._entity_index[entity_id]
+
+    def _recipients(self, entity_id: str | None) -> list[WebSocket]:
+        if entity_id is None:
+            return list(self.clients)
+        interested = self._entity_index.get(entity_id)
+        if not interested:
+            return list(self._unfiltered)
+        return [*self._unfiltered, *interested]
+
+    def broadcast(self, message: dict):
+        """Queue ``message`` for every interested client without blocking."""
+        entity_id = message.get("entity_id")
+        recipients = self._recipients(entity_id)
+        if not recipients:
+            return
+        default = self._default_projector()
+        # One projection and encoding per projector; clients without
+        # overrides all share the default one
+        encoded: dict[int, tuple[dict, str]] = {}
+        for client in recipients:
+            channel = self._channels.get(client)
+            if channel is None:
+                continue
+            projector = channel.projector or default
+            if id(projector) not in encoded:
+                projected = projector.event(message)
+                encoded[id(projector)] = (projected, self._encode(projected))
+            projected, data = encoded[id(projector)]
+            if not channel.put_event(entity_id, projected, data):
+                self._disconnect_slow(client)
+
+    def broadcast_states(self, events: list[dict]):
+        """Queue ``state_changed`` events, batching them when there are several.
+
+        Each client receives one ``states_batch`` frame holding only the
+        events it is subscribed to; a lone event goes out as a plain
+        ``state_changed`` message.
+        """
+        if len(events) == 1:
+            self.broadcast(events[0])
+            return
+
+        default = self._default_projector()
+        shared: dict[int, tuple[dict, str]] = {}
+        for client in list(self.clients):
+            channel = self._channels.get(client)
+            if channel is None:
+                continue
+            wanted = self._subscriptions.get(client)
+            if wanted is None:
+                subset = events
+            else:
+                subset = [e for e in events if e.get("entity_id") in wanted]
+                if not subset:
+                    continue
+            projector = channel.projector or default
+            if len(subset) == 1:
+                message = projector.event(subset[0])
+                data = self._encode(message)
+                entity_id = message.get("entity_id")
+            else:
+                if subset is events:
+                    if id(projector) not in shared:
+                        batch = {"type": "states_batch", "events": projector.events(events)}
+                        shared[id(projector)] = (batch, self._encode(batch))
+                    message, data = shared[id(projector)]
+                else:
+                    message = {"type": "states_batch", "events": projector.events(subset)}
+                    data = self._encode(message)
+                entity_id = None
+            if not channel.put_event(entity_id, message, data):
+                self._disconnect_slow(client)
+
+    async def receive(self, ws: WebSocket) -> dict:
+        """Next message from ``ws``: JSON text, or MessagePack in a binary frame."""
+        message = await ws.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        if message.get("bytes") is not None:
+            if msgpack is None:
+                raise ValueError("Binary frames need the optional msgpack package")
+            return msgpack.unpackb(message["bytes"])
+        return codec.loads(message["text"])
+
+    def _encode(self, message: dict) -> str:
+        started = time.perf_counter()
+        data = codec.dumps(message)
+        self.encode_seconds += time.perf_counter() - started
+        return data
+
+    def notify(self, message: dict):
+        """Queue a control message for every client; never dropped."""
+        data = self._encode(message)
+        for channel in self._channels.values():
+            channel.put_control(message, data)
+
+    def send(self, ws: WebSocket, message: dict):
+        """Queue a direct reply to one client, behind its pending events."""
+        channel = self._channels.get(ws)
+        if channel is not None:
+            channel.put_control(message, self._encode(message))
+
+    def set_delta_states(self, ws: WebSocket, enabled: bool):
+        """Switch ``ws`` between full ``state_changed`` and ``state_delta`` updates."""
+        channel = self._channels.get(ws)
+        if channel is not None:
+            channel.set_delta_states(enabled)
+
+    async def _heartbeat_loop(self):
+        while self.clients:
+            interval = self._proxy_config().heartbeat_interval
+            if interval <= 0:
+                # Disabled; check again later in case the config changes
+                await asyncio.sleep(60)
+                continue
+            await asyncio.sleep(interval)
+            self.heartbeat()
+
+    def heartbeat(self):
+        """Evict clients that stopped answering, then ping the rest."""
+        timeout = self._proxy_config().heartbeat_timeout
+        now = time.monotonic()
+        for ws, channel in list(self._channels.items()):
+            if channel.last_pong is not None and now - channel.last_pong > timeout:
+                self.evicted += 1
+                silent = now - channel.last_pong
+                logger.warning(f"Evicting client: no heartbeat answer for {silent:.0f}s")
+                self.disconnect_client(ws)
+                self._close_in_background(ws, code=1001)
+        self._heartbeat_n += 1
+        message = {"type": "heartbeat", "n": self._heartbeat_n}
+        data = self._encode(message)
+        for channel in self._channels.values():
+            # Unanswered pings older than the deadline will never count
+            for n, sent in list(channel.pings.items()):
+                if now - sent > timeout:
+                    del channel.pings[n]
+            channel.pings[self._heartbeat_n] = now
+            channel.put_control(message, data)
+
+    def heartbeat_ack(self, ws: WebSocket, n):
+        """Record a client's answer to heartbeat ``n``."""
+        channel = self._channels.get(ws)
+        if channel is None:
+            return
+        sent = channel.pings.pop(n, None)
+        now = time.monotonic()
+        channel.last_pong = now
+        if sent is not None:
+            channel.rtts.append(now - sent)
+
+    def live_clients(self) -> int:
+        """Clients that answered a heartbeat within the deadline."""
+        timeout = self._proxy_config().heartbeat_timeout
+        now = time.monotonic()
+        return sum(
+            1 for c in self._channels.values()
+            if c.last_pong is not None and now - c.last_pong <= timeout
+        )
+
+    def _default_projector(self) -> AttributeProjector:
+        rules = self._proxy_config().attribute_projection
+        if rules is not self._projection_rules:
+            self._projection_rules = rules
+            self.projected += self._projector.projected
+            self._projector = AttributeProjector(rules)
+            # Client overrides fall back to the new configured rules
+            for channel in self._channels.values():
+                if channel.projection is not None:
+                    self._build_projector(channel)
+        return self._projector
+
+    def _build_projector(self, channel: ClientChannel):
+        if channel.projector is not None:
+            self.projected += channel.projector.projected
+        if channel.projection is None:
+            channel.projector = None
+        elif channel.projection is False:
+            channel.projector = AttributeProjector([])
+        else:
+            channel.projector = AttributeProjector(channel.projection, self._projector)
+
+    def projector(self, ws: WebSocket | None = None) -> AttributeProjector:
+        """The attribute projection that applies to ``ws`` (default: configured)."""
+        default = self._default_projector()
+        channel = self._channels.get(ws)
+        if channel is None or channel.projector is None:
+            return default
+        return channel.projector
+
+    def set_projection(self, ws: WebSocket, rules: list[AttributeProjection] | bool | None):
+        """Override attribute projection for ``ws``.
+
+        ``rules`` are layered over the configured ones; ``False`` sends full
+        attributes; ``None`` returns to the configured rules.
+        """
+        channel = self._channels.get(ws)
+        if channel is None:
+            return
+        self._default_projector()
+        channel.projection = rules
+        self._build_projector(channel)
+
+    def _disconnect_slow(self, ws: WebSocket):
+        self.slow_disconnects += 1
+        logger.warning("Disconnecting slow client: send queue full")
+        self.disconnect_client(ws)
+        self._close_in_background(ws)
+
+    def _close_in_background(self, ws: WebSocket, code: int = 1013):
+        task = asyncio.create_task(self._close_quietly(ws, code=code))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+
+    @staticmethod
+    async def _close_quietly(ws: WebSocket, code: int = 1013):
+        try:
+            await ws.close(code=code)
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        channels = list(self._channels.values())
+        return {
+            "clients": len(self.clients),
+            "subscribed_clients": len(self._subscriptions),
+            "dropped": self.dropped + sum(c.dropped for c in channels),
+            "coalesced": self.coalesced + sum(c.coalesced for c in channels),
+            "slow_disconnects": self.slow_disconnects,
+            "live_clients": self.live_clients(),
+            "heartbeat_evictions": self.evicted,
+            "rtt_ms": percentiles_ms(itertools.chain.from_iterable(c.rtts for c in channels)),
+            "queued": sum(c.queued for c in channels),
+            "bytes_sent": self.bytes_sent + sum(c.bytes_sent for c in channels),
+            "encode_ms": round(
+                (self.encode_seconds + sum(c.encode_seconds for c in channels)) * 1000, 3
+            ),
+            "projected_states": self.projected + self._projector.projected + sum(
+                c.projector.projected for c in channels if c.projector is not None
+            ),
+            "connections": [c.stats() for c in channels],
+        }
 
     def next_id(self) -> int:
         self._msg_id += 1
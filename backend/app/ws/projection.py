@@ -0,0 +1,119 @@
+"""Attribute projection: trim heavy attributes before states reach clients.
+
+Some entities carry attributes no card reads but every update repeats, such
+as ``source_list`` and queue data on media players, ``forecast`` arrays on
+legacy weather entities and long ``options`` on ``select``. An
+``AttributeProjection`` rule keeps only the ``include``d attributes of
+matching entities, or drops the ``exclude``d ones.
+
+Rules come from ``ProxyConfig.attribute_projection``; a client can layer its
+own on top with ``set_options``. For each entity, a client rule beats a
+configured one, and within each layer an ``entity_id`` rule beats a
+``domain`` rule. A rule with neither list passes the entity through
+untouched, so a client can undo a configured rule for a domain.
+
+Only what is sent is trimmed: the state mirror and replay buffer keep full
+states.
+"""
+from __future__ import annotations
+
+from app.config.models import AttributeProjection
+
+# (include, exclude); include=None keeps everything not excluded
+_Rule = tuple[frozenset[str] | None, frozenset[str]]
+
+
+class AttributeProjector:
+    """Resolves and applies projection rules, caching the rule per entity."""
+
+    def __init__(
+        self,
+        rules: list[AttributeProjection],
+        fallback: AttributeProjector | None = None,
+    ):
+        self._by_entity: dict[str, _Rule | None] = {}
+        self._by_domain: dict[str, _Rule | None] = {}
+        for rule in rules:
+            compiled = _compile(rule)
+            if rule.entity_id:
+                self._by_entity[rule.entity_id] = compiled
+            elif rule.domain:
+                self._by_domain[rule.domain] = compiled
+        self._fallback = fallback
+        self._cache: dict[str, _Rule | None] = {}
+        self.projected = 0
+
+    @property
+    def passthrough(self) -> bool:
+        """True if no rule can ever change a state."""
+        return not self._by_entity and not self._by_domain and (
+            self._fallback is None or self._fallback.passthrough
+        )
+
+    def rule_for(self, entity_id: str) -> _Rule | None:
+        try:
+            return self._cache[entity_id]
+        except KeyError:
+            pass
+        if entity_id in self._by_entity:
+            rule = self._by_entity[entity_id]
+        else:
+            domain = entity_id.split(".", 1)[0]
+            if domain in self._by_domain:
+                rule = self._by_domain[domain]
+            elif self._fallback is not None:
+                rule = self._fallback.rule_for(entity_id)
+            else:
+                rule = None
+        self._cache[entity_id] = rule
+        return rule
+
+    def state(self, state: dict | None) -> dict | None:
+        """``state`` with its attributes trimmed; the same object if unchanged."""
+        if not state:
+            return state
+        attributes = state.get("attributes")
+        if not attributes:
+            return state
+        rule = self.rule_for(state.get("entity_id") or "")
+        if rule is None:
+            return state
+        include, exclude = rule
+        if include is not None:
+            kept = {k: v for k, v in attributes.items() if k in include and k not in exclude}
+        else:
+            kept = {k: v for k, v in attributes.items() if k not in exclude}
+        if len(kept) == len(attributes):
+            return state
+        self.projected += 1
+        return {**state, "attributes": kept}
+
+    def states(self, states: list[dict]) -> list[dict]:
+        if self.passthrough:
+            return states
+        return [self.state(s) for s in states]
+
+    def event(self, message: dict) -> dict:
+        """A ``state_changed`` message with both states trimmed."""
+        if self.passthrough or message.get("type") != "state_changed":
+            return message
+        new_state = self.state(message.get("new_state"))
+        old_state = self.state(message.get("old_state"))
+        if new_state is message.get("new_state") and old_state is message.get("old_state"):
+            return message
+        projected = {**message, "new_state": new_state}
+        if "old_state" in message:
+            projected["old_state"] = old_state
+        return projected
+
+    def events(self, events: list[dict]) -> list[dict]:
+        if self.passthrough:
+            return events
+        return [self.event(e) for e in events]
+
+
+def _compile(rule: AttributeProjection) -> _Rule | None:
+    if rule.include is None and not rule.exclude:
+        return None
+    include = frozenset(rule.include) if rule.include is not None else None
+    return include, frozenset(rule.exclude)
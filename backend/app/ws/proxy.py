@@ -1,23 +1,73 @@
 import asyncio
-import json
 import logging
+import random
+import time
+from collections import deque
+from typing import Iterable
 
-import websockets
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-
-from app.ws.manager import ws_manager
+from pydantic import BaseModel
+
+from app import codec
+from app.ws.bulk import run_bulk
+from app.ws.cluster import WorkerCluster
+from app.ws.coalescer import StateCoalescer
+from app.ws.forecasts import ForecastCache
+from app.ws.gateway import ha_gateway, require_ha
+from app.ws.manager import percentiles_ms, ws_manager
+from app.ws.replay import ReplayBuffer
+from app.ws.snapshot import StateSnapshotStore
+from app.ws.state_mirror import StateMirror
 from app.config import config_manager
+from app.config.models import AttributeProjection
+from app.settings import settings
+from app.services.views import build_entity_area_map, collect_view_entities
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-_ha_connection = None
-_ha_listen_task = None
 _subscribed = False
 _connect_lock: asyncio.Lock | None = None
-_pending: dict[int, asyncio.Future] = {}
-_pending_queues: dict[int, asyncio.Queue] = {}
-_msg_counter = 0
+_state_mirror = StateMirror()
+_snapshot_received: asyncio.Event | None = None
+_replay = ReplayBuffer(lambda: config_manager.load_app_config().proxy.replay_buffer_size)
+_coalescer = StateCoalescer(
+    lambda events: _broadcast_states(_replay.record(events)),
+    lambda: config_manager.load_app_config().proxy.coalesce_rules,
+)
+_entity_area_map: dict[str, str] | None = None
+_forecasts = ForecastCache(
+    lambda entity_id, forecast_type, handler: ha_gateway.subscribe(
+        "weather/subscribe_forecast", handler,
+        entity_id=entity_id, forecast_type=forecast_type,
+    ),
+    lambda ws, message: ws_manager.send(ws, message),
+)
+_cluster = WorkerCluster(ha_gateway)
+_snapshots = StateSnapshotStore(lambda: settings.data_dir / "state_snapshot.json.gz")
+_snapshot_task: asyncio.Task | None = None
+# Fire-and-forget tasks; referenced here so they aren't garbage collected
+_background_tasks: set[asyncio.Task] = set()
+
+# Reconnect supervisor: jittered exponential backoff between attempts
+_RECONNECT_BACKOFF_INITIAL = 1.0
+_RECONNECT_BACKOFF_MAX = 60.0
+_supervisor_task: asyncio.Task | None = None
+_connect_task: asyncio.Task | None = None
+_upstream_stats = {
+    "reconnects": 0,
+    "failed_attempts": 0,
+    "down_since": None,  # monotonic timestamp while disconnected
+    "last_downtime_seconds": None,
+    "total_downtime_seconds": 0.0,
+}
+
+# call_service coalescing: calls sent to HA and calls replaced by a newer one
+_service_call_stats = {"sent": 0, "coalesced": 0}
+# Seconds from receiving the value actually sent until HA confirmed it, and
+# from the first call of a coalesced burst until its final value was confirmed
+_settle_latency: deque[float] = deque(maxlen=256)
+_burst_latency: deque[float] = deque(maxlen=256)
 
 
 def _get_lock() -> asyncio.Lock:
@@ -27,247 +77,691 @@ def _get_lock() -> asyncio.Lock:
     return _connect_lock
 
 
-def _next_id() -> int:
-    global _msg_counter
-    _msg_counter += 1
-    return _msg_counter
-
-
-async def _get_ha_url() -> str:
-    from app.settings import settings
-    if settings.is_addon:
-        return "ws://supervisor/core/websocket"
-    config = config_manager.load_app_config()
-    url = config.connection.hass_url.rstrip("/")
-    return url.replace("http://", "ws://").replace("https://", "wss://") + "/api/websocket"
+async def _ha_send(msg_type: str, **kwargs) -> dict:
+    """Send a command to HA over the shared gateway and wait for its response."""
+    return await ha_gateway.command(msg_type, **kwargs)
 
 
-async def _get_ha_token() -> str:
-    from app.settings import settings
-    if settings.is_addon:
-        return settings.supervisor_token
-    return settings.hass_token
+async def _ensure_ha_connection():
+    global _subscribed
 
+    async with _get_lock():
+        # Elects this worker's role first in multi-worker mode
+        await ha_gateway.connect()
 
-async def _ha_send(msg_type: str, **kwargs) -> dict:
-    """Send a command to HA and wait for its response via the listener."""
-    if _ha_connection is None:
-        raise ConnectionError("Not connected to HA")
+        if not _subscribed:
+            if _cluster.role == "follower":
+                await _follow_owner()
+            else:
+                await _subscribe_entities()
+            _subscribed = True
+            _forecasts.resubscribe()
 
-    msg_id = _next_id()
-    fut = asyncio.get_event_loop().create_future()
-    _pending[msg_id] = fut
+    _start_supervisor()
+    _start_snapshot_writer()
 
-    payload = {"id": msg_id, "type": msg_type, **kwargs}
-    await _ha_connection.send(json.dumps(payload))
 
+async def _subscribe_entities():
+    """Subscribe to compressed entity updates. The first event is a full
+    snapshot that (re)seeds the state mirror; wait for it so get_states
+    right after connecting is already served locally."""
+    snapshot = _get_snapshot_event()
+    snapshot.clear()
+    _state_mirror.begin_resync()
+    await ha_gateway.subscribe("subscribe_entities", _on_entities_event)
     try:
-        return await asyncio.wait_for(fut, timeout=30.0)
-    finally:
-        _pending.pop(msg_id, None)
-
-
-async def _ha_subscribe_once(msg_type: str, **kwargs) -> dict:
-    """Subscribe to HA, wait for the first event, then unsubscribe.
+        await asyncio.wait_for(snapshot.wait(), timeout=10.0)
+    except asyncio.TimeoutError:
+        logger.warning("No initial subscribe_entities snapshot from HA")
+
+
+def _on_upstream_lost():
+    """Gateway callback: the HA connection is gone, so are its subscriptions."""
+    global _subscribed, _entity_area_map
+    area_map = _entity_area_map
+    _subscribed = False
+    _entity_area_map = None
+    _coalescer.flush()
+    if _state_mirror.ready and _cluster.role != "follower":
+        # Keep the states as of the outage for clients that connect during it
+        task = asyncio.create_task(
+            _snapshots.save(_state_mirror.all(), _replay.seq, area_map)
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    _state_mirror.invalidate()
+    _forecasts.reset()
+    if _cluster.enabled and _cluster.role is None:
+        # Lost the owner worker; whoever owns next numbers events afresh.
+        _replay.restart()
+
+
+ha_gateway.add_disconnect_listener(_on_upstream_lost)
+
+
+# ---------- Multi-worker mode (see ws/cluster.py) ----------
+
+
+def _broadcast_states(events: list[dict]):
+    ws_manager.broadcast_states(events)
+    _cluster.publish({"op": "events", "events": events})
+
+
+def _notify(message: dict):
+    ws_manager.notify(message)
+    _cluster.publish({"op": "notify", "message": message})
+
+
+def _owner_snapshot() -> dict:
+    return {
+        "op": "snapshot",
+        "epoch": _replay.epoch,
+        "seq": _replay.seq,
+        "states": _state_mirror.all() if _state_mirror.ready else None,
+    }
+
+
+async def _follow_owner():
+    """Follower: get the owner's mirror snapshot, then its event stream."""
+    snapshot = _get_snapshot_event()
+    snapshot.clear()
+    await _cluster.request("follow", timeout=30.0)
+    # The snapshot frame precedes the reply, so it has been applied already.
+    if not snapshot.is_set():
+        logger.warning("Owner worker sent no state snapshot")
+
+
+def _on_owner_message(msg: dict):
+    """Follower: apply what the owner worker published."""
+    op = msg.get("op")
+    if op == "events":
+        events = msg.get("events") or []
+        _replay.extend(events)
+        for event in events:
+            _state_mirror.apply(event.get("entity_id"), event.get("new_state"))
+        ws_manager.broadcast_states(events)
+    elif op == "notify":
+        ws_manager.notify(msg.get("message") or {})
+    elif op == "snapshot":
+        _replay.adopt(msg["epoch"], msg["seq"])
+        if msg.get("states") is None:
+            _state_mirror.invalidate()
+            return
+        changes = _state_mirror.seed(msg["states"])
+        if changes:
+            ws_manager.broadcast_states([
+                {"type": "state_changed", "entity_id": eid, "new_state": new, "old_state": old}
+                for eid, old, new in changes
+            ])
+        _get_snapshot_event().set()
+
+
+_cluster.ensure_upstream = _ensure_ha_connection
+ha_gateway.elect = _cluster.ensure_started
+_cluster.snapshot = _owner_snapshot
+_cluster.on_message = _on_owner_message
+if settings.ipc_socket:
+    _cluster.configure(settings.ipc_socket)
+
+
+def _start_snapshot_writer():
+    global _snapshot_task
+    if _snapshot_task is None or _snapshot_task.done():
+        _snapshot_task = asyncio.create_task(_write_snapshots())
+
+
+async def _write_snapshots():
+    """Persist the state mirror every ``snapshot_interval`` if it changed."""
+    while True:
+        interval = config_manager.load_app_config().proxy.snapshot_interval
+        await asyncio.sleep(interval if interval > 0 else 60)
+        if interval <= 0 or not _state_mirror.ready or _cluster.role == "follower":
+            continue
+        if _snapshots.saved_seq == _replay.seq and _snapshots.writes:
+            continue
+        await _snapshots.save(_state_mirror.all(), _replay.seq, _entity_area_map)
+
+
+def _start_supervisor():
+    """Make sure the background reconnect supervisor is running."""
+    global _supervisor_task
+    if _supervisor_task is None or _supervisor_task.done():
+        _supervisor_task = asyncio.create_task(_supervise_ha())
+
+
+def _start_connecting() -> asyncio.Task:
+    """Connect to HA in the background, for callers that may wait only briefly.
 
-    HA subscription commands (like weather/subscribe_forecast) return:
-      1. {"id": N, "type": "result", "success": true, "result": null}
-      2. {"id": N, "type": "event", "event": {"type": "...", "forecast": [...]}}
-    This function captures both and returns the event message.
+    The returned task never raises: if the attempt fails the reconnect
+    supervisor takes over the retries.
     """
-    if _ha_connection is None:
-        raise ConnectionError("Not connected to HA")
+    global _connect_task
+    if _connect_task is None or _connect_task.done():
+        _connect_task = asyncio.create_task(_connect_or_supervise())
+    return _connect_task
 
-    msg_id = _next_id()
-    q: asyncio.Queue = asyncio.Queue()
-    _pending_queues[msg_id] = q
-
-    payload = {"id": msg_id, "type": msg_type, **kwargs}
-    await _ha_connection.send(json.dumps(payload))
 
+async def _connect_or_supervise():
     try:
-        # 1) Wait for the result ack
-        result_msg = await asyncio.wait_for(q.get(), timeout=10.0)
-        if not result_msg.get("success", True):
-            raise ConnectionError(f"HA subscribe failed: {result_msg}")
-
-        # 2) Wait for the first event containing actual data
-        event_msg = await asyncio.wait_for(q.get(), timeout=10.0)
-        return event_msg
-    finally:
-        _pending_queues.pop(msg_id, None)
-        # Unsubscribe to clean up the HA subscription
-        try:
-            await _ha_send("unsubscribe_events", subscription=msg_id)
-        except Exception:
-            pass
-
-
-async def _ensure_ha_connection():
-    global _ha_connection, _ha_listen_task, _subscribed
-
-    async with _get_lock():
-        if _ha_connection is not None:
-            try:
-                await _ha_connection.ping()
-                return
-            except Exception:
-                _ha_connection = None
-                _subscribed = False
-
-        ha_url = await _get_ha_url()
-        token = await _get_ha_token()
+        await _ensure_ha_connection()
+    except Exception as e:
+        logger.warning(f"HA connection unavailable: {e}")
+        _start_supervisor()
 
-        ws = await websockets.connect(ha_url)
 
-        auth_msg = json.loads(await ws.recv())
-        if auth_msg.get("type") == "auth_required":
-            await ws.send(json.dumps({"type": "auth", "access_token": token}))
-            result = json.loads(await ws.recv())
-            if result.get("type") != "auth_ok":
-                await ws.close()
-                raise ConnectionError(f"HA auth failed: {result}")
+async def _supervise_ha():
+    """Keep the upstream HA connection alive for the lifetime of the process.
 
-        _ha_connection = ws
-        logger.info("Connected to Home Assistant WebSocket")
+    Waits for the listener to end, tells clients HA is gone, then reconnects
+    with jittered exponential backoff. ``_ensure_ha_connection`` replays the
+    subscriptions, and the fresh ``subscribe_entities`` snapshot resyncs the
+    mirror and pushes whatever changed in the meantime to clients.
+    """
+    delay = _RECONNECT_BACKOFF_INITIAL
+    while True:
+        listener = ha_gateway.listen_task
+        if ha_gateway.connected and listener is not None and not listener.done():
+            await asyncio.wait({listener})
+            continue
+
+        if _upstream_stats["down_since"] is None:
+            _upstream_stats["down_since"] = time.monotonic()
+            _notify({"type": "ha_disconnected"})
+
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        try:
+            await _ensure_ha_connection()
+        except Exception as e:
+            _upstream_stats["failed_attempts"] += 1
+            delay = min(delay * 2, _RECONNECT_BACKOFF_MAX)
+            logger.warning(f"HA reconnect failed, retrying in ~{delay:.0f}s: {e}")
+            continue
+
+        downtime = time.monotonic() - _upstream_stats["down_since"]
+        _upstream_stats["down_since"] = None
+        _upstream_stats["reconnects"] += 1
+        _upstream_stats["last_downtime_seconds"] = round(downtime, 3)
+        _upstream_stats["total_downtime_seconds"] += downtime
+        delay = _RECONNECT_BACKOFF_INITIAL
+        logger.info(f"Reconnected to HA after {downtime:.1f}s")
+        _notify({"type": "ha_reconnected", "downtime_seconds": round(downtime, 3)})
+
+
+def _upstream_status() -> dict:
+    down_since = _upstream_stats["down_since"]
+    return {
+        **ha_gateway.stats(),
+        "reconnects": _upstream_stats["reconnects"],
+        "failed_attempts": _upstream_stats["failed_attempts"],
+        "current_downtime_seconds": (
+            round(time.monotonic() - down_since, 3) if down_since is not None else None
+        ),
+        "last_downtime_seconds": _upstream_stats["last_downtime_seconds"],
+        "total_downtime_seconds": round(_upstream_stats["total_downtime_seconds"], 3),
+    }
+
+
+def _get_snapshot_event() -> asyncio.Event:
+    global _snapshot_received
+    if _snapshot_received is None:
+        _snapshot_received = asyncio.Event()
+    return _snapshot_received
+
+
+def _on_entities_event(event: dict):
+    """Apply a ``subscribe_entities`` event to the mirror and broadcast the
+    rebuilt full states in the usual ``state_changed`` shape, subject to
+    time-window coalescing."""
+    for entity_id, old_state, new_state in _state_mirror.apply_entities_event(event):
+        _coalescer.submit({
+            "type": "state_changed",
+            "entity_id": entity_id,
+            "new_state": new_state,
+            "old_state": old_state,
+        })
+    if _state_mirror.ready:
+        _get_snapshot_event().set()
+
+
+async def _get_states() -> list[dict]:
+    """Return all entity states, from the mirror when it is live.
+
+    Falls back to a direct HA round trip while the mirror is not seeded.
+    """
+    if _state_mirror.ready:
+        return _state_mirror.all()
+    resp = await _ha_send("get_states")
+    return resp.get("result") or []
+
+
+async def _get_entity_area_map() -> dict[str, str]:
+    """Return the entity -> area map, fetching the registries once per connection."""
+    global _entity_area_map
+    if _entity_area_map is None:
+        devices = (await _ha_send("config/device_registry/list")).get("result") or []
+        entities = (await _ha_send("config/entity_registry/list")).get("result") or []
+        _entity_area_map = build_entity_area_map(devices, entities)
+    return _entity_area_map
+
+
+async def _resolve_subscription(data: dict) -> set[str]:
+    """Collect the entity_ids named by a client ``subscribe`` message."""
+    entity_ids = {e for e in data.get("entity_ids") or [] if isinstance(e, str)}
+    view_id = data.get("view_id")
+    if view_id:
+        dashboard = config_manager.load_dashboard()
+        view = next((v for v in dashboard.views if v.id == view_id), None)
+        if view is None:
+            logger.warning(f"subscribe: unknown view {view_id}")
+        else:
+            area_map = await _get_entity_area_map() if ha_gateway.connected else {}
+            entity_ids |= collect_view_entities(view, area_map)
+    return entity_ids
+
+
+@router.get("/api/ws/stats")
+async def get_ws_stats():
+    """Fan-out counters (clients, queued, dropped and coalesced events),
+    upstream reconnect counts and downtime, replay buffer and forecast
+    cache counters."""
+    return {
+        **ws_manager.stats(),
+        **_coalescer.stats(),
+        "upstream": _upstream_status(),
+        "replay": _replay.stats(),
+        "cluster": _cluster.stats(),
+        "forecasts": _forecasts.stats(),
+        "snapshot": _snapshots.stats(),
+        "call_service": {
+            **_service_call_stats,
+            "settle_ms": percentiles_ms(_settle_latency),
+            "burst_ms": percentiles_ms(_burst_latency),
+        },
+    }
+
+
+def _reply(ws: WebSocket, request: dict, response: dict):
+    """Send ``response`` to ``ws``, echoing the request's correlation id."""
+    if request.get("id"):
+        response["id"] = request["id"]
+    ws_manager.send(ws, response)
+
+
+def _reply_not_connected(ws: WebSocket, request: dict):
+    """Fail a command right away while HA is down, so the client learns why."""
+    _reply(ws, request, {
+        "type": "result",
+        "success": False,
+        "result": None,
+        "error": {"code": "not_connected", "message": "Home Assistant not connected"},
+    })
+
+
+async def _handle_call_service(ws: WebSocket, data: dict):
+    if not ha_gateway.connected:
+        # Only clients that asked for correlation get a result back
+        if data.get("id"):
+            _reply_not_connected(ws, data)
+        return
+    try:
+        resp = await _ha_send(
+            "call_service",
+            domain=data.get("domain"),
+            service=data.get("service"),
+            service_data=data.get("data", {}),
+            target=data.get("target", {}),
+        )
+    except Exception as e:
+        logger.warning(f"call_service failed: {e}")
+        resp = {"success": False, "error": {"message": str(e)}}
+    # Only clients that asked for correlation get a result back
+    if data.get("id"):
+        _reply(ws, data, {
+            "type": "result",
+            "success": resp.get("success", True),
+            "result": resp.get("result"),
+            "error": resp.get("error"),
+        })
+
+
+async def _handle_get_states(ws: WebSocket, data: dict):
+    if not ha_gateway.connected:
+        if not await _reply_stale_states(ws, data):
+            _reply_not_connected(ws, data)
+        return
+    try:
+        states = await _get_states()
+        wanted = ws_manager.subscription(ws)
+        if wanted is not None:
+            states = [s for s in states if s.get("entity_id") in wanted]
+        states = ws_manager.projector(ws).states(states)
+        _reply(ws, data, {"type": "states_result", "result": states, "seq": _replay.seq})
+    except Exception as e:
+        logger.warning(f"get_states failed: {e}")
+        if not await _reply_stale_states(ws, data):
+            _reply(ws, data, {"type": "states_result", "result": []})
 
-        # Start single listener BEFORE subscribing so responses are captured
-        if _ha_listen_task is None or _ha_listen_task.done():
-            _ha_listen_task = asyncio.create_task(_listen_ha())
 
-        # Subscribe to state changes
-        if not _subscribed:
-            await _ha_send("subscribe_events", event_type="state_changed")
-            _subscribed = True
+async def _reply_stale_states(ws: WebSocket, data: dict) -> bool:
+    """Answer ``get_states`` from the on-disk snapshot, flagged ``stale``.
 
+    No ``seq``: these states predate the live stream, so a client's resume
+    point must not move. Returns False if there is no snapshot.
+    """
+    snapshot = await _snapshots.stale_states()
+    if snapshot is None:
+        return False
+    age, states = snapshot
+    wanted = ws_manager.subscription(ws)
+    if wanted is not None:
+        states = [s for s in states if s.get("entity_id") in wanted]
+    _reply(ws, data, {
+        "type": "states_result",
+        "result": ws_manager.projector(ws).states(states),
+        "stale": True,
+        "snapshot_age": round(age),
+    })
+    return True
+
+
+async def _handle_resume(ws: WebSocket, data: dict):
+    """Replay the events a reconnecting client missed since ``last_seq``.
+
+    Falls back to a full ``states_result`` snapshot when the gap is no longer
+    in the replay buffer or the client's ``epoch`` is from an earlier run.
+    """
+    missed = _replay.since(int(data.get("last_seq") or 0), data.get("epoch"))
+    if missed is None:
+        _reply(ws, data, {"type": "resume_result", "success": False, "seq": _replay.seq})
+        await _handle_get_states(ws, {})
+        return
+
+    wanted = ws_manager.subscription(ws)
+    if wanted is not None:
+        missed = [e for e in missed if e.get("entity_id") in wanted]
+    if missed:
+        missed = ws_manager.projector(ws).events(missed)
+        ws_manager.send(ws, {"type": "states_batch", "events": missed})
+    _reply(ws, data, {
+        "type": "resume_result",
+        "success": True,
+        "replayed": len(missed),
+        "seq": _replay.seq,
+    })
+
+
+async def _handle_weather_forecast(ws: WebSocket, data: dict):
+    """Answer from the shared forecast subscriptions and keep pushing
+    ``weather_forecast_update`` messages for the entity to this client."""
+    entity_id = data.get("entity_id", "weather.forecast_home")
+    _forecasts.watch(ws, entity_id)
+    hourly, daily = await asyncio.gather(
+        _forecasts.get(entity_id, "hourly"),
+        _forecasts.get(entity_id, "daily"),
+    )
+    _reply(ws, data, {
+        "type": "weather_forecast_result",
+        "entity_id": entity_id,
+        "hourly": hourly,
+        "daily": daily,
+    })
+
+
+# Commands that may wait on HA run as their own tasks so a slow one never
+# holds up the rest of the client's messages.
+async def _bulk_call_service(domain: str, service: str, data: dict, target: dict) -> dict:
+    return await _ha_send(
+        "call_service", domain=domain, service=service, service_data=data, target=target,
+    )
+
+
+async def _run_bulk(data: dict) -> dict:
+    calls = data.get("calls")
+    if not isinstance(calls, list):
+        return {"type": "bulk_result", "success": False, "calls": [],
+                "error": "calls must be a list"}
+    return await run_bulk(
+        calls,
+        _bulk_call_service,
+        config_manager.load_app_config().proxy.bulk_max_parallel,
+        merge=data.get("merge", True) is not False,
+    )
+
+
+async def _handle_call_services(ws: WebSocket, data: dict):
+    """Bulk action: ``{"type": "call_services", "calls": [...]}``."""
+    if not ha_gateway.connected:
+        _reply_not_connected(ws, data)
+        return
+    _reply(ws, data, await _run_bulk(data))
+
+
+class ServiceCall(BaseModel):
+    domain: str
+    service: str
+    data: dict | None = None
+    target: dict | None = None
+
+
+class BulkServiceCalls(BaseModel):
+    calls: list[ServiceCall]
+    merge: bool = True
+
+
+@router.post("/api/services/bulk")
+async def call_services_bulk(body: BulkServiceCalls):
+    """REST form of the ``call_services`` bulk action; same request and result."""
+    await require_ha()
+    return await _run_bulk(body.model_dump(exclude_none=True))
+
+
+_COMMAND_HANDLERS = {
+    "call_service": _handle_call_service,
+    "call_services": _handle_call_services,
+    "get_states": _handle_get_states,
+    "resume": _handle_resume,
+    "weather_forecast": _handle_weather_forecast,
+}
+
+
+# Service data keys HA also accepts as the call's target
+_DATA_TARGET_KEYS = ("entity_id", "device_id", "area_id", "floor_id", "label_id")
+
+
+class _PendingCall:
+    """A queued ``call_service`` that newer calls may still replace."""
+
+    __slots__ = ("key", "data", "first_received", "received", "replaced")
+
+    def __init__(self, key: tuple, data: dict):
+        # (service, sorted data keys): only a call with the same key replaces it
+        self.key = key
+        self.data = data
+        self.first_received = self.received = time.monotonic()
+        self.replaced = 0
+
+
+class _ClientSession:
+    """Concurrent command dispatch for one browser client.
+
+    Each command runs as a task, bounded by ``max_inflight``; once the limit
+    is reached the receive loop waits, which back-pressures the client.
+    ``call_service`` commands for the same domain and target share a lane and
+    keep their order, so "on" then "off" can't be reordered. Targets given
+    the legacy way, as ``entity_id`` etc. inside ``data``, count as target.
+
+    Slider drags send bursts of calls for services in ``coalesce_services``.
+    If the newest call queued on a lane has the same service and data keys,
+    a new one replaces its payload instead of queueing behind it (a
+    brightness value never overwrites a queued color), so once the call in
+    flight finishes only the latest value goes to HA. Replaced calls that
+    carried an ``id`` get a ``result`` with ``coalesced: true``.
+    """
 
-async def _listen_ha():
-    """Single reader for the HA websocket. Routes responses to pending futures
-    and broadcasts state_changed events to all clients."""
-    global _ha_connection, _subscribed
-    try:
-        async for raw in _ha_connection:
-            msg = json.loads(raw)
-            msg_id = msg.get("id")
-
-            # Route to subscription queues (multi-message)
-            if msg_id and msg_id in _pending_queues:
-                await _pending_queues[msg_id].put(msg)
-                continue
-
-            # Resolve pending request-response futures
-            if msg_id and msg_id in _pending:
-                _pending[msg_id].set_result(msg)
-                continue
-
-            # Broadcast state change events
-            if msg.get("type") == "event":
-                event_data = msg.get("event", {})
-                if event_data.get("event_type") == "state_changed":
-                    data = event_data.get("data", {})
-                    await ws_manager.broadcast({
-                        "type": "state_changed",
-                        "entity_id": data.get("entity_id"),
-                        "new_state": data.get("new_state"),
-                        "old_state": data.get("old_state"),
-                    })
-    except Exception as e:
-        logger.error(f"HA WebSocket listener error: {e}")
-    finally:
-        _ha_connection = None
-        _subscribed = False
-        for fut in _pending.values():
-            if not fut.done():
-                fut.cancel()
-        _pending.clear()
-        _pending_queues.clear()
+    def __init__(self, ws: WebSocket, max_inflight: int, coalesce_services: Iterable[str] = ()):
+        self.ws = ws
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._tasks: set[asyncio.Task] = set()
+        self._lanes: dict[str, asyncio.Lock] = {}
+        self._coalesce_services = frozenset(coalesce_services)
+        # lane key -> the newest call queued on it, if it may be replaced
+        self._replaceable: dict[str, _PendingCall] = {}
+
+    async def dispatch(self, data: dict):
+        handler = _COMMAND_HANDLERS[data.get("type")]
+        lane_key = self._lane_key(data)
+        pending = None
+        if lane_key is not None:
+            service = f"{data.get('domain')}.{data.get('service')}"
+            coalescable = self._coalescable(data, service)
+            key = (service, tuple(sorted(data.get("data") or {})))
+            queued = self._replaceable.get(lane_key)
+            if coalescable and queued is not None and queued.key == key:
+                self._replace(queued, data)
+                return
+            if coalescable:
+                pending = self._replaceable[lane_key] = _PendingCall(key, data)
+            else:
+                # Nothing queued earlier may jump ahead of this call
+                self._replaceable.pop(lane_key, None)
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(handler, data, lane_key, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _coalescable(self, data: dict, service: str) -> bool:
+        if "coalesce" in data:
+            return bool(data["coalesce"])
+        return service in self._coalesce_services
+
+    def _replace(self, queued: _PendingCall, data: dict):
+        replaced = queued.data
+        queued.data = data
+        queued.received = time.monotonic()
+        queued.replaced += 1
+        _service_call_stats["coalesced"] += 1
+        if replaced.get("id"):
+            _reply(self.ws, replaced, {
+                "type": "result", "success": True, "result": None, "error": None,
+                "coalesced": True,
+            })
+
+    async def _run(self, handler, data: dict, lane_key: str | None, pending: _PendingCall | None):
+        try:
+            if lane_key is None:
+                await handler(self.ws, data)
+                return
+            async with self._lanes.setdefault(lane_key, asyncio.Lock()):
+                if pending is not None:
+                    # From here on the call is in flight and can't be replaced
+                    if self._replaceable.get(lane_key) is pending:
+                        del self._replaceable[lane_key]
+                    data = pending.data
+                await handler(self.ws, data)
+                _service_call_stats["sent"] += 1
+                if pending is not None:
+                    done = time.monotonic()
+                    _settle_latency.append(done - pending.received)
+                    if pending.replaced:
+                        _burst_latency.append(done - pending.first_received)
+        except Exception as e:
+            logger.error(f"{data.get('type')} handler error: {e}")
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _lane_key(data: dict) -> str | None:
+        if data.get("type") != "call_service":
+            return None
+        service_data = data.get("data") or {}
+        data_target = {key: service_data[key] for key in _DATA_TARGET_KEYS if key in service_data}
+        return codec.dumps(
+            [data.get("domain"), data.get("target") or {}, data_target], sort_keys=True
+        )
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+
+def _set_projection(ws: WebSocket, value):
+    """Apply a client's ``attribute_projection`` option.
+
+    A list of rules is layered over the configured ones, ``false`` asks
+    for full attributes and ``true`` or ``null`` restores the defaults.
+    """
+    if value is False:
+        ws_manager.set_projection(ws, False)
+    elif isinstance(value, list):
+        try:
+            rules = [AttributeProjection(**rule) for rule in value]
+        except Exception as e:
+            logger.warning(f"set_options: invalid attribute_projection: {e}")
+            return
+        ws_manager.set_projection(ws, rules)
+    else:
+        ws_manager.set_projection(ws, None)
 
 
 @router.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws_manager.connect_client(ws)
+    proxy_config = config_manager.load_app_config().proxy
+    session = _ClientSession(ws, proxy_config.max_inflight_commands, proxy_config.coalesce_services)
     try:
-        await _ensure_ha_connection()
-        await ws.send_json({"type": "connected", "ha_connected": _ha_connection is not None})
+        try:
+            await _ensure_ha_connection()
+        except Exception as e:
+            # Stay connected; the supervisor announces ha_reconnected later.
+            logger.warning(f"HA unavailable for new client: {e}")
+            _start_supervisor()
+        ws_manager.send(ws, {
+            "type": "connected",
+            "ha_connected": ha_gateway.connected,
+            "epoch": _replay.epoch,
+            "seq": _replay.seq,
+        })
 
         while True:
-            data = await ws.receive_json()
+            data = await ws_manager.receive(ws)
             msg_type = data.get("type")
 
-            if msg_type == "call_service":
-                if _ha_connection:
-                    try:
-                        await _ha_send(
-                            "call_service",
-                            domain=data.get("domain"),
-                            service=data.get("service"),
-                            service_data=data.get("data", {}),
-                            target=data.get("target", {}),
-                        )
-                    except Exception as e:
-                        logger.warning(f"call_service failed: {e}")
-
-            elif msg_type == "get_states":
-                if _ha_connection:
-                    try:
-                        resp = await _ha_send("get_states")
-                        await ws.send_json({
-                            "type": "states_result",
-                            "result": resp.get("result", []),
-                        })
-                    except Exception as e:
-                        logger.warning(f"get_states failed: {e}")
-                        await ws.send_json({"type": "states_result", "result": []})
-
-            elif msg_type == "weather_forecast":
-                if _ha_connection:
-                    try:
-                        entity_id = data.get("entity_id", "weather.forecast_home")
-                        client_id = data.get("id")
-                        results = {}
-                        for forecast_type in ("hourly", "daily"):
-                            try:
-                                event_msg = await _ha_subscribe_once(
-                                    "weather/subscribe_forecast",
-                                    entity_id=entity_id,
-                                    forecast_type=forecast_type,
-                                )
-                                # Event format: {"type":"event","event":{"type":"forecast","forecast":[...]}}
-                                forecast = (
-                                    event_msg.get("event", {}).get("forecast")
-                                    or event_msg.get("result", {}).get("forecast")
-                                    or []
-                                )
-                                results[forecast_type] = forecast
-                                logger.info(f"Weather {forecast_type}: got {len(forecast)} entries")
-                            except Exception as e:
-                                logger.warning(f"weather/{forecast_type} failed: {e}")
-                                results[forecast_type] = []
-                        response = {
-                            "type": "weather_forecast_result",
-                            "hourly": results.get("hourly", []),
-                            "daily": results.get("daily", []),
-                        }
-                        if client_id:
-                            response["id"] = client_id
-                        await ws.send_json(response)
-                    except Exception as e:
-                        logger.warning(f"weather_forecast failed: {e}")
-                        response = {
-                            "type": "weather_forecast_result",
-                            "hourly": [],
-                            "daily": [],
-                        }
-                        if data.get("id"):
-                            response["id"] = data["id"]
-                        await ws.send_json(response)
+            if msg_type in _COMMAND_HANDLERS:
+                await session.dispatch(data)
+
+            # Subscription and option changes are applied inline, in order,
+            # so later commands see them.
+            elif msg_type == "subscribe":
+                try:
+                    entity_ids = await _resolve_subscription(data)
+                except Exception as e:
+                    logger.warning(f"subscribe failed: {e}")
+                    entity_ids = None
+                response = {"type": "subscribed", "success": entity_ids is not None}
+                if entity_ids is not None:
+                    response["entity_count"] = ws_manager.subscribe(ws, entity_ids)
+                _reply(ws, data, response)
+
+            elif msg_type == "unsubscribe":
+                ws_manager.unsubscribe(ws)
+
+            elif msg_type == "set_options":
+                if "delta_states" in data:
+                    ws_manager.set_delta_states(ws, bool(data["delta_states"]))
+                if "attribute_projection" in data:
+                    _set_projection(ws, data["attribute_projection"])
 
             elif msg_type == "ping":
-                await ws.send_json({"type": "pong"})
+                ws_manager.send(ws, {"type": "pong"})
+
+            elif msg_type == "heartbeat_ack":
+                ws_manager.heartbeat_ack(ws, data.get("n"))
 
     except WebSocketDisconnect:
         pass
     except Exception as e:
         logger.error(f"Client WS error: {e}")
     finally:
+        session.close()
+        _forecasts.unwatch(ws)
         ws_manager.disconnect_client(ws)
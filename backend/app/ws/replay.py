@@ -0,0 +1,93 @@
+"""Sequence numbers and a replay buffer for resumable client sessions.
+
+Every ``state_changed`` event the proxy broadcasts is stamped with a
+monotonic ``seq`` and kept in a bounded ring buffer. A client that
+reconnects after a short drop sends ``resume`` with the last ``seq`` it saw
+and gets just the events it missed. If that gap no longer fits in the
+buffer (or the server restarted, which changes ``epoch``) it needs a full
+snapshot instead.
+"""
+from __future__ import annotations
+
+import itertools
+import uuid
+from collections import deque
+from typing import Callable
+
+
+class ReplayBuffer:
+    """Stamps events with ``seq`` and remembers the most recent ones.
+
+    ``capacity`` is read once, on the first recorded event.
+    """
+
+    def __init__(self, capacity: Callable[[], int]):
+        self._capacity = capacity
+        self._events: deque[dict] | None = None
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.replays = 0
+        self.replayed_events = 0
+        self.fallbacks = 0
+
+    def record(self, events: list[dict]) -> list[dict]:
+        """Stamp ``events`` in place and buffer them; returns ``events``."""
+        if self._events is None:
+            self._events = deque(maxlen=self._capacity())
+        for event in events:
+            self.seq += 1
+            event["seq"] = self.seq
+            self._events.append(event)
+        return events
+
+    def adopt(self, epoch: str, seq: int):
+        """Follow another worker's numbering (multi-worker mode)."""
+        if epoch != self.epoch or seq != self.seq:
+            # Buffered events must stay contiguous
+            if self._events is not None:
+                self._events.clear()
+        self.epoch = epoch
+        self.seq = seq
+
+    def restart(self):
+        """Start a new epoch, e.g. when numbering passes to another worker."""
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        if self._events is not None:
+            self._events.clear()
+
+    def extend(self, events: list[dict]):
+        """Buffer events already stamped by the owner worker."""
+        if self._events is None:
+            self._events = deque(maxlen=self._capacity())
+        for event in events:
+            if event.get("seq", 0) > self.seq:
+                self.seq = event["seq"]
+                self._events.append(event)
+
+    def since(self, last_seq: int, epoch: str | None) -> list[dict] | None:
+        """Events after ``last_seq``, or ``None`` if they can't be replayed."""
+        if epoch != self.epoch or last_seq > self.seq or last_seq < 0:
+            self.fallbacks += 1
+            return None
+        if last_seq == self.seq:
+            self.replays += 1
+            return []
+        events = self._events or ()
+        if not events or events[0]["seq"] > last_seq + 1:
+            self.fallbacks += 1
+            return None
+        missed = list(itertools.islice(events, last_seq + 1 - events[0]["seq"], None))
+        self.replays += 1
+        self.replayed_events += len(missed)
+        return missed
+
+    def stats(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "buffered": len(self._events or ()),
+            "replays": self.replays,
+            "replayed_events": self.replayed_events,
+            "resync_fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,116 @@
+"""Last-known entity states on disk, for instant dashboards while HA is down.
+
+The proxy periodically writes the state mirror to a gzipped JSON file in
+``settings.data_dir`` (and once more when the upstream connection drops).
+After a restart of das-home or HA, clients asking for states before the
+mirror is live get this snapshot, flagged ``stale``, so wall displays render
+right away instead of after the full reconnect-and-fetch cycle.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable
+
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+_VERSION = 1
+
+
+def _compact(state: dict) -> dict:
+    # Contexts are only useful for automations, not for rendering
+    return {k: v for k, v in state.items() if k != "context"}
+
+
+class StateSnapshotStore:
+    """Reads and atomically writes the snapshot file at ``path()``."""
+
+    def __init__(self, path: Callable[[], Path]):
+        self._path = path
+        self._loaded: tuple[float, list[dict]] | None = None
+        self._load_attempted = False
+        self._write_lock: asyncio.Lock | None = None
+        self.saved_seq: int | None = None
+        # Saved alongside so area cards resolve during an outage
+        self.entity_area_map: dict[str, str] = {}
+        self.writes = 0
+        self.served = 0
+
+    async def save(
+        self,
+        states: list[dict],
+        seq: int | None = None,
+        entity_area_map: dict[str, str] | None = None,
+    ):
+        """Write ``states``; ``seq`` records which broadcast they reflect."""
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        saved_at = time.time()
+        if entity_area_map is not None:
+            self.entity_area_map = entity_area_map
+        payload = {"version": _VERSION, "saved_at": saved_at,
+                   "states": [_compact(s) for s in states],
+                   "entity_area_map": self.entity_area_map}
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self._write, codec.dumps_bytes(payload))
+            except OSError as e:
+                logger.warning(f"Could not write state snapshot: {e}")
+                return
+        self._loaded = (saved_at, payload["states"])
+        self._load_attempted = True
+        self.saved_seq = seq
+        self.writes += 1
+
+    def _write(self, data: bytes):
+        path = self._path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        # Level 1: most of the size win for a fraction of the CPU
+        tmp.write_bytes(gzip.compress(data, compresslevel=1))
+        os.replace(tmp, path)
+
+    async def load(self) -> tuple[float, list[dict]] | None:
+        """``(saved_at, states)`` of the latest snapshot, or ``None``."""
+        if not self._load_attempted:
+            self._load_attempted = True
+            try:
+                self._loaded = await asyncio.to_thread(self._read)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable state snapshot: {e}")
+        return self._loaded
+
+    def _read(self) -> tuple[float, list[dict]] | None:
+        path = self._path()
+        if not path.exists():
+            return None
+        payload = codec.loads(gzip.decompress(path.read_bytes()))
+        if payload.get("version") != _VERSION:
+            return None
+        self.entity_area_map = payload.get("entity_area_map") or {}
+        return payload["saved_at"], payload["states"]
+
+    async def stale_states(self) -> tuple[float, list[dict]] | None:
+        """Like :meth:`load` but returns the age in seconds; counts a serve."""
+        loaded = await self.load()
+        if loaded is None:
+            return None
+        self.served += 1
+        saved_at, states = loaded
+        return max(0.0, time.time() - saved_at), states
+
+    def stats(self) -> dict:
+        loaded = self._loaded
+        return {
+            "path": str(self._path()),
+            "writes": self.writes,
+            "served_stale": self.served,
+            "entities": len(loaded[1]) if loaded else 0,
+            "age_seconds": round(time.time() - loaded[0], 1) if loaded else None,
+        }
@@ -0,0 +1,191 @@
+"""In-memory mirror of all Home Assistant entity states.
+
+The proxy keeps the mirror current from HA's ``subscribe_entities`` feed, so
+``get_states`` requests from browser clients and REST routes can be answered
+without a round trip to HA.
+
+``subscribe_entities`` speaks a compressed protocol: the first event carries
+every entity under ``"a"`` (add), later events carry attribute-level diffs
+under ``"c"`` (change) and removals under ``"r"``. States use short keys:
+
+    s  state            lc  last_changed (epoch seconds)
+    a  attributes       lu  last_updated (epoch seconds, omitted if == lc)
+    c  context (id string, or full dict)
+
+The mirror expands these back into the full state dicts HA sends for
+``get_states`` / ``state_changed`` so downstream consumers don't notice.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# (entity_id, old_state, new_state) — either state may be None
+StateChange = tuple[str, dict | None, dict | None]
+
+_MISSING = object()
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+def _context(value, previous: dict | None = None) -> dict:
+    if isinstance(value, dict):
+        # Diffs carry only the context keys that changed
+        return {**(previous or {}), **value}
+    base = previous or {"parent_id": None, "user_id": None}
+    return {**base, "id": value}
+
+
+def expand_compressed_state(entity_id: str, compressed: dict) -> dict:
+    """Turn a ``subscribe_entities`` compressed state into a full state dict."""
+    last_changed = _iso(compressed["lc"]) if "lc" in compressed else None
+    last_updated = _iso(compressed["lu"]) if "lu" in compressed else last_changed
+    return {
+        "entity_id": entity_id,
+        "state": compressed.get("s"),
+        "attributes": compressed.get("a") or {},
+        "last_changed": last_changed,
+        "last_updated": last_updated,
+        "context": _context(compressed.get("c")),
+    }
+
+
+def apply_compressed_diff(state: dict, diff: dict) -> dict:
+    """Return a new state dict with a ``subscribe_entities`` change applied."""
+    new_state = {**state}
+    additions = diff.get("+") or {}
+    removals = diff.get("-") or {}
+
+    if "s" in additions:
+        new_state["state"] = additions["s"]
+    if "c" in additions:
+        new_state["context"] = _context(additions["c"], state.get("context"))
+    if "lc" in additions:
+        new_state["last_changed"] = new_state["last_updated"] = _iso(additions["lc"])
+    elif "lu" in additions:
+        new_state["last_updated"] = _iso(additions["lu"])
+
+    if "a" in additions or "a" in removals:
+        attributes = {**state.get("attributes", {}), **additions.get("a", {})}
+        for key in removals.get("a", []):
+            attributes.pop(key, None)
+        new_state["attributes"] = attributes
+    return new_state
+
+
+def diff_states(old_state: dict, new_state: dict) -> dict:
+    """Describe ``new_state`` relative to ``old_state`` for delta clients.
+
+    Only fields that differ are included: ``state``, ``last_changed``,
+    ``last_updated``, ``context``, ``attributes`` (changed or added keys)
+    and ``removed`` (attribute keys that disappeared).
+    """
+    delta: dict = {"type": "state_delta", "entity_id": new_state.get("entity_id")}
+    for key in ("state", "last_changed", "last_updated", "context"):
+        if new_state.get(key) != old_state.get(key):
+            delta[key] = new_state.get(key)
+
+    old_attrs = old_state.get("attributes") or {}
+    new_attrs = new_state.get("attributes") or {}
+    changed = {k: v for k, v in new_attrs.items() if old_attrs.get(k, _MISSING) != v}
+    removed = [k for k in old_attrs if k not in new_attrs]
+    if changed:
+        delta["attributes"] = changed
+    if removed:
+        delta["removed"] = removed
+    return delta
+
+
+class StateMirror:
+    def __init__(self):
+        self._states: dict[str, dict] = {}
+        self._ready = False
+        self._awaiting_snapshot = False
+
+    @property
+    def ready(self) -> bool:
+        """True once seeded and while the upstream feed is live."""
+        return self._ready
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def begin_resync(self) -> None:
+        """Treat the next ``"a"`` event as a full snapshot of all entities."""
+        self._awaiting_snapshot = True
+
+    def seed(self, states: list[dict]) -> list[StateChange]:
+        """Replace the mirror with a full snapshot.
+
+        Returns the entities that differ from what the mirror held before,
+        so clients that stayed connected across an upstream reconnect can be
+        brought up to date. The very first seed reports nothing.
+        """
+        fresh = {s["entity_id"]: s for s in states if s.get("entity_id")}
+        changes: list[StateChange] = []
+        if self._states:
+            for entity_id, new_state in fresh.items():
+                old_state = self._states.get(entity_id)
+                if old_state != new_state:
+                    changes.append((entity_id, old_state, new_state))
+            for entity_id, old_state in self._states.items():
+                if entity_id not in fresh:
+                    changes.append((entity_id, old_state, None))
+        self._states = fresh
+        self._awaiting_snapshot = False
+        self._ready = True
+        logger.info("State mirror seeded with %d entities", len(fresh))
+        return changes
+
+    def invalidate(self) -> None:
+        """Mark the mirror stale, e.g. after the upstream connection dropped."""
+        self._ready = False
+        self._awaiting_snapshot = False
+
+    def apply(self, entity_id: str, new_state: dict | None) -> None:
+        """Apply one full-state update. ``None`` removes the entity."""
+        if not entity_id:
+            return
+        if new_state is None:
+            self._states.pop(entity_id, None)
+        else:
+            self._states[entity_id] = new_state
+
+    def apply_entities_event(self, event: dict) -> list[StateChange]:
+        """Apply one ``subscribe_entities`` event and return what changed."""
+        added = event.get("a")
+        if added is not None and self._awaiting_snapshot:
+            return self.seed(
+                [expand_compressed_state(eid, c) for eid, c in added.items()]
+            )
+
+        changes: list[StateChange] = []
+        for entity_id, compressed in (added or {}).items():
+            new_state = expand_compressed_state(entity_id, compressed)
+            changes.append((entity_id, self._states.get(entity_id), new_state))
+            self._states[entity_id] = new_state
+
+        for entity_id, diff in (event.get("c") or {}).items():
+            old_state = self._states.get(entity_id)
+            if old_state is None:
+                logger.debug("Change for unknown entity %s ignored", entity_id)
+                continue
+            new_state = apply_compressed_diff(old_state, diff)
+            self._states[entity_id] = new_state
+            changes.append((entity_id, old_state, new_state))
+
+        for entity_id in event.get("r") or []:
+            old_state = self._states.pop(entity_id, None)
+            if old_state is not None:
+                changes.append((entity_id, old_state, None))
+        return changes
+
+    def get(self, entity_id: str) -> dict | None:
+        return self._states.get(entity_id)
+
+    def all(self) -> list[dict]:
+        return list(self._states.values())
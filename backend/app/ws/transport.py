@@ -0,0 +1,80 @@
+"""Browser WebSocket transport: tuned permessage-deflate and wire counters.
+
+uvicorn only knows an on/off switch for permessage-deflate and then uses
+zlib's defaults (32 KiB window, ``memLevel`` 8), roughly 256 KiB of
+compressor state per connection. Our payloads are JSON with short-range
+repetition (attribute names, entity_id prefixes), so a much smaller window
+compresses nearly as well. ``python -m app.serve`` runs uvicorn with
+this protocol (``uvicorn --ws`` only takes built-in names) and so uses the
+settings below. Browsers negotiate the extension themselves;
+clients that don't offer it get uncompressed frames as before.
+
+The protocol also counts the bytes it writes per connection, after
+compression, and hands the counter to the app as the ASGI scope extension
+``das_home.wire`` so ``/api/ws/stats`` can compare modes.
+"""
+from __future__ import annotations
+
+from websockets.extensions.permessage_deflate import (
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from websockets.frames import Opcode
+from websockets.legacy.framing import Frame
+
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+
+from app.settings import settings
+
+WIRE_EXTENSION = "das_home.wire"
+
+
+class WireCounter:
+    """Bytes and frames written to one connection, as sent on the socket."""
+
+    def __init__(self):
+        self.bytes_sent = 0
+        self.frames = 0
+        self.deflate = False
+
+
+def deflate_factory() -> ServerPerMessageDeflateFactory:
+    window_bits = settings.ws_deflate_window_bits
+    return ServerPerMessageDeflateFactory(
+        server_max_window_bits=window_bits,
+        # Only applied if the client offers the parameter (browsers do)
+        client_max_window_bits=window_bits,
+        compress_settings={
+            "level": settings.ws_deflate_level,
+            "memLevel": settings.ws_deflate_mem_level,
+        },
+    )
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    """uvicorn's websockets protocol with our deflate settings and counters."""
+
+    def __init__(self, config, server_state, app_state, _loop=None):
+        super().__init__(config, server_state, app_state, _loop)
+        self.available_extensions = [deflate_factory()] if settings.ws_deflate else []
+        self.wire = WireCounter()
+
+    async def run_asgi(self) -> None:
+        self.scope["extensions"][WIRE_EXTENSION] = self.wire
+        await super().run_asgi()
+
+    def write_frame_sync(self, fin: bool, opcode: int, data: bytes) -> None:
+        wire = self.wire
+        # Extensions are negotiated after the app starts; the first frame is
+        # the accept's reply at the earliest
+        wire.deflate = any(isinstance(ext, PerMessageDeflate) for ext in self.extensions)
+        frame = Frame(fin, Opcode(opcode), data)
+        if self.debug:
+            self.logger.debug("> %s", frame)
+
+        def write(chunk: bytes):
+            wire.bytes_sent += len(chunk)
+            self.transport.write(chunk)
+
+        frame.write(write, mask=False, extensions=self.extensions)
+        wire.frames += 1
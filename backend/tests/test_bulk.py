@@ -0,0 +1,104 @@
+"""Tests for bulk service calls in ``app.ws.bulk``."""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.ws import proxy as ws_proxy
+from app.ws.bulk import plan_batches, run_bulk
+
+
+def _off(entity_id, **extra) -> dict:
+    return {"domain": "light", "service": "turn_off", "target": {"entity_id": entity_id}, **extra}
+
+
+def test_calls_with_same_service_and_data_merge_targets():
+    batches = plan_batches([
+        _off("light.a"),
+        _off(["light.b", "light.a"]),
+        {"domain": "cover", "service": "close_cover", "target": {"area_id": "living"}},
+        _off("light.c", data={"transition": 2}),
+        {"domain": "light", "service": "turn_off", "target": {"area_id": "kitchen"}},
+    ])
+    assert [(b["target"], indexes) for b, indexes in batches] == [
+        ({"entity_id": ["light.a"]}, [0]),
+        ({"entity_id": ["light.b", "light.a"], "area_id": ["kitchen"]}, [1, 4]),
+        ({"area_id": ["living"]}, [2]),
+        ({"entity_id": ["light.c"]}, [3]),
+    ]
+    assert len(plan_batches([_off("light.a"), _off("light.b")], merge=False)) == 2
+
+
+def test_repeated_targets_are_not_merged_into_one_call():
+    toggle = {"domain": "light", "service": "toggle", "target": {"entity_id": "light.a"}}
+    reload = {"domain": "automation", "service": "reload"}
+    batches = plan_batches([toggle, dict(toggle), reload, dict(reload)])
+    assert [indexes for _batch, indexes in batches] == [[0], [1], [2], [3]]
+
+
+async def test_run_bulk_bounds_parallelism_and_reports_each_call():
+    running = 0
+    peak = 0
+    sent: list[tuple] = []
+
+    async def call_service(domain, service, data, target):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        sent.append((domain, service, target))
+        await asyncio.sleep(0.01)
+        running -= 1
+        if domain == "lock":
+            raise ConnectionError("timed out")
+        if domain == "cover":
+            return {"success": False, "error": {"message": "not supported"}}
+        return {"success": True}
+
+    calls = [
+        _off("light.a"),
+        {"domain": "cover", "service": "close_cover", "target": {"entity_id": "cover.a"}},
+        {"domain": "lock", "service": "lock", "target": {"entity_id": "lock.door"}},
+        {"domain": "fan", "service": "turn_off", "target": {"entity_id": "fan.a"}},
+        _off("light.b"),
+        {"service": "missing_domain"},
+    ]
+    result = await run_bulk(calls, call_service, max_parallel=2)
+
+    assert peak == 2
+    assert len(sent) == 4
+    assert result["batches"] == 4
+    assert result["success"] is False
+    by_index = {r["index"]: r for r in result["calls"]}
+    assert by_index[0]["success"] and by_index[4]["success"]
+    assert by_index[0]["batch"] == by_index[4]["batch"]
+    assert by_index[1]["error"] == "not supported"
+    assert by_index[2]["error"] == "timed out"
+    assert by_index[5]["error"] == "domain and service are required"
+    assert by_index[5]["latency_ms"] is None
+    assert by_index[3]["latency_ms"] >= 10
+
+
+def test_bulk_route_validates_the_request(monkeypatch):
+    sent: list[dict] = []
+
+    async def fake_require_ha():
+        return None
+
+    async def fake_send(msg_type, **kwargs):
+        sent.append(kwargs)
+        return {"success": True, "result": None}
+
+    monkeypatch.setattr(ws_proxy, "require_ha", fake_require_ha)
+    monkeypatch.setattr(ws_proxy, "_ha_send", fake_send)
+    client = TestClient(app)
+
+    for body in ({}, {"calls": "light.a"}, {"calls": [{"domain": "light"}]},
+                 {"calls": [{"domain": "light", "service": "turn_on", "data": "on"}]}):
+        assert client.post("/api/services/bulk", json=body).status_code == 422
+    assert sent == []
+
+    resp = client.post("/api/services/bulk", json={"calls": [_off("light.a"), _off("light.b")]})
+    assert resp.status_code == 200
+    assert resp.json()["success"] is True
+    assert sent == [{"domain": "light", "service": "turn_off", "service_data": {},
+                     "target": {"entity_id": ["light.a", "light.b"]}}]
@@ -0,0 +1,68 @@
+"""Unit tests for time-window coalescing of state_changed events."""
+import asyncio
+
+from app.config.models import CoalesceRule
+from app.ws.coalescer import StateCoalescer, coalesce_window
+
+
+def _msg(entity_id: str, value: str, old: str | None = None, device_class: str = "power"):
+    attrs = {"device_class": device_class}
+    return {
+        "type": "state_changed",
+        "entity_id": entity_id,
+        "new_state": {"entity_id": entity_id, "state": value, "attributes": attrs},
+        "old_state": (
+            {"entity_id": entity_id, "state": old, "attributes": attrs} if old else None
+        ),
+    }
+
+
+def test_window_prefers_most_specific_rule():
+    rules = [
+        CoalesceRule(domain="sensor", window_ms=1000),
+        CoalesceRule(device_class="power", window_ms=250),
+        CoalesceRule(entity_id="sensor.grid", window_ms=50),
+    ]
+    power = {"attributes": {"device_class": "power"}}
+    assert coalesce_window(rules, "sensor.grid", power) == 0.05
+    assert coalesce_window(rules, "sensor.plug", power) == 0.25
+    assert coalesce_window(rules, "sensor.temp", {"attributes": {}}) == 1.0
+    assert coalesce_window(rules, "light.a", None) == 0.0
+
+
+async def test_events_inside_window_flush_as_one_batch():
+    emitted: list[list[dict]] = []
+    rules = [CoalesceRule(device_class="power", window_ms=20)]
+    coalescer = StateCoalescer(emitted.append, lambda: rules)
+
+    coalescer.submit(_msg("sensor.plug", "1", old="0"))
+    coalescer.submit(_msg("sensor.plug", "2", old="1"))
+    coalescer.submit(_msg("sensor.plug", "3", old="2"))
+    coalescer.submit(_msg("sensor.grid", "7", old="6"))
+    assert emitted == []
+
+    await asyncio.sleep(0.05)
+    (batch,) = emitted
+    by_entity = {e["entity_id"]: e for e in batch}
+    assert by_entity["sensor.plug"]["new_state"]["state"] == "3"
+    # The first old_state of the window is preserved.
+    assert by_entity["sensor.plug"]["old_state"]["state"] == "0"
+    assert by_entity["sensor.grid"]["new_state"]["state"] == "7"
+    assert coalescer.stats()["window_coalesced"] == 2
+
+
+async def test_entities_without_rule_pass_through():
+    emitted: list[list[dict]] = []
+    coalescer = StateCoalescer(emitted.append, lambda: [CoalesceRule(domain="sensor")])
+    coalescer.submit(_msg("light.a", "on", device_class=""))
+    assert [e[0]["entity_id"] for e in emitted] == ["light.a"]
+
+
+async def test_flush_emits_pending_immediately():
+    emitted: list[list[dict]] = []
+    coalescer = StateCoalescer(emitted.append, lambda: [CoalesceRule(domain="sensor")])
+    coalescer.submit(_msg("sensor.plug", "1"))
+    coalescer.flush()
+    assert len(emitted) == 1
+    await asyncio.sleep(0.3)
+    assert len(emitted) == 1
@@ -0,0 +1,47 @@
+"""Both JSON backends in ``app.codec`` must produce the same bytes."""
+import pytest
+
+from app import codec
+
+SAMPLE = {
+    "type": "state_changed",
+    "entity_id": "sensor.temperatur_küche",
+    "new_state": {"state": "21.5", "attributes": {"friendly_name": "Küche °C", "ids": [1, 2]}},
+    "seq": 42,
+}
+
+
+@pytest.mark.parametrize("name", sorted(codec.available()))
+def test_round_trip(name):
+    backend = codec.available()[name]
+    assert backend.loads(backend.dumps(SAMPLE)) == SAMPLE
+    assert backend.loads(backend.dumps_bytes(SAMPLE)) == SAMPLE
+
+
+def test_backends_agree():
+    outputs = {
+        name: (backend.dumps(SAMPLE), backend.dumps({2: "b", 1: "a"}, sort_keys=True))
+        for name, backend in codec.available().items()
+    }
+    assert len(set(outputs.values())) == 1
+    text, keyed = outputs["json"]
+    assert "Küche" in text and " " not in text.replace("Küche °C", "")
+    assert keyed == '{"1":"a","2":"b"}'
+
+
+
+@pytest.mark.parametrize("name", sorted(codec.available()))
+def test_non_finite_floats_become_null(name):
+    backend = codec.available()[name]
+    sample = {
+        "state": float("nan"),
+        "attributes": {"max": float("inf"), "ids": [1.5, float("-inf")]},
+    }
+    expected = '{"state":null,"attributes":{"max":null,"ids":[1.5,null]}}'
+    assert backend.dumps(sample) == expected
+    assert backend.dumps_bytes(sample) == expected.encode()
+
+def test_auto_prefers_orjson():
+    expected = "orjson" if "orjson" in codec.available() else "json"
+    assert codec._select("auto").name == expected
+    assert codec._select("missing") is codec.StdlibCodec
@@ -0,0 +1,113 @@
+"""Tests for the incremental daily statistics store behind /api/insights."""
+from datetime import datetime, time, timedelta, timezone
+
+import pytest
+
+from app.services.daily_stats import DailyStatsStore
+from app.services.insights import _daily_values
+
+NOW = datetime.now(timezone.utc)
+TODAY = NOW.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class FakeRecorder:
+    """Serves daily ``sum`` rows (cumulative kWh, 2 kWh per day) and logs calls."""
+
+    def __init__(self):
+        self.calls: list[tuple[list[str], datetime, datetime]] = []
+        self.fail: set[str] = set()
+
+    async def fetch(self, ids, start, end):
+        self.calls.append((list(ids), start, end))
+        if self.fail & set(ids):
+            return {eid: [] for eid in ids}, set(ids)
+        rows = {}
+        for eid in ids:
+            day, rows[eid] = start, []
+            while day < end:
+                total = 2.0 * ((day - TODAY).days + 1000)
+                rows[eid].append({"start": day.isoformat(), "sum": total})
+                day += timedelta(days=1)
+        return rows, set()
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = DailyStatsStore(lambda: tmp_path / "daily.sqlite3")
+    yield s
+    s.close()
+
+
+async def test_backfills_once_then_fetches_only_unsettled_days(store):
+    ha = FakeRecorder()
+    start = TODAY - timedelta(days=35)
+    await store.sync("recent", {"sensor.a": start, "sensor.b": start}, NOW, ha.fetch)
+    assert [(ids, s) for ids, s, _ in ha.calls] == [(["sensor.a", "sensor.b"], start)]
+
+    ha.calls.clear()
+    await store.sync("recent", {"sensor.a": start, "sensor.b": start}, NOW, ha.fetch)
+    # Only the day HA may still be filling in (yesterday, right after midnight)
+    unsettled = datetime.combine((NOW - timedelta(hours=1)).date(), time(), timezone.utc)
+    assert [(ids, s) for ids, s, _ in ha.calls] == [(["sensor.a", "sensor.b"], unsettled)]
+
+    rows = await store.rows(["sensor.a", "sensor.c"], start, NOW)
+    assert rows["sensor.c"] == []
+    values = dict(_daily_values(rows["sensor.a"]))
+    assert len(values) == 36
+    # Incremental fetches diff against the stored running total
+    assert values[TODAY.date().isoformat()] == 2.0
+    assert values[(TODAY - timedelta(days=1)).date().isoformat()] == 2.0
+
+
+async def test_marks_survive_restart_and_closed_windows_are_not_refetched(tmp_path):
+    ha = FakeRecorder()
+    yoy_end = TODAY.replace(year=TODAY.year - 1)
+    starts = {"sensor.a": yoy_end - timedelta(days=7)}
+
+    first = DailyStatsStore(lambda: tmp_path / "daily.sqlite3")
+    await first.sync("yoy", starts, yoy_end, ha.fetch)
+    first.close()
+    assert len(ha.calls) == 1
+
+    reopened = DailyStatsStore(lambda: tmp_path / "daily.sqlite3")
+    await reopened.sync("yoy", starts, yoy_end, ha.fetch)
+    assert len(ha.calls) == 1
+    assert reopened.skipped == 1
+    rows = await reopened.rows(["sensor.a"], starts["sensor.a"], yoy_end)
+    assert len(rows["sensor.a"]) == 7
+    reopened.close()
+
+
+async def test_failed_fetch_keeps_previous_days_and_mark(store):
+    ha = FakeRecorder()
+    start = TODAY - timedelta(days=6)
+    await store.sync("recent", {"sensor.a": start}, NOW, ha.fetch)
+    before = await store.rows(["sensor.a"], start, NOW)
+
+    ha.fail = {"sensor.a"}
+    failed = await store.sync("recent", {"sensor.a": start}, NOW, ha.fetch)
+    assert failed == {"sensor.a"}
+    assert await store.rows(["sensor.a"], start, NOW) == before
+
+    # An earlier start than the mark covers refetches the whole window
+    ha.fail, ha.calls = set(), []
+    await store.sync("recent", {"sensor.a": start - timedelta(days=7)}, NOW, ha.fetch)
+    assert ha.calls[0][1] == start - timedelta(days=7)
+
+
+async def test_incremental_sum_diffs_against_last_stored_day_across_a_gap(store):
+    ha = FakeRecorder()
+    start = TODAY - timedelta(days=6)
+    await store.sync("recent", {"sensor.a": start}, NOW, ha.fetch)
+
+    # HA had no bucket for the two days before the next fetch starts
+    gap = {(TODAY - timedelta(days=d)).date().isoformat() for d in (1, 2)}
+    with store._lock, store._conn() as db:
+        yesterday = (TODAY - timedelta(days=1)).date().isoformat()
+        db.execute("UPDATE marks SET complete_day = ?", (yesterday,))
+        db.executemany("DELETE FROM daily WHERE day = ?", [(d,) for d in gap])
+
+    await store.sync("recent", {"sensor.a": start}, NOW, ha.fetch)
+    values = dict(_daily_values((await store.rows(["sensor.a"], start, NOW))["sensor.a"]))
+    # Today's total is the growth since the last stored sum, not the running total
+    assert values[TODAY.date().isoformat()] == 6.0
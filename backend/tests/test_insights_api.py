@@ -4,20 +4,27 @@ These tests monkeypatch the HA WebSocket layer so they can run without a real
 HA instance. Each test is responsible for calling ``clear_cache()`` through
 the fixture to avoid cross-test pollution.
 """
+import asyncio
 from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 
 import pytest
 from fastapi.testclient import TestClient
 
 from app.api import insights_routes
 from app.main import app
+from app.services.daily_stats import DailyStatsStore
 from app.ws import proxy as ws_proxy
 
 
 @pytest.fixture(autouse=True)
-def _reset_cache():
+def _reset_cache(tmp_path, monkeypatch):
     insights_routes.clear_cache()
+    store = DailyStatsStore(lambda: tmp_path / "insights_daily.sqlite3")
+    monkeypatch.setattr(insights_routes, "_daily_store", store)
+    monkeypatch.setattr(insights_routes, "_ha_tz", None)
     yield
+    store.close()
     insights_routes.clear_cache()
 
 
@@ -305,3 +312,247 @@ def test_health_endpoint_returns_version_from_config_yaml(client):
     assert data["version"] == expected_version
     # Sanity: the version string should be non-empty and not "unknown"
     assert expected_version and expected_version != "unknown"
+
+
+def test_states_served_from_mirror_when_live(client, monkeypatch):
+    calls: list[str] = []
+    _install_fake_ha(monkeypatch, call_log=calls)
+    mirror = ws_proxy.StateMirror()
+    mirror.seed(_make_states())
+    monkeypatch.setattr(ws_proxy, "_state_mirror", mirror)
+
+    resp = client.get("/api/insights")
+    assert resp.status_code == 200
+    assert "get_states" not in calls
+    assert resp.json()["kpis"]["energy_cost_today"]["entity_id"] == "sensor.energy_meter"
+
+
+def test_statistics_fetched_in_bounded_parallel_chunks(client, monkeypatch):
+    """Large id lists are chunked, chunks and windows overlap up to the cap,
+    and a failing chunk only blanks its own entities."""
+    states = _make_states() + [
+        {"entity_id": f"sensor.power_{i}",
+         "attributes": {"device_class": "power", "friendly_name": f"Power {i}"}}
+        for i in range(12)
+    ]
+    inflight = 0
+    peak = 0
+    chunks: list[list[str]] = []
+
+    async def fake_ensure():
+        return None
+
+    async def fake_send(msg_type: str, **kwargs):
+        nonlocal inflight, peak
+        if msg_type == "get_states":
+            return {"success": True, "result": states}
+        ids = kwargs["statistic_ids"]
+        chunks.append(ids)
+        inflight += 1
+        peak = max(peak, inflight)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            inflight -= 1
+        if "sensor.power_5" in ids:
+            return {"success": False, "error": {"message": "boom"}}
+        now = datetime.now(timezone.utc)
+        return {"success": True, "result": {eid: _stats_rows(1, 3.0, now) for eid in ids}}
+
+    monkeypatch.setattr(ws_proxy, "_ensure_ha_connection", fake_ensure)
+    monkeypatch.setattr(ws_proxy, "_ha_send", fake_send)
+    monkeypatch.setattr(insights_routes, "_STATS_CHUNK_SIZE", 4)
+    monkeypatch.setattr(insights_routes, "_STATS_MAX_PARALLEL", 3)
+
+    resp = client.get("/api/insights")
+    assert resp.status_code == 200
+    assert all(len(ids) <= 4 for ids in chunks)
+    assert 1 < peak <= 3
+    # The anomaly window (energy + 12 power sensors) took four chunks
+    anomaly_ids = [eid for ids in chunks for eid in ids if eid.startswith("sensor.power_")]
+    assert sorted(set(anomaly_ids)) == sorted(f"sensor.power_{i}" for i in range(12))
+    # Energy and occupancy live in the KPI chunk, which succeeded
+    kpis = resp.json()["kpis"]
+    assert kpis["energy_cost_today"]["available"] is True
+
+
+def test_fetch_statistics_attributes_errors_per_chunk(monkeypatch):
+    async def fake_send(msg_type: str, **kwargs):
+        ids = kwargs["statistic_ids"]
+        if "b" in ids:
+            raise ConnectionError("HA hung up")
+        return {"success": True, "result": {eid: [{"state": 1.0}] for eid in ids}}
+
+    monkeypatch.setattr(ws_proxy, "_ha_send", fake_send)
+    monkeypatch.setattr(insights_routes, "_STATS_CHUNK_SIZE", 2)
+    now = datetime.now(timezone.utc)
+    rows, failed = asyncio.run(
+        insights_routes._fetch_statistics(["a", "b", "c", "d", "e", "a"], now, now)
+    )
+    assert failed == {"a", "b"}
+    assert rows["a"] == [] and rows["b"] == []
+    assert rows["c"] == rows["e"] == [{"state": 1.0}]
+
+
+# ---------- Single-flight and stale-while-revalidate ----------
+
+
+async def _get_insights():
+    return await insights_routes.get_insights(
+        energy_entity=None, occupancy_entity=None, uptime_entities=None
+    )
+
+
+async def test_concurrent_misses_share_one_computation(monkeypatch):
+    calls: list[str] = []
+    _install_fake_ha(monkeypatch, call_log=calls)
+    fake_send = ws_proxy._ha_send
+    gate = asyncio.Event()
+
+    async def gated_send(msg_type: str, **kwargs):
+        await gate.wait()
+        return await fake_send(msg_type, **kwargs)
+
+    monkeypatch.setattr(ws_proxy, "_ha_send", gated_send)
+    requests = [asyncio.create_task(_get_insights()) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    gate.set()
+    results = await asyncio.gather(*requests)
+
+    assert len({r.generated_at for r in results}) == 1
+    assert calls.count("get_states") == 1
+    stats = insights_routes._cache_stats
+    assert (stats["misses"], stats["dedupe"]) == (1, 4)
+    assert not insights_routes._inflight
+
+
+async def test_soft_expired_entry_is_served_then_refreshed(monkeypatch):
+    import time
+
+    _install_fake_ha(monkeypatch)
+    first = await _get_insights()
+    key = next(iter(insights_routes._cache))
+    insights_routes._cache[key] = (
+        time.monotonic() - (insights_routes._CACHE_SOFT_TTL_SECONDS + 5),
+        first,
+    )
+
+    served = await _get_insights()
+    assert served.generated_at == first.generated_at
+    assert served.cache_age_seconds > insights_routes._CACHE_SOFT_TTL_SECONDS
+    # A second request during the refresh does not start another one
+    await _get_insights()
+    await insights_routes._inflight[key]
+
+    refreshed = await _get_insights()
+    assert refreshed.generated_at != first.generated_at
+    assert refreshed.cache_age_seconds == 0
+    stats = insights_routes._cache_stats
+    assert (stats["misses"], stats["stale"], stats["refreshes"], stats["hits"]) == (1, 2, 1, 1)
+
+
+
+async def test_refresh_during_outage_counts_stale_once(monkeypatch):
+    import time
+
+    _install_fake_ha(monkeypatch)
+    first = await _get_insights()
+    key = next(iter(insights_routes._cache))
+    insights_routes._cache[key] = (
+        time.monotonic() - (insights_routes._CACHE_SOFT_TTL_SECONDS + 5),
+        first,
+    )
+
+    _install_fake_ha(monkeypatch, connected=False)
+    served = await _get_insights()
+    assert served.generated_at == first.generated_at
+    refresh = insights_routes._inflight[key]
+    await asyncio.wait({refresh})
+    stats = insights_routes._cache_stats
+    # The refresh finding HA down served nobody, so only the response counts
+    assert (stats["stale"], stats["refreshes"], stats["errors"]) == (1, 1, 0)
+
+def test_cache_stats_endpoint(client, monkeypatch):
+    _install_fake_ha(monkeypatch)
+    client.get("/api/insights")
+    client.get("/api/insights")
+    stats = client.get("/api/insights/stats").json()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["entries"] == 1
+
+
+# ---------- Bounded LRU ----------
+
+
+def test_reordered_uptime_lists_share_an_entry(client, monkeypatch):
+    calls: list[str] = []
+    _install_fake_ha(monkeypatch, call_log=calls)
+    client.get("/api/insights", params={"uptime_entities": "switch.y,switch.x"})
+    first_call_count = len(calls)
+
+    resp = client.get("/api/insights", params={"uptime_entities": " switch.x,switch.y,switch.x"})
+    assert resp.status_code == 200
+    assert len(calls) == first_call_count
+    assert list(insights_routes._cache) == [("", "", ("switch.x", "switch.y"))]
+
+
+def test_cache_evicts_least_recently_used(client, monkeypatch):
+    from app.settings import settings
+
+    _install_fake_ha(monkeypatch)
+    monkeypatch.setattr(settings, "insights_cache_max_entries", 2)
+    for energy in ("sensor.a", "sensor.b"):
+        client.get("/api/insights", params={"energy_entity": energy})
+    # Touch a, so b is the least recently used when c arrives
+    client.get("/api/insights", params={"energy_entity": "sensor.a"})
+    client.get("/api/insights", params={"energy_entity": "sensor.c"})
+
+    assert [key[0] for key in insights_routes._cache] == ["sensor.a", "sensor.c"]
+    assert set(insights_routes._cache_sizes) == set(insights_routes._cache)
+    assert insights_routes._cache_stats["evictions"] == 1
+
+    # The byte budget keeps at least the newest entry
+    monkeypatch.setattr(settings, "insights_cache_max_bytes", 1)
+    client.get("/api/insights", params={"energy_entity": "sensor.d"})
+    assert [key[0] for key in insights_routes._cache] == ["sensor.d"]
+    stats = client.get("/api/insights/stats").json()
+    assert stats["entries"] == 1
+    assert stats["bytes"] == insights_routes._cache_sizes[next(iter(insights_routes._cache))]
+
+
+def test_local_midnight_buckets_count_as_today(client, monkeypatch):
+    """HA east of UTC: today's day bucket starts on the previous UTC date."""
+    berlin = ZoneInfo("Europe/Berlin")
+
+    async def fake_ensure():
+        return None
+
+    async def fake_send(msg_type: str, **kwargs):
+        if msg_type == "get_config":
+            return {"success": True, "result": {"time_zone": "Europe/Berlin"}}
+        if msg_type == "get_states":
+            return {"success": True, "result": _make_states()}
+        if msg_type == "recorder/statistics_during_period":
+            start = datetime.fromisoformat(kwargs["start_time"]).astimezone(berlin).date()
+            end = datetime.fromisoformat(kwargs["end_time"])
+            result = {}
+            for eid in kwargs["statistic_ids"]:
+                rows, day = [], start
+                while (midnight := datetime.combine(day, datetime.min.time(), berlin)) < end:
+                    rows.append({"start": midnight.timestamp() * 1000, "state": 5.0})
+                    day += timedelta(days=1)
+                result[eid] = rows
+            return {"success": True, "result": result}
+        return {"success": True, "result": {}}
+
+    monkeypatch.setattr(ws_proxy, "_ensure_ha_connection", fake_ensure)
+    monkeypatch.setattr(ws_proxy, "_ha_send", fake_send)
+
+    resp = client.get("/api/insights")
+    assert resp.status_code == 200
+    kpis = resp.json()["kpis"]
+    assert kpis["energy_cost_today"]["available"] is True
+    assert kpis["energy_cost_today"]["value"] == 5.0
+    assert kpis["energy_cost_today"]["trend_7d"] == [5.0] * 7
+    assert kpis["device_uptime_pct"]["value"] == 100.0
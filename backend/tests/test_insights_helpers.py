@@ -3,9 +3,14 @@
 These tests exercise ``discover_kpi_entities``, ``compute_kpi_aggregates``,
 and ``detect_anomalies`` with hand-rolled state dumps / statistics rows.
 """
+import random
 from datetime import datetime, timedelta, timezone
 
+import pytest
+
+from app.services import insights
 from app.services.insights import (
+    BASELINES,
     compute_kpi_aggregates,
     detect_anomalies,
     discover_kpi_entities,
@@ -344,6 +349,75 @@ def test_detect_severity_scales_with_deviation():
     assert a_low[0]["severity"] == "low"
 
 
+def test_detect_median_baseline_ignores_outlier_history():
+    now = datetime(2026, 4, 21, 12, 0, 0, tzinfo=timezone.utc)
+    ent = {"entity_id": "sensor.heater", "attributes": {}}
+    rows = [
+        _day_row(now - timedelta(days=7), 5.0),
+        _day_row(now - timedelta(days=14), 50.0),  # one-off party
+        _day_row(now - timedelta(days=21), 5.0),
+        _day_row(now - timedelta(days=28), 5.0),
+        _day_row(now, 5.5),
+    ]
+    stats = {"sensor.heater": rows}
+    assert detect_anomalies([ent], stats, now=now)[0]["description"].endswith("lower)")
+    assert detect_anomalies([ent], stats, now=now, baseline="median") == []
+    with pytest.raises(ValueError):
+        detect_anomalies([ent], stats, now=now, baseline="mode")
+
+
+def _parity_dataset(now: datetime) -> tuple[list[dict], dict[str, list[dict]]]:
+    """Entities covering every row shape and edge the scalar engine handles."""
+    rng = random.Random(7)
+    monitored: list[dict] = []
+    stats: dict[str, list[dict]] = {}
+    for i in range(120):
+        entity_id = f"sensor.p{i}"
+        monitored.append({"entity_id": entity_id, "attributes": {"friendly_name": f"P{i}"}})
+        kind = i % 6
+        if kind == 5:  # zero, tiny, negative and huge baselines
+            typical = rng.choice([0.0, 1e-300, -3.0, 0.1, 7.0, 1e16])
+        else:
+            typical = rng.uniform(1, 9)
+        rows = []
+        total = 1000.0
+        for back in range(35, -1, -1):
+            if rng.random() < 0.1:
+                continue
+            day = now - timedelta(days=back)
+            value = typical * rng.choice([0.5, 0.9, 1.0, 1.1, 1.5, 2.0, 3.0])
+            if kind == 1:  # cumulative sum rows with ISO datetimes
+                total += abs(value)
+                rows.append({"start": day.isoformat(), "sum": total, "state": value})
+            elif kind == 2:  # epoch ms and hourly duplicates
+                ms = int(day.timestamp() * 1000)
+                rows.append({"start": ms, "mean": value / 2})
+                rows.append({"start": ms + 3600_000, "mean": value / 2})
+            elif kind == 3:  # rows HA could not date
+                rows.append({"start": "garbage" if back == 14 else day.isoformat(), "state": value})
+            else:
+                rows.append({"start": day.date().isoformat(), "state": value})
+        if kind == 4 and i % 12 == 4:
+            rows.append({"start": None, "state": 1.0})
+        stats[entity_id] = rows
+    monitored.append({"entity_id": "sensor.no_rows", "attributes": {}})
+    monitored.append({"attributes": {}})
+    return monitored, stats
+
+
+@pytest.mark.parametrize("baseline", BASELINES)
+def test_detect_batched_engine_matches_scalar(monkeypatch, baseline):
+    pytest.importorskip("numpy")
+    now = datetime(2026, 4, 21, 12, 0, 0, tzinfo=timezone.utc)
+    monitored, stats = _parity_dataset(now)
+
+    batched = detect_anomalies(monitored, stats, now=now, baseline=baseline)
+    monkeypatch.setattr(insights, "np", None)
+    scalar = detect_anomalies(monitored, stats, now=now, baseline=baseline)
+    assert scalar  # the dataset does produce anomalies
+    assert batched == scalar
+
+
 # ---------- filter_monitored_entities ----------
 
 
@@ -0,0 +1,68 @@
+"""Tests for attribute projection in ``app.ws.projection``."""
+from app.config.models import AttributeProjection
+from app.ws.projection import AttributeProjector
+
+PLAYER = {
+    "entity_id": "media_player.tv",
+    "state": "playing",
+    "attributes": {"volume_level": 0.3, "media_title": "A", "source_list": ["HDMI 1", "HDMI 2"]},
+}
+SELECT = {
+    "entity_id": "select.mode",
+    "state": "eco",
+    "attributes": {"friendly_name": "Mode", "options": ["eco", "comfort"]},
+}
+
+
+def _rule(**kwargs) -> AttributeProjection:
+    return AttributeProjection(**kwargs)
+
+
+def test_include_and_exclude():
+    projector = AttributeProjector([
+        _rule(domain="media_player", exclude=["source_list"]),
+        _rule(domain="select", include=["friendly_name"]),
+    ])
+    assert projector.state(PLAYER)["attributes"] == {"volume_level": 0.3, "media_title": "A"}
+    assert projector.state(SELECT)["attributes"] == {"friendly_name": "Mode"}
+    # Inputs are not modified
+    assert "source_list" in PLAYER["attributes"]
+    assert projector.projected == 2
+
+
+def test_unmatched_and_unchanged_states_are_passed_through():
+    projector = AttributeProjector([_rule(domain="select", exclude=["icon"])])
+    assert projector.state(PLAYER) is PLAYER
+    assert projector.state(SELECT) is SELECT
+    assert projector.state(None) is None
+    assert AttributeProjector([]).passthrough
+
+
+def test_entity_rule_beats_domain_rule():
+    projector = AttributeProjector([
+        _rule(domain="media_player", include=["volume_level"]),
+        _rule(entity_id="media_player.tv", exclude=["media_title"]),
+    ])
+    assert set(projector.state(PLAYER)["attributes"]) == {"volume_level", "source_list"}
+
+
+def test_client_rules_override_configured_rules():
+    configured = AttributeProjector([
+        _rule(domain="media_player", exclude=["source_list"]),
+        _rule(domain="select", exclude=["options"]),
+    ])
+    # This client shows a source picker, so it wants source_list back
+    client = AttributeProjector([_rule(domain="media_player")], configured)
+    assert client.state(PLAYER) is PLAYER
+    assert "options" not in client.state(SELECT)["attributes"]
+
+
+def test_event_projects_both_states():
+    projector = AttributeProjector([_rule(domain="media_player", exclude=["source_list"])])
+    message = {"type": "state_changed", "entity_id": "media_player.tv",
+               "new_state": PLAYER, "old_state": PLAYER, "seq": 3}
+    projected = projector.event(message)
+    assert "source_list" not in projected["new_state"]["attributes"]
+    assert "source_list" not in projected["old_state"]["attributes"]
+    assert projected["seq"] == 3
+    assert projector.event({"type": "pong"}) == {"type": "pong"}
@@ -0,0 +1,39 @@
+"""Unit tests for the proxy's event sequence numbers and replay buffer."""
+from app.ws.replay import ReplayBuffer
+
+
+def _event(entity_id: str) -> dict:
+    return {"type": "state_changed", "entity_id": entity_id, "new_state": {}}
+
+
+def test_events_are_stamped_with_increasing_seq():
+    buffer = ReplayBuffer(lambda: 10)
+    events = buffer.record([_event("light.a"), _event("light.b")])
+    assert [e["seq"] for e in events] == [1, 2]
+    assert buffer.record([_event("light.a")])[0]["seq"] == 3
+
+
+def test_since_returns_only_missed_events():
+    buffer = ReplayBuffer(lambda: 10)
+    for n in range(5):
+        buffer.record([_event(f"light.{n}")])
+    missed = buffer.since(3, buffer.epoch)
+    assert [e["entity_id"] for e in missed] == ["light.3", "light.4"]
+    assert buffer.since(5, buffer.epoch) == []
+
+
+def test_gap_outside_buffer_needs_snapshot():
+    buffer = ReplayBuffer(lambda: 3)
+    for n in range(6):
+        buffer.record([_event(f"light.{n}")])
+    # Events 4..6 are buffered: resuming from 3 works, from 2 does not.
+    assert [e["seq"] for e in buffer.since(3, buffer.epoch)] == [4, 5, 6]
+    assert buffer.since(2, buffer.epoch) is None
+    assert buffer.stats()["resync_fallbacks"] == 1
+
+
+def test_other_epoch_or_future_seq_needs_snapshot():
+    buffer = ReplayBuffer(lambda: 10)
+    buffer.record([_event("light.a")])
+    assert buffer.since(1, "some-earlier-run") is None
+    assert buffer.since(7, buffer.epoch) is None
@@ -0,0 +1,117 @@
+"""Unit tests for the proxy's in-memory entity state mirror."""
+from app.ws.state_mirror import (
+    StateMirror,
+    apply_compressed_diff,
+    expand_compressed_state,
+)
+
+
+def _state(entity_id: str, state: str) -> dict:
+    return {"entity_id": entity_id, "state": state, "attributes": {}}
+
+
+def test_not_ready_until_seeded():
+    mirror = StateMirror()
+    assert mirror.ready is False
+    mirror.seed([_state("light.a", "on")])
+    assert mirror.ready is True
+    assert mirror.get("light.a")["state"] == "on"
+
+
+def test_apply_updates_and_removes():
+    mirror = StateMirror()
+    mirror.seed([_state("light.a", "on"), _state("light.b", "off")])
+    mirror.apply("light.a", _state("light.a", "off"))
+    mirror.apply("light.b", None)
+    assert mirror.get("light.a")["state"] == "off"
+    assert mirror.get("light.b") is None
+    assert len(mirror) == 1
+
+
+def test_reseed_reports_differences_only_after_first_seed():
+    mirror = StateMirror()
+    assert mirror.seed([_state("light.a", "on")]) == []
+    changes = mirror.seed([_state("light.a", "off"), _state("light.b", "on")])
+    assert [(eid, new["state"]) for eid, _old, new in changes] == [
+        ("light.a", "off"),
+        ("light.b", "on"),
+    ]
+    assert mirror.seed([_state("light.a", "off")]) == [
+        ("light.b", _state("light.b", "on"), None)
+    ]
+
+
+def test_invalidate_marks_stale_but_keeps_states():
+    mirror = StateMirror()
+    mirror.seed([_state("light.a", "on")])
+    mirror.invalidate()
+    assert mirror.ready is False
+    assert mirror.get("light.a") is not None
+
+
+# ---------- subscribe_entities compressed protocol ----------
+
+_LC = 1700000000.0  # 2023-11-14T22:13:20+00:00
+
+
+def test_expand_compressed_state():
+    state = expand_compressed_state(
+        "light.a",
+        {"s": "on", "a": {"brightness": 200}, "c": "ctx1", "lc": _LC},
+    )
+    assert state == {
+        "entity_id": "light.a",
+        "state": "on",
+        "attributes": {"brightness": 200},
+        "last_changed": "2023-11-14T22:13:20+00:00",
+        "last_updated": "2023-11-14T22:13:20+00:00",
+        "context": {"id": "ctx1", "parent_id": None, "user_id": None},
+    }
+
+
+def test_apply_compressed_diff_updates_and_removes_attributes():
+    base = expand_compressed_state(
+        "media_player.tv",
+        {"s": "playing", "a": {"volume": 0.3, "title": "X"}, "c": "c1", "lc": _LC},
+    )
+    new = apply_compressed_diff(
+        base,
+        {"+": {"a": {"volume": 0.5}, "c": "c2", "lu": _LC + 60}, "-": {"a": ["title"]}},
+    )
+    assert new["state"] == "playing"
+    assert new["attributes"] == {"volume": 0.5}
+    assert new["context"]["id"] == "c2"
+    assert new["last_changed"] == base["last_changed"]
+    assert new["last_updated"] == "2023-11-14T22:14:20+00:00"
+    # The original dict is left untouched (it is the event's old_state).
+    assert base["attributes"] == {"volume": 0.3, "title": "X"}
+
+
+def test_partial_context_diff_keeps_the_other_context_keys():
+    base = expand_compressed_state("light.a", {
+        "s": "on", "lc": _LC, "c": {"id": "c1", "parent_id": "p1", "user_id": "u1"},
+    })
+    new = apply_compressed_diff(base, {"+": {"s": "off", "c": {"id": "c2"}}})
+    assert new["context"] == {"id": "c2", "parent_id": "p1", "user_id": "u1"}
+    assert base["context"]["id"] == "c1"
+
+def test_apply_entities_event_snapshot_then_changes():
+    mirror = StateMirror()
+    mirror.begin_resync()
+    assert mirror.apply_entities_event(
+        {"a": {"light.a": {"s": "off", "a": {}, "c": "c1", "lc": _LC}}}
+    ) == []
+    assert mirror.ready
+
+    changes = mirror.apply_entities_event(
+        {"c": {"light.a": {"+": {"s": "on", "lc": _LC + 1, "c": "c2"}}}}
+    )
+    (entity_id, old, new), = changes
+    assert entity_id == "light.a"
+    assert old["state"] == "off"
+    assert new["state"] == "on"
+    assert mirror.get("light.a")["state"] == "on"
+
+    changes = mirror.apply_entities_event({"r": ["light.a"]})
+    assert changes == [("light.a", new, None)]
+    assert len(mirror) == 0
@@ -0,0 +1,138 @@
+"""Tests for /api/views/{view_id}/bootstrap."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config.manager import ConfigManager
+from app.config.models import CardItem, DashboardConfig, Section, ViewConfig
+from app.main import app
+from app.ws import proxy as ws_proxy
+from app.ws.snapshot import StateSnapshotStore
+
+STATES = [
+    {"entity_id": "light.kitchen", "state": "on", "attributes": {}},
+    {"entity_id": "sensor.kitchen_temp", "state": "21", "attributes": {}},
+    {"entity_id": "light.office", "state": "off", "attributes": {}},
+]
+AREAS = {"sensor.kitchen_temp": "kitchen", "light.office": "office"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    manager = ConfigManager(data_dir=tmp_path)
+    manager.save_dashboard(DashboardConfig(views=[ViewConfig(
+        id="kitchen", name="Kitchen",
+        sections=[Section(id="s1", title="Kitchen", items=[
+            CardItem(id="c1", type="light", entity="light.kitchen"),
+            CardItem(id="c2", type="area", config={"area_id": "kitchen"}),
+        ])],
+    )]))
+    monkeypatch.setattr("app.api.view_routes.config_manager", manager)
+    return TestClient(app)
+
+
+def _install_ha(monkeypatch, connected: bool, tmp_path=None, connect=None) -> list[bool]:
+    """Fake the proxy; ``connect`` stands in for the background HA connect."""
+    started: list[bool] = []
+    gateway = SimpleNamespace(connected=connected)
+
+    async def fake_connect():
+        if connect is not None:
+            await connect(gateway)
+
+    def fake_start():
+        started.append(True)
+        return asyncio.ensure_future(fake_connect())
+
+    async def fake_states():
+        return STATES
+
+    async def fake_area_map():
+        return AREAS
+
+    monkeypatch.setattr(ws_proxy, "_start_connecting", fake_start)
+    monkeypatch.setattr(ws_proxy, "_get_states", fake_states)
+    monkeypatch.setattr(ws_proxy, "_get_entity_area_map", fake_area_map)
+    monkeypatch.setattr(ws_proxy, "ha_gateway", gateway)
+    if tmp_path is not None:
+        monkeypatch.setattr(ws_proxy, "_snapshots",
+                            StateSnapshotStore(lambda: tmp_path / "snapshot.json.gz"))
+    return started
+
+
+def test_bootstrap_returns_view_and_only_its_states(client, monkeypatch):
+    _install_ha(monkeypatch, connected=True)
+    body = client.get("/api/views/kitchen/bootstrap").json()
+
+    assert body["view"]["id"] == "kitchen"
+    assert sorted(s["entity_id"] for s in body["states"]) == [
+        "light.kitchen", "sensor.kitchen_temp",
+    ]
+    assert body["entity_area_map"] == {"sensor.kitchen_temp": "kitchen"}
+    assert body["ha_connected"] is True
+    assert body["epoch"] == ws_proxy._replay.epoch
+
+
+def test_cold_start_waits_briefly_for_the_connection(client, monkeypatch, tmp_path):
+    async def connects(gateway):
+        await asyncio.sleep(0.05)
+        gateway.connected = True
+
+    started = _install_ha(monkeypatch, connected=False, tmp_path=tmp_path, connect=connects)
+    body = client.get("/api/views/kitchen/bootstrap").json()
+    assert started == [True]
+    assert body["ha_connected"] is True
+    assert body["stale"] is False
+    assert sorted(s["entity_id"] for s in body["states"]) == [
+        "light.kitchen", "sensor.kitchen_temp",
+    ]
+    assert body["epoch"] == ws_proxy._replay.epoch
+
+
+def test_bootstrap_without_ha_still_returns_view(client, monkeypatch, tmp_path):
+    async def never_connects(_gateway):
+        await asyncio.Event().wait()
+
+    # First paint waits for HA only up to the bound
+    started = _install_ha(monkeypatch, connected=False, tmp_path=tmp_path,
+                          connect=never_connects)
+    monkeypatch.setattr("app.api.view_routes._CONNECT_WAIT_SECONDS", 0.05)
+    body = client.get("/api/views/kitchen/bootstrap").json()
+    assert started == [True]
+    assert body["view"]["name"] == "Kitchen"
+    assert body["states"] == []
+    assert body["ha_connected"] is False
+    assert body["stale"] is False
+    assert (body["epoch"], body["seq"]) == (None, None)
+
+
+async def test_failed_background_connect_starts_the_supervisor(monkeypatch):
+    supervised: list[bool] = []
+
+    async def fail():
+        raise ConnectionError("HA unavailable")
+
+    monkeypatch.setattr(ws_proxy, "_ensure_ha_connection", fail)
+    monkeypatch.setattr(ws_proxy, "_start_supervisor", lambda: supervised.append(True))
+    await ws_proxy._connect_or_supervise()
+    assert supervised == [True]
+
+def test_bootstrap_during_outage_serves_snapshot(client, monkeypatch, tmp_path):
+    _install_ha(monkeypatch, connected=False, tmp_path=tmp_path)
+    asyncio.run(ws_proxy._snapshots.save(STATES, entity_area_map=AREAS))
+    body = client.get("/api/views/kitchen/bootstrap").json()
+    assert body["stale"] is True
+    assert sorted(s["entity_id"] for s in body["states"]) == [
+        "light.kitchen", "sensor.kitchen_temp",
+    ]
+    assert body["entity_area_map"] == {"sensor.kitchen_temp": "kitchen"}
+    # No resume point: resuming from the live stream would never replace
+    # these states, so the client has to do a full get_states
+    assert (body["epoch"], body["seq"]) == (None, None)
+
+
+def test_unknown_view_is_404(client, monkeypatch):
+    _install_ha(monkeypatch, connected=True)
+    assert client.get("/api/views/nope/bootstrap").status_code == 404
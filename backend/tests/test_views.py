@@ -0,0 +1,57 @@
+"""Unit tests for the dashboard view helpers."""
+from app.config.models import CardItem, Section, SubSection, ViewConfig
+from app.services.views import build_entity_area_map, collect_view_entities
+
+
+def test_build_entity_area_map_inherits_device_area():
+    devices = [{"id": "d1", "area_id": "kitchen"}, {"id": "d2"}]
+    registry = [
+        {"entity_id": "light.a", "device_id": "d1"},
+        {"entity_id": "light.b", "device_id": "d1", "area_id": "bath"},
+        {"entity_id": "light.c", "device_id": "d2"},
+    ]
+    assert build_entity_area_map(devices, registry) == {
+        "light.a": "kitchen",
+        "light.b": "bath",
+    }
+
+
+def test_collect_view_entities_walks_cards_config_and_areas():
+    view = ViewConfig(
+        id="home",
+        name="Home",
+        sections=[
+            Section(
+                id="s1",
+                title="",
+                items=[
+                    CardItem(id="c1", type="light", entity="light.a"),
+                    CardItem(
+                        id="c2",
+                        type="sonos",
+                        config={"media_player_entity": "media_player.sonos"},
+                    ),
+                    CardItem(id="c3", type="area_small", config={"area_id": "kitchen"}),
+                ],
+                subsections=[
+                    SubSection(
+                        id="sub",
+                        title="",
+                        items=[CardItem(id="c4", type="sensor", entity="sensor.t")],
+                    )
+                ],
+            )
+        ],
+    )
+    area_map = {"switch.kettle": "kitchen", "switch.other": "bath"}
+    assert collect_view_entities(view, area_map) == {
+        "light.a",
+        "media_player.sonos",
+        "sensor.t",
+        "switch.kettle",
+    }
+
+
+def test_collect_view_entities_expands_object_page_area():
+    view = ViewConfig(id="bath", name="Bath", area="bath")
+    assert collect_view_entities(view, {"switch.other": "bath"}) == {"switch.other"}
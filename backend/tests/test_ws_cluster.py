@@ -0,0 +1,137 @@
+"""Tests for multi-worker mode: two ``WorkerCluster`` instances in one
+process stand in for two uvicorn workers sharing a Unix socket."""
+import asyncio
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from app.config.models import ProxyConfig
+from app.ws import cluster as ws_cluster
+from app.ws import gateway as ws_gateway
+from app.ws.cluster import WorkerCluster
+from tests.test_ws_proxy import FakeHA
+
+
+@pytest.fixture
+async def workers(monkeypatch):
+    ha = FakeHA()
+
+    async def fake_connect(_url):
+        return ha.accept_connection()
+
+    async def fake_token():
+        return "token"
+
+    monkeypatch.setattr(ws_gateway.websockets, "connect", fake_connect)
+    monkeypatch.setattr(ws_gateway, "_get_ha_token", fake_token)
+
+    path = str(Path(tempfile.mkdtemp(prefix="dh")) / "ipc.sock")
+    owner_gw = ws_gateway.HAGateway(ProxyConfig())
+    follower_gw = ws_gateway.HAGateway(ProxyConfig())
+    owner, follower = WorkerCluster(owner_gw), WorkerCluster(follower_gw)
+    published: list[dict] = []
+    for cluster in (owner, follower):
+        cluster.configure(path)
+    owner.ensure_upstream = owner_gw.connect
+    owner.snapshot = lambda: {"op": "snapshot", "states": []}
+    follower.on_message = published.append
+
+    await owner.ensure_started()
+    await follower.ensure_started()
+    yield ha, owner, follower, published
+    await follower.close()
+    await owner.close()
+    await ha.close()
+
+
+async def test_roles_are_elected(workers):
+    _ha, owner, follower, _published = workers
+    assert owner.role == "owner"
+    assert follower.role == "follower"
+    assert follower._gateway.connected
+
+
+async def test_follower_commands_use_the_owners_connection(workers):
+    ha, _owner, follower, _published = workers
+    ha.handlers["get_panels"] = lambda msg: ha.reply(msg["id"], result={"lovelace": {}})
+
+    resp = await follower._gateway.command("get_panels")
+    assert resp["result"] == {"lovelace": {}}
+    assert ha.connects == 1
+    assert follower._gateway.stats()["forwarded"] == 1
+
+
+async def test_follower_subscriptions_receive_events(workers):
+    ha, _owner, follower, _published = workers
+    events: list[dict] = []
+    await follower._gateway.subscribe("subscribe_entities", events.append)
+    await asyncio.sleep(0.05)
+    # FakeHA answers subscribe_entities with an "a" snapshot event.
+    assert events and "a" in events[0]
+
+
+async def test_owner_publishes_to_following_workers(workers):
+    _ha, owner, follower, published = workers
+    owner.publish({"op": "events", "events": []})  # not following yet
+    await follower.request("follow", timeout=5.0)
+    owner.publish({"op": "notify", "message": {"type": "ha_disconnected"}})
+    await asyncio.sleep(0.05)
+    assert [m["op"] for m in published] == ["snapshot", "notify"]
+
+
+async def test_owner_drops_a_follower_that_stops_reading(workers, monkeypatch):
+    _ha, owner, _follower, _published = workers
+    monkeypatch.setattr(ws_cluster, "_LINK_QUEUE", 4)
+    reader, writer = await asyncio.open_unix_connection(owner.path)
+    try:
+        await ws_cluster._write_frame(writer, {"op": "follow", "id": 1})
+        await asyncio.sleep(0.05)
+        assert owner.stats()["followers"] == 1
+
+        # Never read: the socket and the link's queue fill up, then it is cut
+        blob = "x" * (1024 * 1024)
+        for _ in range(8):
+            owner.publish({"op": "notify", "message": {"blob": blob}})
+        await asyncio.sleep(0.05)
+        assert owner.stats()["followers"] == 0
+    finally:
+        writer.close()
+
+
+async def test_follower_takes_over_when_owner_exits(workers):
+    _ha, owner, follower, _published = workers
+    lost: list[bool] = []
+    follower._gateway.add_disconnect_listener(lambda: lost.append(True))
+
+    await owner.close()
+    await follower.reader_task
+    assert lost == [True]
+    assert follower.role is None
+
+    await follower.ensure_started()
+    assert follower.role == "owner"
+
+
+async def test_follower_rest_route_elects_before_connecting(workers, monkeypatch):
+    """REST routes connect through ``require_ha``; a worker that has not
+    elected yet must join as follower instead of opening its own upstream."""
+    from app.api import panel_routes
+
+    ha, owner, _follower, _published = workers
+    ha.handlers["get_panels"] = lambda msg: ha.reply(msg["id"], result={"lovelace": {}})
+    late_gw = ws_gateway.HAGateway(ProxyConfig())
+    late = WorkerCluster(late_gw)
+    late.configure(owner.path)
+    late_gw.elect = late.ensure_started
+    monkeypatch.setattr(ws_gateway, "ha_gateway", late_gw)
+    monkeypatch.setattr(panel_routes, "ha_gateway", late_gw)
+
+    try:
+        resp = await panel_routes._ha_ws_command("get_panels")
+        assert resp["result"] == {"lovelace": {}}
+        assert late.role == "follower"
+        assert late_gw.connection is None
+        assert ha.connects == 1
+    finally:
+        await late.close()
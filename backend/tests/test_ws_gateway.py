@@ -0,0 +1,115 @@
+"""Tests for the shared, multiplexed HA connection in ``app.ws.gateway``."""
+import asyncio
+
+import pytest
+
+from app.config.models import ProxyConfig
+from app.ws import gateway as ws_gateway
+from tests.test_ws_proxy import FakeHA
+
+
+@pytest.fixture
+async def fake_ha(monkeypatch):
+    ha = FakeHA()
+
+    async def fake_connect(_url):
+        return ha.accept_connection()
+
+    async def fake_token():
+        return "token"
+
+    monkeypatch.setattr(ws_gateway.websockets, "connect", fake_connect)
+    monkeypatch.setattr(ws_gateway, "_get_ha_token", fake_token)
+    yield ha
+    await ha.close()
+
+
+async def _gateway(**config) -> ws_gateway.HAGateway:
+    gateway = ws_gateway.HAGateway(ProxyConfig(**config))
+    await gateway.connect()
+    return gateway
+
+
+async def test_concurrent_commands_demultiplexed_by_id(fake_ha):
+    gateway = await _gateway()
+    held: list[dict] = []
+    fake_ha.handlers["slow"] = held.append
+    fake_ha.handlers["fast"] = lambda msg: fake_ha.reply(msg["id"], result="fast")
+
+    slow = asyncio.create_task(gateway.command("slow"))
+    assert (await gateway.command("fast"))["result"] == "fast"
+    assert not slow.done()
+
+    fake_ha.reply(held[0]["id"], result="slow")
+    assert (await slow)["result"] == "slow"
+    # A second command reuses the same connection.
+    assert fake_ha.connects == 1
+    assert await gateway.connect() is False
+
+
+async def test_command_timeout(fake_ha):
+    gateway = await _gateway()
+    fake_ha.handlers["never"] = lambda msg: None
+    with pytest.raises(asyncio.TimeoutError):
+        await gateway.command("never", timeout=0.01)
+    assert gateway.stats()["timeouts"] == 1
+    assert gateway.stats()["inflight"] == 0
+
+
+async def test_inflight_cap(fake_ha):
+    gateway = await _gateway(upstream_max_inflight=2)
+    held: list[dict] = []
+    fake_ha.handlers["slow"] = held.append
+
+    tasks = [asyncio.create_task(gateway.command("slow")) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    assert len(held) == 2  # the third waits for a slot
+
+    fake_ha.reply(held[0]["id"])
+    await asyncio.sleep(0.01)
+    assert len(held) == 3
+    for msg in held[1:]:
+        fake_ha.reply(msg["id"])
+    await asyncio.gather(*tasks)
+    assert gateway.stats()["peak_inflight"] == 2
+
+
+async def test_subscription_events_routed_to_handler(fake_ha):
+    gateway = await _gateway()
+    events: list[dict] = []
+    sub_id = await gateway.subscribe("subscribe_entities", events.append)
+    fake_ha.event(sub_id, {"c": {}})
+    await asyncio.sleep(0.01)
+    # The FakeHA snapshot plus the pushed event.
+    assert len(events) == 2
+
+    await gateway.unsubscribe(sub_id)
+    fake_ha.event(sub_id, {"c": {}})
+    await asyncio.sleep(0.01)
+    assert len(events) == 2
+
+
+async def test_disconnect_cancels_pending_and_notifies(fake_ha):
+    gateway = await _gateway()
+    lost: list[bool] = []
+    gateway.add_disconnect_listener(lambda: lost.append(True))
+    fake_ha.handlers["never"] = lambda msg: None
+
+    pending = asyncio.create_task(gateway.command("never"))
+    await asyncio.sleep(0)
+    await fake_ha.close()
+    await gateway.listen_task
+
+    assert lost == [True]
+    assert not gateway.connected
+    with pytest.raises(asyncio.CancelledError):
+        await pending
+
+
+async def test_missing_token(monkeypatch):
+    async def no_token():
+        return ""
+
+    monkeypatch.setattr(ws_gateway, "_get_ha_token", no_token)
+    with pytest.raises(ws_gateway.HATokenMissing):
+        await ws_gateway.HAGateway(ProxyConfig()).connect()
@@ -0,0 +1,363 @@
+"""Unit tests for ConnectionManager fan-out.
+
+Uses a minimal fake WebSocket that records sent frames, so no server is
+needed.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app import codec
+from app.config.models import ProxyConfig
+from app.ws import manager as ws_manager_module
+from app.ws.manager import MSGPACK_SUBPROTOCOL, ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent: list[dict] = []
+        self.closed = False
+        # Cleared to simulate a stalled client whose sends never complete.
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        await self.writable.wait()
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+@pytest.fixture
+async def manager():
+    mgr = ConnectionManager(ProxyConfig())
+    yield mgr
+    for ws in list(mgr.clients):
+        mgr.disconnect_client(ws)
+
+
+async def _settle():
+    """Let the per-client writer tasks drain their queues."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _connect(manager, count: int) -> list[FakeWebSocket]:
+    clients = [FakeWebSocket() for _ in range(count)]
+    for ws in clients:
+        await manager.connect_client(ws)
+    return clients
+
+
+def _event(entity_id: str) -> dict:
+    return {"type": "state_changed", "entity_id": entity_id, "new_state": {}}
+
+
+async def test_unsubscribed_clients_receive_everything(manager):
+    a, b = await _connect(manager, 2)
+    manager.broadcast(_event("sensor.power"))
+    await _settle()
+    assert len(a.sent) == len(b.sent) == 1
+
+
+async def test_subscribed_client_only_gets_its_entities(manager):
+    phone, tablet = await _connect(manager, 2)
+    assert manager.subscribe(phone, ["light.kitchen"]) == 1
+
+    manager.broadcast(_event("sensor.power"))
+    manager.broadcast(_event("light.kitchen"))
+    await _settle()
+
+    assert [m["entity_id"] for m in phone.sent] == ["light.kitchen"]
+    assert len(tablet.sent) == 2
+
+
+async def test_resubscribe_and_unsubscribe_update_index(manager):
+    (phone,) = await _connect(manager, 1)
+    manager.subscribe(phone, ["light.kitchen"])
+    manager.subscribe(phone, ["light.bath"])
+    manager.broadcast(_event("light.kitchen"))
+    await _settle()
+    assert phone.sent == []
+    assert "light.kitchen" not in manager._entity_index
+
+    manager.unsubscribe(phone)
+    manager.broadcast(_event("light.kitchen"))
+    await _settle()
+    assert len(phone.sent) == 1
+
+
+async def test_disconnect_clears_subscription(manager):
+    (phone,) = await _connect(manager, 1)
+    manager.subscribe(phone, ["light.kitchen"])
+    manager.disconnect_client(phone)
+    assert manager._entity_index == {}
+    assert manager.subscription(phone) is None
+
+
+async def _stalled_client(manager, policy: str, size: int = 2) -> FakeWebSocket:
+    manager._config = ProxyConfig(send_queue_size=size, slow_consumer_policy=policy)
+    (ws,) = await _connect(manager, 1)
+    ws.writable.clear()
+    return ws
+
+
+async def test_stalled_client_does_not_block_others(manager):
+    stalled = await _stalled_client(manager, "drop_oldest")
+    manager._config = ProxyConfig()
+    (healthy,) = await _connect(manager, 1)
+
+    manager.broadcast(_event("sensor.power"))
+    await _settle()
+    assert len(healthy.sent) == 1
+    assert stalled.sent == []
+
+
+async def test_drop_oldest_policy(manager):
+    ws = await _stalled_client(manager, "drop_oldest")
+    manager.broadcast({**_event("sensor.power"), "n": 0})
+    await _settle()  # writer picks up the first event and blocks on it
+    for n in range(1, 4):
+        manager.broadcast({**_event("sensor.power"), "n": n})
+    ws.writable.set()
+    await _settle()
+    assert [m["n"] for m in ws.sent] == [0, 2, 3]
+    assert manager.stats()["dropped"] == 1
+
+
+async def test_coalesce_policy_keeps_latest_per_entity(manager):
+    ws = await _stalled_client(manager, "coalesce")
+    manager.broadcast({**_event("sensor.power"), "n": 0})
+    await _settle()
+    for n in range(1, 4):
+        manager.broadcast({**_event("sensor.power"), "n": n})
+    manager.broadcast({**_event("light.a"), "n": 9})
+    ws.writable.set()
+    await _settle()
+    assert [m["n"] for m in ws.sent] == [0, 3, 9]
+    assert manager.stats()["coalesced"] == 2
+
+
+async def test_disconnect_policy_drops_slow_client(manager):
+    ws = await _stalled_client(manager, "disconnect", size=1)
+    manager.broadcast(_event("sensor.power"))
+    await _settle()
+    manager.broadcast(_event("sensor.power"))
+    manager.broadcast(_event("sensor.power"))
+    await _settle()
+    assert ws not in manager.clients
+    assert ws.closed
+    assert manager.stats()["slow_disconnects"] == 1
+
+
+async def test_replies_are_never_dropped(manager):
+    ws = await _stalled_client(manager, "drop_oldest", size=1)
+    manager.send(ws, {"type": "pong"})
+    for _ in range(3):
+        manager.broadcast(_event("sensor.power"))
+    ws.writable.set()
+    await _settle()
+    assert ws.sent[0] == {"type": "pong"}
+
+
+async def test_delta_clients_get_only_changed_fields(manager):
+    full, delta = await _connect(manager, 2)
+    manager.set_delta_states(delta, True)
+    base = {
+        "entity_id": "media_player.tv",
+        "state": "playing",
+        "attributes": {"volume": 0.3, "title": "A", "source_list": ["HDMI 1"]},
+    }
+    manager.send(delta, {"type": "states_result", "result": [base]})
+    newer = {**base, "attributes": {"volume": 0.5, "source_list": ["HDMI 1"]}}
+    manager.broadcast({
+        "type": "state_changed",
+        "entity_id": "media_player.tv",
+        "new_state": newer,
+        "old_state": base,
+    })
+    await _settle()
+
+    assert full.sent[-1]["new_state"] == newer
+    assert delta.sent[-1] == {
+        "type": "state_delta",
+        "entity_id": "media_player.tv",
+        "attributes": {"volume": 0.5},
+        "removed": ["title"],
+    }
+
+
+async def test_delta_client_without_base_gets_full_state(manager):
+    (ws,) = await _connect(manager, 1)
+    manager.set_delta_states(ws, True)
+    state = {"entity_id": "light.a", "state": "on", "attributes": {}}
+    manager.broadcast({"type": "state_changed", "entity_id": "light.a",
+                       "new_state": state, "old_state": None})
+    manager.broadcast({"type": "state_changed", "entity_id": "light.a",
+                       "new_state": {**state, "state": "off"}, "old_state": state})
+    await _settle()
+    assert ws.sent == [
+        {"type": "state_changed", "entity_id": "light.a", "new_state": state},
+        {"type": "state_delta", "entity_id": "light.a", "state": "off"},
+    ]
+
+
+async def test_broadcast_states_sends_one_batch_per_client(manager):
+    everything, phone = await _connect(manager, 2)
+    manager.subscribe(phone, ["sensor.plug"])
+    manager.broadcast_states([_event("sensor.plug"), _event("sensor.grid")])
+    await _settle()
+
+    (batch,) = everything.sent
+    assert batch["type"] == "states_batch"
+    assert [e["entity_id"] for e in batch["events"]] == ["sensor.plug", "sensor.grid"]
+    # A client interested in only one of the entities gets a plain event.
+    assert phone.sent == [_event("sensor.plug")]
+
+
+async def test_delta_messages_keep_seq(manager):
+    (ws,) = await _connect(manager, 1)
+    manager.set_delta_states(ws, True)
+    state = {"entity_id": "light.a", "state": "on", "attributes": {}}
+    manager.broadcast({"type": "state_changed", "entity_id": "light.a",
+                       "new_state": state, "seq": 7})
+    manager.broadcast({"type": "state_changed", "entity_id": "light.a",
+                       "new_state": {**state, "state": "off"}, "seq": 8})
+    await _settle()
+    assert [m["seq"] for m in ws.sent] == [7, 8]
+    assert ws.sent[1]["type"] == "state_delta"
+
+
+async def test_byte_and_encode_counters(manager):
+    (ws,) = await _connect(manager, 1)
+    manager.send(ws, {"type": "pong"})
+    manager.broadcast(_event("sensor.power"))
+    await _settle()
+
+    (conn,) = manager.stats()["connections"]
+    expected = len(codec.dumps({"type": "pong"})) + len(codec.dumps(_event("sensor.power")))
+    assert conn["encoding"] == "json"
+    assert conn["bytes_sent"] == expected
+    assert manager.stats()["bytes_sent"] == expected
+    manager.disconnect_client(ws)
+    # Totals outlive the connection
+    assert manager.stats()["bytes_sent"] == expected
+
+
+class FakeMsgpack:
+    @staticmethod
+    def packb(message):
+        return b"mp:" + json.dumps(message).encode()
+
+
+class BinaryWebSocket(FakeWebSocket):
+    def __init__(self, subprotocols):
+        super().__init__()
+        self.scope = {"subprotocols": subprotocols}
+        self.subprotocol = None
+        self.frames: list[bytes] = []
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_bytes(self, data: bytes):
+        self.frames.append(data)
+
+
+async def test_msgpack_negotiated_by_subprotocol(manager, monkeypatch):
+    monkeypatch.setattr(ws_manager_module, "msgpack", FakeMsgpack)
+    ws = BinaryWebSocket([MSGPACK_SUBPROTOCOL])
+    await manager.connect_client(ws)
+    manager.set_delta_states(ws, True)
+    manager.broadcast(_event("light.a"))
+    await _settle()
+
+    assert ws.subprotocol == MSGPACK_SUBPROTOCOL
+    assert ws.sent == []
+    assert ws.frames == [FakeMsgpack.packb(
+        {"type": "state_changed", "entity_id": "light.a", "new_state": {}}
+    )]
+    assert manager.stats()["connections"][0]["bytes_sent"] == len(ws.frames[0])
+
+
+async def test_msgpack_falls_back_to_json_when_not_installed(manager, monkeypatch):
+    monkeypatch.setattr(ws_manager_module, "msgpack", None)
+    ws = BinaryWebSocket([MSGPACK_SUBPROTOCOL])
+    await manager.connect_client(ws)
+    manager.broadcast(_event("light.a"))
+    await _settle()
+
+    assert ws.subprotocol is None
+    assert ws.sent == [_event("light.a")]
+
+
+async def test_attribute_projection_with_client_overrides():
+    from app.config.models import AttributeProjection
+
+    manager = ConnectionManager(ProxyConfig(attribute_projection=[
+        AttributeProjection(domain="media_player", exclude=["source_list"]),
+    ]))
+    default, full, custom = await _connect(manager, 3)
+    manager.set_projection(full, False)
+    manager.set_projection(custom, [AttributeProjection(domain="media_player",
+                                                        include=["volume_level"])])
+    state = {"entity_id": "media_player.tv", "state": "on",
+             "attributes": {"volume_level": 0.5, "media_title": "A", "source_list": ["TV"]}}
+    manager.broadcast({"type": "state_changed", "entity_id": "media_player.tv",
+                       "new_state": state})
+    manager.broadcast_states([
+        {"type": "state_changed", "entity_id": "media_player.tv", "new_state": state},
+        _event("sensor.power"),
+    ])
+    await _settle()
+
+    assert default.sent[0]["new_state"]["attributes"] == {"volume_level": 0.5, "media_title": "A"}
+    assert full.sent[0]["new_state"] == state
+    assert custom.sent[0]["new_state"]["attributes"] == {"volume_level": 0.5}
+    assert custom.sent[1]["events"][0]["new_state"]["attributes"] == {"volume_level": 0.5}
+    assert manager.projector(default).states([state])[0]["attributes"] == {
+        "volume_level": 0.5, "media_title": "A",
+    }
+
+    manager.set_projection(custom, None)
+    assert manager.projector(custom) is manager.projector(default)
+    for ws in list(manager.clients):
+        manager.disconnect_client(ws)
+
+
+async def test_heartbeat_tracks_rtt_and_evicts_silent_clients(monkeypatch):
+    manager = ConnectionManager(ProxyConfig(heartbeat_timeout=30))
+    answering, silent, legacy = await _connect(manager, 3)
+    clock = [1000.0]
+    monkeypatch.setattr(ws_manager_module.time, "monotonic", lambda: clock[0])
+
+    manager.heartbeat()
+    await _settle()
+    assert answering.sent == [{"type": "heartbeat", "n": 1}]
+    clock[0] += 0.05
+    manager.heartbeat_ack(answering, 1)
+    manager.heartbeat_ack(silent, 1)
+    assert manager.live_clients() == 2
+    assert manager.stats()["connections"][0]["rtt_ms"]["p50"] == 50.0
+
+    # The silent client stops answering; the one that never answered stays
+    clock[0] += 20
+    manager.heartbeat()
+    manager.heartbeat_ack(answering, 2)
+    clock[0] += 20
+    manager.heartbeat()
+    await _settle()
+
+    assert manager.clients == [answering, legacy]
+    assert silent.closed
+    stats = manager.stats()
+    assert stats["heartbeat_evictions"] == 1
+    assert stats["live_clients"] == 1
+    assert stats["rtt_ms"]["samples"] == 2
+    for ws in list(manager.clients):
+        manager.disconnect_client(ws)
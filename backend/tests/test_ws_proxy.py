@@ -0,0 +1,471 @@
+"""Tests for the HA-facing side of ``app.ws.proxy``.
+
+``FakeHA`` stands in for the upstream Home Assistant WebSocket: it answers
+the auth handshake, replies to commands via per-type handlers and lets tests
+push events into the proxy's listener.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.config.models import ProxyConfig
+from app.ws import gateway as ws_gateway
+from app.ws import proxy as ws_proxy
+from app.ws.forecasts import ForecastCache
+from app.ws.snapshot import StateSnapshotStore
+from app.ws.state_mirror import StateMirror
+
+_LC = 1700000000.0
+
+
+class FakeHA:
+    def __init__(self, entities: dict | None = None):
+        self.entities = entities if entities is not None else {
+            "light.kitchen": {"s": "off", "a": {"friendly_name": "Kitchen"}, "c": "c0", "lc": _LC},
+        }
+        self.commands: list[dict] = []
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self.handlers = {
+            "subscribe_entities": self._subscribe_entities,
+        }
+        self.entities_sub_id: int | None = None
+        self.connects = 0
+        self.reachable = True
+        self._handshake: list[dict] = []
+
+    def accept_connection(self) -> "FakeHA":
+        if not self.reachable:
+            raise OSError("connection refused")
+        self.connects += 1
+        self._handshake = [{"type": "auth_required"}, {"type": "auth_ok"}]
+        self._inbox = asyncio.Queue()
+        return self
+
+    # --- websockets client API used by the proxy ---
+
+    async def recv(self) -> str:
+        return json.dumps(self._handshake.pop(0))
+
+    async def send(self, raw: str):
+        msg = json.loads(raw)
+        if msg.get("type") == "auth":
+            return
+        self.commands.append(msg)
+        handler = self.handlers.get(msg["type"])
+        if handler is not None:
+            handler(msg)
+        else:
+            self.reply(msg["id"], result=None)
+
+    async def ping(self):
+        pass
+
+    async def close(self):
+        self._inbox.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        msg = await self._inbox.get()
+        if msg is None:
+            raise StopAsyncIteration
+        return json.dumps(msg)
+
+    # --- helpers for tests ---
+
+    def reply(self, msg_id: int, result=None, success: bool = True):
+        self._inbox.put_nowait(
+            {"id": msg_id, "type": "result", "success": success, "result": result}
+        )
+
+    def event(self, msg_id: int, event: dict):
+        self._inbox.put_nowait({"id": msg_id, "type": "event", "event": event})
+
+    def _subscribe_entities(self, msg):
+        self.entities_sub_id = msg["id"]
+        self.reply(msg["id"])
+        self.event(msg["id"], {"a": self.entities})
+
+    def sent_types(self) -> list[str]:
+        return [c["type"] for c in self.commands]
+
+
+@pytest.fixture
+async def fake_ha(monkeypatch, tmp_path):
+    ha = FakeHA()
+
+    async def fake_connect(_url):
+        return ha.accept_connection()
+
+    async def fake_token():
+        return "token"
+
+    gateway = ws_gateway.HAGateway(ProxyConfig())
+    gateway.add_disconnect_listener(ws_proxy._on_upstream_lost)
+    monkeypatch.setattr(ws_gateway.websockets, "connect", fake_connect)
+    monkeypatch.setattr(ws_gateway, "_get_ha_token", fake_token)
+    monkeypatch.setattr(ws_proxy, "ha_gateway", gateway)
+    monkeypatch.setattr(ws_proxy, "_state_mirror", StateMirror())
+    monkeypatch.setattr(ws_proxy, "_subscribed", False)
+    monkeypatch.setattr(ws_proxy, "_connect_lock", None)
+    monkeypatch.setattr(ws_proxy, "_snapshot_received", None)
+    monkeypatch.setattr(ws_proxy, "_supervisor_task", None)
+    monkeypatch.setattr(ws_proxy, "_snapshot_task", None)
+    monkeypatch.setattr(ws_proxy, "_snapshots",
+                        StateSnapshotStore(lambda: tmp_path / "state_snapshot.json.gz"))
+    monkeypatch.setattr(ws_proxy, "_RECONNECT_BACKOFF_INITIAL", 0.01)
+    monkeypatch.setattr(ws_proxy, "_forecasts", ForecastCache(
+        ws_proxy._forecasts._subscribe, ws_proxy._forecasts._push
+    ))
+    monkeypatch.setattr(ws_proxy, "_upstream_stats", {
+        "reconnects": 0,
+        "failed_attempts": 0,
+        "down_since": None,
+        "last_downtime_seconds": None,
+        "total_downtime_seconds": 0.0,
+    })
+    broadcasts: list[dict] = []
+    notices: list[dict] = []
+    monkeypatch.setattr(ws_proxy.ws_manager, "broadcast", broadcasts.append)
+    monkeypatch.setattr(ws_proxy.ws_manager, "notify", notices.append)
+    ha.broadcasts = broadcasts
+    ha.notices = notices
+    yield ha
+    if ws_proxy._supervisor_task is not None:
+        ws_proxy._supervisor_task.cancel()
+    if ws_proxy._snapshot_task is not None:
+        ws_proxy._snapshot_task.cancel()
+    await ha.close()
+    if ws_proxy.ha_gateway.listen_task is not None:
+        await ws_proxy.ha_gateway.listen_task
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_connect_uses_subscribe_entities_and_seeds_mirror(fake_ha):
+    await ws_proxy._ensure_ha_connection()
+    assert fake_ha.sent_types() == ["subscribe_entities"]
+    assert ws_proxy._state_mirror.ready
+
+    states = await ws_proxy._get_states()
+    assert [s["entity_id"] for s in states] == ["light.kitchen"]
+    assert states[0]["last_changed"] == "2023-11-14T22:13:20+00:00"
+    # Served locally: no get_states round trip.
+    assert "get_states" not in fake_ha.sent_types()
+
+
+async def test_compressed_diffs_are_broadcast_as_full_state_changed(fake_ha):
+    await ws_proxy._ensure_ha_connection()
+    fake_ha.event(
+        fake_ha.entities_sub_id,
+        {"c": {"light.kitchen": {"+": {"s": "on", "lc": _LC + 5, "c": "c1"}}}},
+    )
+    await _settle()
+
+    (msg,) = fake_ha.broadcasts
+    assert msg["type"] == "state_changed"
+    assert msg["entity_id"] == "light.kitchen"
+    assert msg["old_state"]["state"] == "off"
+    assert msg["new_state"]["state"] == "on"
+    assert msg["new_state"]["attributes"] == {"friendly_name": "Kitchen"}
+
+
+async def test_mirror_goes_stale_when_upstream_drops(fake_ha):
+    await ws_proxy._ensure_ha_connection()
+    ws_proxy._supervisor_task.cancel()
+    await fake_ha.close()
+    await ws_proxy.ha_gateway.listen_task
+    assert not ws_proxy.ha_gateway.connected
+    assert not ws_proxy._state_mirror.ready
+
+
+async def test_supervisor_reconnects_and_notifies_clients(fake_ha):
+    await ws_proxy._ensure_ha_connection()
+    fake_ha.reachable = False
+    await fake_ha.close()
+    await asyncio.sleep(0.05)
+    assert fake_ha.notices == [{"type": "ha_disconnected"}]
+    assert ws_proxy._upstream_status()["failed_attempts"] >= 1
+
+    # HA comes back with a changed entity: clients get the diff + a notice.
+    fake_ha.entities["light.kitchen"] = {"s": "on", "a": {}, "c": "c9", "lc": _LC + 9}
+    fake_ha.reachable = True
+    for _ in range(100):
+        if len(fake_ha.notices) > 1:
+            break
+        await asyncio.sleep(0.02)
+
+    assert fake_ha.notices[-1]["type"] == "ha_reconnected"
+    assert fake_ha.connects == 2
+    assert fake_ha.sent_types().count("subscribe_entities") == 2
+    assert [m["new_state"]["state"] for m in fake_ha.broadcasts] == ["on"]
+    status = ws_proxy._upstream_status()
+    assert status["connected"] is True
+    assert status["reconnects"] == 1
+    assert status["last_downtime_seconds"] > 0
+
+
+async def test_slow_forecast_does_not_delay_call_service(fake_ha, monkeypatch):
+    await ws_proxy._ensure_ha_connection()
+    replies: list[dict] = []
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda _ws, msg: replies.append(msg))
+    # HA never answers the forecast subscription.
+    fake_ha.handlers["weather/subscribe_forecast"] = lambda msg: None
+
+    session = ws_proxy._ClientSession(object(), max_inflight=4)
+    await session.dispatch({"type": "weather_forecast", "id": "f1"})
+    await session.dispatch({
+        "type": "call_service", "id": "c1", "domain": "light",
+        "service": "toggle", "target": {"entity_id": "light.kitchen"},
+    })
+    await _settle()
+
+    assert replies == [
+        {"type": "result", "success": True, "result": None, "error": None, "id": "c1"}
+    ]
+    session.close()
+
+
+async def test_inflight_limit_backpressures_dispatch(fake_ha):
+    await ws_proxy._ensure_ha_connection()
+    fake_ha.handlers["weather/subscribe_forecast"] = lambda msg: None
+
+    session = ws_proxy._ClientSession(object(), max_inflight=1)
+    await session.dispatch({"type": "weather_forecast"})
+    blocked = asyncio.create_task(session.dispatch({"type": "get_states"}))
+    await _settle()
+    assert not blocked.done()
+
+    session.close()  # frees the slot held by the forecast
+    await asyncio.wait_for(blocked, timeout=1)
+    session.close()
+
+
+def _serve_forecasts(fake_ha):
+    def subscribe_forecast(msg):
+        fake_ha.forecast_sub_ids[msg["forecast_type"]] = msg["id"]
+        fake_ha.reply(msg["id"])
+        fake_ha.event(msg["id"], {"type": msg["forecast_type"],
+                                  "forecast": [{"temperature": 20}]})
+
+    fake_ha.forecast_sub_ids = {}
+    fake_ha.handlers["weather/subscribe_forecast"] = subscribe_forecast
+
+
+async def test_forecast_subscriptions_are_shared_and_cached(fake_ha, monkeypatch):
+    await ws_proxy._ensure_ha_connection()
+    _serve_forecasts(fake_ha)
+    replies: list[tuple[object, dict]] = []
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda ws, msg: replies.append((ws, msg)))
+
+    phone, tablet = object(), object()
+    await ws_proxy._handle_weather_forecast(phone, {"entity_id": "weather.home"})
+    await ws_proxy._handle_weather_forecast(tablet, {"entity_id": "weather.home"})
+    assert fake_ha.sent_types().count("weather/subscribe_forecast") == 2  # hourly + daily
+    assert "unsubscribe_events" not in fake_ha.sent_types()
+    assert replies[-1][1]["daily"] == [{"temperature": 20}]
+    assert ws_proxy._forecasts.stats()["hits"] == 2
+
+    # HA pushes a new daily forecast: both watchers get it.
+    replies.clear()
+    fake_ha.event(fake_ha.forecast_sub_ids["daily"], {"forecast": [{"temperature": 25}]})
+    await _settle()
+    assert {ws for ws, _ in replies} == {phone, tablet}
+    assert replies[0][1] == {
+        "type": "weather_forecast_update",
+        "entity_id": "weather.home",
+        "forecast_type": "daily",
+        "forecast": [{"temperature": 25}],
+    }
+
+
+async def test_forecast_subscriptions_replayed_on_reconnect(fake_ha, monkeypatch):
+    await ws_proxy._ensure_ha_connection()
+    _serve_forecasts(fake_ha)
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda ws, msg: None)
+    assert await ws_proxy._forecasts.get("weather.home", "daily") == [{"temperature": 20}]
+
+    ws_proxy._supervisor_task.cancel()
+    await fake_ha.close()
+    await ws_proxy.ha_gateway.listen_task
+    # Served from cache while HA is down
+    assert await ws_proxy._forecasts.get("weather.home", "daily") == [{"temperature": 20}]
+
+    await ws_proxy._ensure_ha_connection()
+    await _settle()
+    assert fake_ha.sent_types().count("weather/subscribe_forecast") == 2
+    assert ws_proxy._forecasts.stats()["subscriptions"] == 1
+
+
+async def test_resume_replays_only_missed_events(fake_ha, monkeypatch):
+    await ws_proxy._ensure_ha_connection()
+    replay = ws_proxy.ReplayBuffer(lambda: 2)
+    monkeypatch.setattr(ws_proxy, "_replay", replay)
+    replies: list[dict] = []
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda _ws, msg: replies.append(msg))
+    monkeypatch.setattr(ws_proxy.ws_manager, "subscription", lambda _ws: None)
+
+    for state in ("on", "off", "on"):
+        replay.record([{"type": "state_changed", "entity_id": "light.kitchen",
+                        "new_state": {"state": state}}])
+
+    await ws_proxy._handle_resume(object(), {"last_seq": 2, "epoch": replay.epoch, "id": "r"})
+    batch, result = replies
+    assert [e["seq"] for e in batch["events"]] == [3]
+    assert result == {"type": "resume_result", "success": True, "replayed": 1, "seq": 3, "id": "r"}
+
+    # Seq 1 has been evicted: the client gets a full snapshot instead.
+    replies.clear()
+    await ws_proxy._handle_resume(object(), {"last_seq": 0, "epoch": replay.epoch})
+    assert replies[0]["success"] is False
+    assert replies[1]["type"] == "states_result"
+    assert replies[1]["seq"] == 3
+
+
+async def test_slider_burst_sends_only_latest_value(fake_ha, monkeypatch):
+    await ws_proxy._ensure_ha_connection()
+    monkeypatch.setattr(ws_proxy, "_service_call_stats", {"sent": 0, "coalesced": 0})
+    replies: list[dict] = []
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda _ws, msg: replies.append(msg))
+    held: list[dict] = []
+    fake_ha.handlers["call_service"] = held.append
+
+    session = ws_proxy._ClientSession(object(), max_inflight=8,
+                                      coalesce_services=["light.turn_on"])
+    target = {"entity_id": "light.kitchen"}
+
+    def brightness(value, **extra):
+        return {"type": "call_service", "domain": "light", "service": "turn_on",
+                "target": target, "data": {"brightness": value}, **extra}
+
+    await session.dispatch(brightness(10, id="b10"))
+    await _settle()
+    for value in (20, 30, 40):
+        await session.dispatch(brightness(value, id=f"b{value}"))
+    await _settle()
+    # 10 is in flight; 20 and 30 were replaced by 40 while queued
+    assert [m["service_data"]["brightness"] for m in held] == [10]
+    assert [r["id"] for r in replies if r.get("coalesced")] == ["b20", "b30"]
+
+    fake_ha.reply(held[0]["id"])
+    await _settle()
+    assert [m["service_data"]["brightness"] for m in held] == [10, 40]
+
+    # A toggle is not coalescable, and nothing queued before it may jump it
+    await session.dispatch({"type": "call_service", "domain": "light", "service": "toggle",
+                            "target": target})
+    await session.dispatch(brightness(50))
+    await session.dispatch(brightness(60, coalesce=False))
+    for _ in range(4):
+        fake_ha.reply(held[-1]["id"])
+        await _settle()
+    assert [m["service"] for m in held] == ["turn_on", "turn_on", "toggle", "turn_on", "turn_on"]
+    assert [m["service_data"].get("brightness") for m in held[3:]] == [50, 60]
+
+    stats = (await ws_proxy.get_ws_stats())["call_service"]
+    assert stats["sent"] == 5
+    assert stats["coalesced"] == 2
+    assert stats["burst_ms"]["samples"] >= 1
+    session.close()
+
+
+async def test_calls_with_different_data_keys_are_not_coalesced(fake_ha, monkeypatch):
+    await ws_proxy._ensure_ha_connection()
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda _ws, msg: None)
+    held: list[dict] = []
+    fake_ha.handlers["call_service"] = held.append
+
+    session = ws_proxy._ClientSession(object(), max_inflight=8,
+                                      coalesce_services=["light.turn_on"])
+
+    def turn_on(**data):
+        return {"type": "call_service", "domain": "light", "service": "turn_on",
+                "target": {"entity_id": "light.kitchen"}, "data": data}
+
+    await session.dispatch(turn_on(brightness=10))
+    await _settle()
+    await session.dispatch(turn_on(brightness=20))
+    await session.dispatch(turn_on(rgb_color=[255, 0, 0]))
+    await session.dispatch(turn_on(rgb_color=[0, 0, 255]))
+    for _ in range(3):
+        fake_ha.reply(held[-1]["id"])
+        await _settle()
+    # The color only replaced the color queued before it, never the brightness
+    assert [m["service_data"] for m in held] == [
+        {"brightness": 10}, {"brightness": 20}, {"rgb_color": [0, 0, 255]},
+    ]
+    session.close()
+
+
+async def test_calls_targeting_entities_through_data_use_separate_lanes(fake_ha, monkeypatch):
+    await ws_proxy._ensure_ha_connection()
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda _ws, msg: None)
+    held: list[dict] = []
+    fake_ha.handlers["call_service"] = held.append
+
+    session = ws_proxy._ClientSession(object(), max_inflight=8,
+                                      coalesce_services=["light.turn_on"])
+
+    def turn_on(entity_id):
+        return {"type": "call_service", "domain": "light", "service": "turn_on",
+                "data": {"entity_id": entity_id}}
+
+    await session.dispatch(turn_on("light.kitchen"))
+    await session.dispatch(turn_on("light.a"))
+    await session.dispatch(turn_on("light.b"))
+    await _settle()
+    # Each light has its own lane, so none replaces another
+    assert sorted(m["service_data"]["entity_id"] for m in held) == [
+        "light.a", "light.b", "light.kitchen",
+    ]
+    session.close()
+
+
+async def test_outage_serves_persisted_snapshot_as_stale(fake_ha, monkeypatch, tmp_path):
+    await ws_proxy._ensure_ha_connection()
+    ws_proxy._supervisor_task.cancel()
+    replies: list[dict] = []
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda _ws, msg: replies.append(msg))
+
+    await fake_ha.close()
+    await ws_proxy.ha_gateway.listen_task
+    for _ in range(100):  # written off the event loop
+        if ws_proxy._snapshots.writes:
+            break
+        await asyncio.sleep(0.01)
+    assert (tmp_path / "state_snapshot.json.gz").exists()
+
+    # A restarted process reads the same file
+    monkeypatch.setattr(ws_proxy, "_snapshots",
+                        StateSnapshotStore(lambda: tmp_path / "state_snapshot.json.gz"))
+    await ws_proxy._handle_get_states(object(), {"id": "s1"})
+    (reply,) = replies
+    assert reply["stale"] is True
+    assert reply["id"] == "s1"
+    assert "seq" not in reply
+    assert [s["entity_id"] for s in reply["result"]] == ["light.kitchen"]
+    assert "context" not in reply["result"][0]
+
+
+async def test_commands_fail_fast_while_ha_is_down(monkeypatch, tmp_path):
+    replies: list[dict] = []
+    monkeypatch.setattr(ws_proxy.ws_manager, "send", lambda _ws, msg: replies.append(msg))
+    monkeypatch.setattr(ws_proxy, "ha_gateway", SimpleNamespace(connected=False))
+    monkeypatch.setattr(ws_proxy, "_snapshots",
+                        StateSnapshotStore(lambda: tmp_path / "state_snapshot.json.gz"))
+
+    await ws_proxy._handle_call_service(object(), {"type": "call_service", "id": "c1"})
+    await ws_proxy._handle_call_service(object(), {"type": "call_service"})
+    await ws_proxy._handle_get_states(object(), {"type": "get_states", "id": "g1"})
+    await ws_proxy._handle_call_services(object(), {"type": "call_services", "id": "b1"})
+    assert [r["id"] for r in replies] == ["c1", "g1", "b1"]
+    for reply in replies:
+        assert reply["type"] == "result"
+        assert reply["success"] is False
+        assert reply["error"]["code"] == "not_connected"
@@ -0,0 +1,77 @@
+"""Tests for the tuned permessage-deflate protocol in ``app.ws.transport``."""
+import asyncio
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+
+import uvicorn
+import websockets
+
+from app.ws.transport import WIRE_EXTENSION, DeflateWebSocketProtocol
+
+
+async def test_deflate_negotiated_and_wire_bytes_counted():
+    payload = json.dumps([
+        {"entity_id": f"sensor.power_{i}", "state": "12.5",
+         "attributes": {"unit_of_measurement": "W", "friendly_name": f"Power {i}"}}
+        for i in range(500)
+    ])
+    counters = []
+
+    async def app(scope, receive, send):
+        counters.append(scope["extensions"][WIRE_EXTENSION])
+        await receive()
+        await send({"type": "websocket.accept"})
+        await send({"type": "websocket.send", "text": payload})
+        await receive()
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, ws=DeflateWebSocketProtocol,
+                            lifespan="off", log_level="warning")
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    try:
+        while not server.started:
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://127.0.0.1:{port}") as client:
+            assert await client.recv() == payload
+
+        (wire,) = counters
+        assert wire.deflate
+        assert wire.frames >= 1
+        assert 0 < wire.bytes_sent < len(payload) / 4
+    finally:
+        server.should_exit = True
+        await serving
+
+
+async def test_serve_entrypoint_starts_with_the_deflate_protocol(tmp_path):
+    """``python -m app.serve`` is what the Docker image and add-on run."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = {**os.environ, "DAS_HOME_DATA_DIR": str(tmp_path), "DAS_HOME_WS_DEFLATE": "true"}
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "app.serve", "--port", str(port),
+        cwd=Path(__file__).resolve().parent.parent, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        for _ in range(200):
+            assert proc.returncode is None, (await proc.stderr.read()).decode()
+            try:
+                client = await websockets.connect(f"ws://127.0.0.1:{port}/ws")
+                break
+            except OSError:
+                await asyncio.sleep(0.05)
+        else:
+            raise AssertionError("app.serve did not start listening")
+        async with client:
+            extensions = client.response.headers["Sec-WebSocket-Extensions"]
+        assert "permessage-deflate" in extensions
+        assert "server_max_window_bits=12" in extensions
+    finally:
+        proc.terminate()
+        await proc.wait()
@@ -12,4 +12,4 @@ fi
 mkdir -p "$DAS_HOME_DATA_DIR"
 
 bashio::log.info "Starting das-home on port ${DAS_HOME_PORT}..."
-exec python -m uvicorn app.main:app --host 0.0.0.0 --port ${DAS_HOME_PORT}
+exec python -m app.serve --host 0.0.0.0 --port ${DAS_HOME_PORT}
@@ -1,19 +1,33 @@
 import { useEffect, useRef, useCallback } from "react";
 import { useConnectionStore } from "@/stores/connectionStore";
 import { useEntityStore } from "@/stores/entityStore";
+import { useForecastStore } from "@/stores/forecastStore";
 import { apiUrl, wsUrl } from "@/utils/basePath";
-import type { EntityState } from "@/types";
+import type { EntityState, EntityStateDelta, StateBatchEvent } from "@/types";
+
+function requestForecasts(ws: WebSocket, entityIds: string[]) {
+  // The backend answers from its cache and keeps pushing updates to this socket
+  for (const entityId of entityIds) {
+    ws.send(JSON.stringify({ type: "weather_forecast", entity_id: entityId }));
+  }
+}
 
 export function useHomeAssistant() {
   const wsRef = useRef<WebSocket | null>(null);
   const reconnectTimer = useRef<ReturnType<typeof setTimeout> | undefined>(undefined);
   const reconnectDelay = useRef(1000);
+  // Resume point: the server's epoch and the last event seq we applied
+  const session = useRef<{ epoch: string | null; seq: number }>({ epoch: null, seq: 0 });
 
   const setStatus = useConnectionStore((s) => s.setStatus);
   const setEntity = useEntityStore((s) => s.setEntity);
+  const patchEntity = useEntityStore((s) => s.patchEntity);
+  const applyBatch = useEntityStore((s) => s.applyBatch);
   const setEntities = useEntityStore((s) => s.setEntities);
   const setAreas = useEntityStore((s) => s.setAreas);
   const setEntityAreaMap = useEntityStore((s) => s.setEntityAreaMap);
+  const setForecasts = useForecastStore((s) => s.setForecasts);
+  const updateForecast = useForecastStore((s) => s.updateForecast);
 
   const connect = useCallback(() => {
     if (wsRef.current?.readyState === WebSocket.OPEN) return;
@@ -24,8 +38,16 @@ export function useHomeAssistant() {
     ws.onopen = () => {
       setStatus("connected");
       reconnectDelay.current = 1000;
-      // Request all current states
-      ws.send(JSON.stringify({ type: "get_states" }));
+      // Receive only changed fields per update. After a drop, ask only for
+      // the events we missed; the server sends a full snapshot if it can't.
+      ws.send(JSON.stringify({ type: "set_options", delta_states: true }));
+      const { epoch, seq } = session.current;
+      if (epoch) {
+        ws.send(JSON.stringify({ type: "resume", epoch, last_seq: seq }));
+      } else {
+        ws.send(JSON.stringify({ type: "get_states" }));
+      }
+      requestForecasts(ws, Object.keys(useForecastStore.getState().watched));
       // Fetch entity-area mapping from discovery endpoint
       fetch(apiUrl("/api/discovery"))
         .then((r) => r.json())
@@ -38,12 +60,55 @@ export function useHomeAssistant() {
 
     ws.onmessage = (event) => {
       const msg = JSON.parse(event.data);
+      const track = (seq: unknown) => {
+        if (typeof seq === "number" && seq > session.current.seq) session.current.seq = seq;
+      };
+
+      // Answer server heartbeats so it can tell we're still here
+      if (msg.type === "heartbeat") {
+        ws.send(JSON.stringify({ type: "heartbeat_ack", n: msg.n }));
+        return;
+      }
 
-      if (msg.type === "state_changed" && msg.new_state) {
-        setEntity(msg.entity_id, msg.new_state as EntityState);
+      // A new epoch means the server restarted; our resume (if any) falls
+      // back to a full snapshot, so start counting from its seq.
+      if (msg.type === "connected" && typeof msg.epoch === "string" &&
+          msg.epoch !== session.current.epoch) {
+        session.current = { epoch: msg.epoch, seq: msg.seq ?? 0 };
+      }
+
+      if (msg.type === "state_changed") {
+        track(msg.seq);
+        if (msg.new_state) setEntity(msg.entity_id, msg.new_state as EntityState);
+      }
+
+      if (msg.type === "state_delta") {
+        track(msg.seq);
+        patchEntity(msg as EntityStateDelta);
+      }
+
+      if (msg.type === "states_batch" && Array.isArray(msg.events)) {
+        for (const e of msg.events) track(e.seq);
+        applyBatch(msg.events as StateBatchEvent[]);
+      }
+
+      // The backend reconnected to HA; refresh in case we connected while it
+      // was down and never received a snapshot.
+      if (msg.type === "ha_reconnected") {
+        ws.send(JSON.stringify({ type: "get_states" }));
+      }
+
+      if (msg.type === "weather_forecast_result" && msg.entity_id) {
+        setForecasts(msg.entity_id, msg.hourly || [], msg.daily || []);
+      }
+
+      if (msg.type === "weather_forecast_update" &&
+          (msg.forecast_type === "hourly" || msg.forecast_type === "daily")) {
+        updateForecast(msg.entity_id, msg.forecast_type, msg.forecast || []);
       }
 
       if (msg.type === "states_result" && Array.isArray(msg.result)) {
+        track(msg.seq);
         const map = new Map<string, EntityState>();
         for (const state of msg.result) {
           map.set(state.entity_id, state);
@@ -67,7 +132,8 @@ export function useHomeAssistant() {
     };
 
     wsRef.current = ws;
-  }, [setStatus, setEntity, setEntities, setAreas, setEntityAreaMap]);
+  }, [setStatus, setEntity, patchEntity, applyBatch, setEntities, setAreas, setEntityAreaMap,
+      setForecasts, updateForecast]);
 
   const callService = useCallback(
     (domain: string, service: string, data?: Record<string, unknown>, target?: Record<string, unknown>) => {
@@ -111,6 +177,15 @@ export function useHomeAssistant() {
     []
   );
 
+  // Forecast views mounted while the socket is open
+  useEffect(() => {
+    return useForecastStore.subscribe((state, prev) => {
+      const ws = wsRef.current;
+      if (ws?.readyState !== WebSocket.OPEN || state.watched === prev.watched) return;
+      requestForecasts(ws, Object.keys(state.watched).filter((id) => !(id in prev.watched)));
+    });
+  }, []);
+
   useEffect(() => {
     connect();
     return () => {
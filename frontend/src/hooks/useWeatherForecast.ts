@@ -1,19 +1,10 @@
 // frontend/src/hooks/useWeatherForecast.ts
-import { useEffect, useState, useMemo, useRef } from "react";
+import { useEffect, useMemo } from "react";
 import { useEntitiesByDomain } from "./useEntity";
-import { wsUrl } from "@/utils/basePath";
+import { useForecastStore } from "@/stores/forecastStore";
+import type { ForecastEntry } from "@/stores/forecastStore";
 
-export interface ForecastEntry {
-  datetime: string;
-  condition: string;
-  temperature: number;
-  templow?: number;
-  precipitation?: number;
-  precipitation_probability?: number;
-  wind_speed?: number;
-  wind_bearing?: number;
-  humidity?: number;
-}
+export type { ForecastEntry } from "@/stores/forecastStore";
 
 interface WeatherForecastResult {
   hourlyForecast: ForecastEntry[];
@@ -21,67 +12,37 @@ interface WeatherForecastResult {
   entityId: string;
 }
 
+const NO_ENTRIES: ForecastEntry[] = [];
+
 /**
- * Fetches weather forecast data via the backend WS proxy.
+ * Weather forecast data from the backend WS proxy.
  * HA 2024.3+ removed the forecast attribute from weather entities,
- * so we use the weather/subscribe_forecast WS command instead.
+ * so the backend holds shared weather/subscribe_forecast subscriptions:
+ * the first result comes from its cache, later forecasts are pushed as
+ * weather_forecast_update messages. Both arrive over the main socket of
+ * useHomeAssistant, which requests forecasts for every watched entity.
  */
 export function useWeatherForecast(): WeatherForecastResult {
   const weatherEntities = useEntitiesByDomain("weather");
   const entityId = weatherEntities[0]?.entity_id || "";
 
-  const [hourlyData, setHourlyData] = useState<ForecastEntry[]>([]);
-  const [dailyData, setDailyData] = useState<ForecastEntry[]>([]);
-  const fetched = useRef(false);
+  const watch = useForecastStore((s) => s.watch);
+  const unwatch = useForecastStore((s) => s.unwatch);
+  const forecasts = useForecastStore((s) => s.forecasts[entityId]);
 
   useEffect(() => {
     // Don't fetch until we have a real entity ID from the store
-    if (!entityId || fetched.current) return;
-
-    let cancelled = false;
-
-    function fetchForecast() {
-      const ws = new WebSocket(wsUrl("/ws"));
-      ws.onopen = () => {
-        ws.send(JSON.stringify({
-          type: "weather_forecast",
-          entity_id: entityId,
-          id: "forecast_req",
-        }));
-      };
-      ws.onmessage = (event) => {
-        const msg = JSON.parse(event.data);
-        if (msg.type === "weather_forecast_result" && !cancelled) {
-          const hourly = msg.hourly || [];
-          const daily = msg.daily || [];
-          setHourlyData(hourly);
-          setDailyData(daily);
-          // Only mark as fetched if we got actual data
-          if (hourly.length > 0 || daily.length > 0) {
-            fetched.current = true;
-          }
-          ws.close();
-        }
-      };
-      ws.onerror = () => ws.close();
-    }
-
-    fetchForecast();
-    // Re-fetch every 30 minutes
-    const interval = setInterval(() => {
-      fetched.current = false;
-      fetchForecast();
-    }, 30 * 60 * 1000);
-
-    return () => {
-      cancelled = true;
-      clearInterval(interval);
-    };
-  }, [entityId]);
+    if (!entityId) return;
+    watch(entityId);
+    return () => unwatch(entityId);
+  }, [entityId, watch, unwatch]);
 
   const result = useMemo(() => {
-    return { hourlyForecast: hourlyData, dailyForecast: dailyData };
-  }, [hourlyData, dailyData]);
+    return {
+      hourlyForecast: forecasts?.hourly ?? NO_ENTRIES,
+      dailyForecast: forecasts?.daily ?? NO_ENTRIES,
+    };
+  }, [forecasts]);
 
   return { ...result, entityId };
 }
@@ -0,0 +1,61 @@
+import { beforeEach, describe, expect, it } from "vitest";
+import { useEntityStore } from "@/stores/entityStore";
+import type { EntityState } from "@/types";
+
+function makeState(): EntityState {
+  return {
+    entity_id: "media_player.tv",
+    state: "playing",
+    attributes: { volume_level: 0.3, media_title: "A", source_list: ["HDMI 1"] },
+    last_changed: "2026-01-01T00:00:00+00:00",
+    last_updated: "2026-01-01T00:00:00+00:00",
+  };
+}
+
+describe("entityStore.patchEntity", () => {
+  beforeEach(() => {
+    useEntityStore.setState({ entities: new Map([["media_player.tv", makeState()]]) });
+  });
+
+  it("merges changed attributes and drops removed keys", () => {
+    useEntityStore.getState().patchEntity({
+      entity_id: "media_player.tv",
+      attributes: { volume_level: 0.5 },
+      removed: ["media_title"],
+      last_updated: "2026-01-01T00:01:00+00:00",
+    });
+
+    const state = useEntityStore.getState().entities.get("media_player.tv")!;
+    expect(state.state).toBe("playing");
+    expect(state.attributes).toEqual({ volume_level: 0.5, source_list: ["HDMI 1"] });
+    expect(state.last_changed).toBe("2026-01-01T00:00:00+00:00");
+    expect(state.last_updated).toBe("2026-01-01T00:01:00+00:00");
+  });
+
+  it("ignores deltas for unknown entities", () => {
+    const before = useEntityStore.getState().entities;
+    useEntityStore.getState().patchEntity({ entity_id: "light.unknown", state: "on" });
+    expect(useEntityStore.getState().entities).toBe(before);
+  });
+});
+
+describe("entityStore.applyBatch", () => {
+  beforeEach(() => {
+    useEntityStore.setState({ entities: new Map([["media_player.tv", makeState()]]) });
+  });
+
+  it("applies full states and deltas in one update", () => {
+    useEntityStore.getState().applyBatch([
+      { type: "state_delta", entity_id: "media_player.tv", state: "paused" },
+      {
+        type: "state_changed",
+        entity_id: "sensor.power",
+        new_state: { ...makeState(), entity_id: "sensor.power", state: "42", attributes: {} },
+      },
+    ]);
+
+    const entities = useEntityStore.getState().entities;
+    expect(entities.get("media_player.tv")!.state).toBe("paused");
+    expect(entities.get("sensor.power")!.state).toBe("42");
+  });
+});
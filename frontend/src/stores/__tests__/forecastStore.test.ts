@@ -0,0 +1,29 @@
+import { beforeEach, describe, expect, it } from "vitest";
+import { useForecastStore } from "@/stores/forecastStore";
+
+describe("forecastStore", () => {
+  beforeEach(() => {
+    useForecastStore.setState({ watched: {}, forecasts: {} });
+  });
+
+  it("counts watchers per entity", () => {
+    const { watch, unwatch } = useForecastStore.getState();
+    watch("weather.home");
+    watch("weather.home");
+    unwatch("weather.home");
+    expect(useForecastStore.getState().watched).toEqual({ "weather.home": 1 });
+    unwatch("weather.home");
+    expect(useForecastStore.getState().watched).toEqual({});
+  });
+
+  it("updates one forecast type and keeps the other", () => {
+    const entry = { datetime: "2026-01-01T00:00:00Z", condition: "sunny", temperature: 3 };
+    const { setForecasts, updateForecast } = useForecastStore.getState();
+    setForecasts("weather.home", [entry], [entry]);
+    updateForecast("weather.home", "hourly", []);
+    expect(useForecastStore.getState().forecasts["weather.home"]).toEqual({
+      hourly: [],
+      daily: [entry],
+    });
+  });
+});
@@ -1,5 +1,12 @@
 import { create } from "zustand";
-import type { EntityState, Area, Device, Floor } from "@/types";
+import type {
+  EntityState,
+  EntityStateDelta,
+  StateBatchEvent,
+  Area,
+  Device,
+  Floor,
+} from "@/types";
 
 interface EntityStore {
   entities: Map<string, EntityState>;
@@ -8,6 +15,8 @@ interface EntityStore {
   floors: Map<string, Floor>;
   entityAreaMap: Map<string, string>;
   setEntity: (entityId: string, state: EntityState) => void;
+  patchEntity: (delta: EntityStateDelta) => void;
+  applyBatch: (events: StateBatchEvent[]) => void;
   setEntities: (entities: Map<string, EntityState>) => void;
   setAreas: (areas: Area[]) => void;
   setDevices: (devices: Device[]) => void;
@@ -15,6 +24,18 @@ interface EntityStore {
   setEntityAreaMap: (map: Record<string, string>) => void;
 }
 
+function applyDelta(current: EntityState, delta: EntityStateDelta): EntityState {
+  const attributes = { ...current.attributes, ...delta.attributes };
+  for (const key of delta.removed ?? []) delete attributes[key];
+  return {
+    ...current,
+    state: delta.state ?? current.state,
+    last_changed: delta.last_changed ?? current.last_changed,
+    last_updated: delta.last_updated ?? current.last_updated,
+    attributes,
+  };
+}
+
 export const useEntityStore = create<EntityStore>((set) => ({
   entities: new Map(),
   areas: new Map(),
@@ -27,6 +48,29 @@ export const useEntityStore = create<EntityStore>((set) => ({
       next.set(entityId, state);
       return { entities: next };
     }),
+  patchEntity: (delta) =>
+    set((prev) => {
+      const current = prev.entities.get(delta.entity_id);
+      // Deltas only arrive after a full state was sent; if we somehow lack
+      // the base, wait for the next full resync instead of guessing.
+      if (!current) return prev;
+      const next = new Map(prev.entities);
+      next.set(delta.entity_id, applyDelta(current, delta));
+      return { entities: next };
+    }),
+  applyBatch: (events) =>
+    set((prev) => {
+      const next = new Map(prev.entities);
+      for (const event of events) {
+        if (event.type === "state_delta") {
+          const current = next.get(event.entity_id);
+          if (current) next.set(event.entity_id, applyDelta(current, event));
+        } else if (event.new_state) {
+          next.set(event.entity_id, event.new_state);
+        }
+      }
+      return { entities: next };
+    }),
   setEntities: (entities) => set({ entities }),
   setAreas: (areas) =>
     set({ areas: new Map(areas.map((a) => [a.area_id, a])) }),
@@ -0,0 +1,59 @@
+import { create } from "zustand";
+
+export interface ForecastEntry {
+  datetime: string;
+  condition: string;
+  temperature: number;
+  templow?: number;
+  precipitation?: number;
+  precipitation_probability?: number;
+  wind_speed?: number;
+  wind_bearing?: number;
+  humidity?: number;
+}
+
+export type ForecastType = "hourly" | "daily";
+
+interface Forecasts {
+  hourly: ForecastEntry[];
+  daily: ForecastEntry[];
+}
+
+interface ForecastStore {
+  /** Weather entities with a mounted forecast view -> number of views */
+  watched: Record<string, number>;
+  forecasts: Record<string, Forecasts>;
+  watch: (entityId: string) => void;
+  unwatch: (entityId: string) => void;
+  setForecasts: (entityId: string, hourly: ForecastEntry[], daily: ForecastEntry[]) => void;
+  updateForecast: (entityId: string, type: ForecastType, forecast: ForecastEntry[]) => void;
+}
+
+const NO_FORECASTS: Forecasts = { hourly: [], daily: [] };
+
+/**
+ * Forecasts pushed over the main `/ws` socket (see useHomeAssistant), which
+ * requests them for every watched weather entity.
+ */
+export const useForecastStore = create<ForecastStore>((set) => ({
+  watched: {},
+  forecasts: {},
+  watch: (entityId) =>
+    set((s) => ({ watched: { ...s.watched, [entityId]: (s.watched[entityId] ?? 0) + 1 } })),
+  unwatch: (entityId) =>
+    set((s) => {
+      const watched = { ...s.watched };
+      if ((watched[entityId] ?? 0) > 1) watched[entityId] -= 1;
+      else delete watched[entityId];
+      return { watched };
+    }),
+  setForecasts: (entityId, hourly, daily) =>
+    set((s) => ({ forecasts: { ...s.forecasts, [entityId]: { hourly, daily } } })),
+  updateForecast: (entityId, type, forecast) =>
+    set((s) => ({
+      forecasts: {
+        ...s.forecasts,
+        [entityId]: { ...(s.forecasts[entityId] ?? NO_FORECASTS), [type]: forecast },
+      },
+    })),
+}));
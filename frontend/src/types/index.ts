@@ -17,6 +17,36 @@ export interface HacsCardEntry {
   version: string;
 }
 
+export interface CoalesceRule {
+  domain: string;
+  device_class: string;
+  entity_id: string;
+  window_ms: number;
+}
+
+export interface AttributeProjection {
+  domain: string;
+  entity_id: string;
+  include: string[] | null;
+  exclude: string[];
+}
+
+export interface ProxyConfig {
+  send_queue_size: number;
+  slow_consumer_policy: "drop_oldest" | "coalesce" | "disconnect";
+  coalesce_rules: CoalesceRule[];
+  max_inflight_commands: number;
+  replay_buffer_size: number;
+  upstream_max_inflight: number;
+  upstream_command_timeout: number;
+  attribute_projection: AttributeProjection[];
+  heartbeat_interval: number;
+  heartbeat_timeout: number;
+  coalesce_services: string[];
+  snapshot_interval: number;
+  bulk_max_parallel: number;
+}
+
 export interface AppConfiguration {
   version: number;
   connection: ConnectionConfig;
@@ -24,6 +54,7 @@ export interface AppConfiguration {
   custom_js_enabled: boolean;
   hacs_cards: HacsCardEntry[];
   sidebar: SidebarConfig;
+  proxy?: ProxyConfig;
 }
 
 export interface CardItem {
@@ -102,6 +133,23 @@ export interface EntityState {
   last_updated: string;
 }
 
+/** Partial update sent by the backend proxy in delta_states mode. */
+export interface EntityStateDelta {
+  entity_id: string;
+  state?: string;
+  attributes?: Record<string, unknown>;
+  removed?: string[];
+  last_changed?: string;
+  last_updated?: string;
+  /** Broadcast sequence number, used to resume after a reconnect. */
+  seq?: number;
+}
+
+/** One entry of a coalesced `states_batch` frame. */
+export type StateBatchEvent =
+  | ({ type: "state_delta" } & EntityStateDelta)
+  | { type: "state_changed"; entity_id: string; new_state: EntityState | null; seq?: number };
+
 export interface Area {
   area_id: string;
   name: string;
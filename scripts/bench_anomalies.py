@@ -0,0 +1,84 @@
+"""Benchmark of the anomaly detection engines in ``app.services.insights``.
+
+Builds 1000 monitored power/energy sensors with 35 days of daily rows in the
+shape the insights daily store returns, runs ``detect_anomalies`` with the
+scalar engine and with the NumPy engine, checks both return the same
+anomalies and prints the timings for each baseline.
+
+Run from the backend directory (the NumPy engine needs ``pip install numpy``)::
+
+    cd backend && python ../scripts/bench_anomalies.py
+"""
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from app.services import insights  # noqa: E402
+
+ENTITIES = 1000
+DAYS = 35
+NOW = datetime(2026, 10, 18, 15, 30, tzinfo=timezone.utc)
+
+
+def _dataset() -> tuple[list[dict], dict[str, list[dict]]]:
+    rng = random.Random(42)
+    today = NOW.date()
+    monitored: list[dict] = []
+    stats: dict[str, list[dict]] = {}
+    for i in range(ENTITIES):
+        entity_id = f"sensor.power_{i}"
+        monitored.append({"entity_id": entity_id, "attributes": {
+            "device_class": "power", "friendly_name": f"Power {i}",
+        }})
+        typical = rng.uniform(0.5, 40.0)
+        rows = []
+        for back in range(DAYS, -1, -1):
+            if rng.random() < 0.03:
+                continue  # recorder gaps
+            value = typical * rng.uniform(0.8, 1.2)
+            if back == 0 and rng.random() < 0.05:
+                value *= rng.choice((0.2, 2.5, 4.0))
+            rows.append({"start": (today - timedelta(days=back)).isoformat(), "state": value})
+        stats[entity_id] = rows
+    return monitored, stats
+
+
+def _run(monitored, stats, engine: str, baseline: str) -> list[dict]:
+    numpy = insights.np
+    try:
+        if engine == "scalar":
+            insights.np = None
+        return insights.detect_anomalies(monitored, stats, now=NOW, baseline=baseline)
+    finally:
+        insights.np = numpy
+
+
+def main():
+    monitored, stats = _dataset()
+    engines = ["scalar"] + (["numpy"] if insights.np is not None else [])
+    if len(engines) == 1:
+        print("NumPy not installed; timing the scalar engine only\n")
+    print(f"{ENTITIES} entities x {DAYS + 1} days\n")
+    print(f"{'baseline':<10}{'anomalies':>10}" + "".join(f"{e + ' ms':>12}" for e in engines)
+          + (f"{'speedup':>10}" if len(engines) > 1 else ""))
+    for baseline in insights.BASELINES:
+        results = [_run(monitored, stats, e, baseline) for e in engines]
+        if any(r != results[0] for r in results[1:]):
+            raise SystemExit(f"engines disagree for baseline={baseline}")
+        timings = [
+            min(timeit.repeat(lambda e=e: _run(monitored, stats, e, baseline),
+                              number=3, repeat=5)) / 3 * 1000
+            for e in engines
+        ]
+        line = f"{baseline:<10}{len(results[0]):>10}" + "".join(f"{t:>12.1f}" for t in timings)
+        if len(timings) > 1:
+            line += f"{timings[0] / timings[-1]:>9.1f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Micro-benchmark of the JSON codecs in ``app.codec`` on proxy traffic.
+
+Shapes mirror what the proxy actually handles:
+
+- ``ha_event``: one ``subscribe_entities`` change frame from HA (decoded)
+- ``ha_storm``: the frame HA sends when it restarts and every entity
+  goes unavailable at once (decoded)
+- ``state_changed``: one broadcast to clients (encoded)
+- ``states_batch``: a coalesced batch of 50 events (encoded)
+- ``states_result``: the initial snapshot for a 1500-entity install (encoded)
+
+Run from the backend directory::
+
+    cd backend && python ../scripts/bench_json_codec.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from app import codec  # noqa: E402
+
+ENTITIES = 1500
+
+
+def _state(i: int) -> dict:
+    kind = ("sensor", "light", "climate", "binary_sensor")[i % 4]
+    attributes: dict = {"friendly_name": f"Wohnzimmer {kind} {i}"}
+    if kind == "sensor":
+        attributes |= {"unit_of_measurement": "W", "device_class": "power",
+                       "state_class": "measurement"}
+    elif kind == "light":
+        attributes |= {"brightness": 180, "color_mode": "color_temp", "color_temp_kelvin": 2700,
+                       "supported_color_modes": ["color_temp", "xy"], "rgb_color": [255, 167, 87],
+                       "xy_color": [0.526, 0.387], "min_color_temp_kelvin": 2000,
+                       "max_color_temp_kelvin": 6535, "supported_features": 40}
+    elif kind == "climate":
+        attributes |= {"hvac_modes": ["off", "heat", "auto"], "current_temperature": 21.5,
+                       "temperature": 22.0, "min_temp": 5, "max_temp": 30,
+                       "preset_modes": ["eco", "comfort", "boost"], "preset_mode": "comfort"}
+    return {
+        "entity_id": f"{kind}.device_{i}",
+        "state": "on" if kind != "sensor" else f"{i * 1.5:.1f}",
+        "attributes": attributes,
+        "last_changed": "2026-10-18T09:12:44.318256+00:00",
+        "last_updated": "2026-10-18T09:12:44.318256+00:00",
+        "context": {"id": "01JA3K8Z9QW0F6N2V7XGJ4T5BC", "parent_id": None, "user_id": None},
+    }
+
+
+STATES = [_state(i) for i in range(ENTITIES)]
+
+ENCODE = {
+    "state_changed": {"type": "state_changed", "entity_id": STATES[1]["entity_id"],
+                      "new_state": STATES[1], "seq": 1234},
+    "states_batch": {"type": "states_batch", "events": [
+        {"type": "state_changed", "entity_id": s["entity_id"], "new_state": s, "seq": n}
+        for n, s in enumerate(STATES[:50])
+    ]},
+    "states_result": {"type": "states_result", "success": True, "result": STATES, "seq": 1234},
+}
+
+DECODE = {
+    "ha_event": codec.StdlibCodec.dumps({"id": 3, "type": "event", "event": {"c": {
+        "sensor.device_0": {"+": {"s": "231.0", "lc": 1760778764.31}},
+    }}}),
+    "ha_storm": codec.StdlibCodec.dumps({"id": 3, "type": "event", "event": {"c": {
+        s["entity_id"]: {"+": {"s": "unavailable", "lc": 1760778764.31}} for s in STATES
+    }}}),
+}
+
+
+def _best(stmt, number: int) -> float:
+    """Best of five runs, in microseconds per call."""
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    backends = codec.available()
+    print(f"active codec: {codec.codec.name}; available: {', '.join(backends)}\n")
+    header = f"{'shape':<22}{'bytes':>10}" + "".join(f"{name + ' us':>14}" for name in backends)
+    if len(backends) > 1:
+        header += f"{'speedup':>10}"
+    print(header)
+
+    rows = [(f"encode {name}", obj, "dumps") for name, obj in ENCODE.items()]
+    rows += [(f"decode {name}", text, "loads") for name, text in DECODE.items()]
+    for label, payload, op in rows:
+        size = len(codec.StdlibCodec.dumps_bytes(payload) if op == "dumps" else payload.encode())
+        number = max(1, 2_000_000 // size)
+        timings = [_best(lambda b=backend: getattr(b, op)(payload), number)
+                   for backend in backends.values()]
+        line = f"{label:<22}{size:>10}" + "".join(f"{t:>14.1f}" for t in timings)
+        if len(timings) > 1:
+            line += f"{timings[0] / timings[-1]:>9.1f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()